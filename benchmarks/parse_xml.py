@@ -0,0 +1,87 @@
+"""
+Benchmarks parsing large nation and happenings responses.
+
+This compares ellis.ns.parse_xml (and the happenings parser) against
+building a full ElementTree and walking it, as Ellis used to, in both
+time and peak memory.
+
+Run with: python benchmarks/parse_xml.py
+"""
+
+import timeit
+import tracemalloc
+from xml.etree import ElementTree
+
+from ellis import ns
+
+
+def _old_parse_element(tree):
+    if len(tree) == 0:
+        return {tree.tag.lower(): tree.text}
+    new_dict = {}
+    for child in tree:
+        new_dict.update(_old_parse_element(child))
+    return {tree.tag.lower(): new_dict}
+
+
+def _old_parse_foundings(foundings_xml):
+    foundings = []
+    for founding in ElementTree.fromstring(foundings_xml)[0]:
+        text = founding[1].text
+        foundings.append({'name': text.split("@@")[1],
+                          'founding_region': text.split("%%")[1],
+                          'founded_at': founding[0].text})
+    return foundings
+
+
+def nation_xml(shards=2000, depth=3):
+    """ Builds a nation with many shards, some of them nested. """
+    parts = ['<NATION id="test"><NAME>Test</NAME><REGION>Test</REGION>']
+    for shard in range(shards):
+        inner = 'value {}'.format(shard)
+        for level in range(depth if shard % 10 == 0 else 0):
+            inner = '<LEVEL{0}>{1}</LEVEL{0}>'.format(level, inner)
+        parts.append('<SHARD{0}>{1}</SHARD{0}>'.format(shard, inner))
+    parts.append('</NATION>')
+    return ''.join(parts)
+
+
+def happenings_xml(events=5000):
+    """ Builds a founding happenings feed with many events. """
+    parts = ['<WORLD><HAPPENINGS>']
+    for event in range(events):
+        parts.append('<EVENT id="{0}"><TIMESTAMP>{0}</TIMESTAMP>'
+                     '<TEXT>@@nation_{0}@@ was founded in %%region_{0}%%.'
+                     '</TEXT></EVENT>'.format(event))
+    parts.append('</HAPPENINGS></WORLD>')
+    return ''.join(parts)
+
+
+def main(number=20):
+    """ Runs, and prints the results of, each benchmark. """
+    nation = nation_xml()
+    happenings = happenings_xml()
+    # pylint: disable=protected-access
+    benchmarks = {
+        'nation, tree walk': lambda: _old_parse_element(
+            ElementTree.fromstring(nation)),
+        'nation, parse_xml': lambda: ns.parse_xml(nation),
+        'nation, parse_xml (name, region)': lambda: ns.parse_xml(
+            nation, ('name', 'region')),
+        'happenings, tree walk': lambda: _old_parse_foundings(happenings),
+        'happenings, streaming': lambda: ns.NS._parse_foundings(happenings),
+    }
+    print("{} bytes of nation, {} bytes of happenings, best of {} runs"
+          .format(len(nation), len(happenings), number))
+    for (name, benchmark) in benchmarks.items():
+        best = min(timeit.repeat(benchmark, number=1, repeat=number))
+        tracemalloc.start()
+        benchmark()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{:<36} {:8.3f} ms {:8.0f} KiB peak".format(name, best * 1000,
+                                                          peak / 1024))
+
+
+if __name__ == "__main__":
+    main()
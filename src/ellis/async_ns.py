@@ -0,0 +1,421 @@
+"""
+This provides an asyncio NationStates interface for Ellis.
+
+It mirrors the blocking interface in ellis.ns, but many requests may be
+in flight at once without a thread for each of them. The rate limits
+are shared with the blocking interface.
+"""
+
+import io
+import ssl
+import time
+import asyncio
+import logging
+import collections
+import email.parser
+import urllib.error
+import urllib.parse
+from typing import Iterable, Optional
+
+from ellis import ns
+
+
+class AsyncLimiter:
+    """
+    An asyncio front for a Scheduler, which waits without blocking the
+    event loop.
+
+    Parameters
+    ----------
+    limiter : ns.Scheduler or ns.Limiter
+        The scheduler whose budget is used, by default it is the
+        scheduler shared with the blocking interface. A limiter is
+        given a scheduler of its own.
+    priority : int
+        The priority requests are made at, unless told otherwise.
+        Telegrams are always sent as TELEGRAM.
+
+    Attributes
+    ----------
+    scheduler : ns.Scheduler
+        The scheduler requests wait on.
+    limiter : ns.Limiter
+        The limiter the scheduler is in front of.
+    """
+
+    def __init__(self, limiter=None, priority: int = ns.INTERACTIVE):
+        if limiter is None:
+            limiter = ns.scheduler
+        elif not isinstance(limiter, ns.Scheduler):
+            limiter = ns.Scheduler(limiter)
+        self.scheduler = limiter
+        self.limiter = limiter.limiter
+        self.priority = priority
+
+    async def acquire(self, priority: Optional[int] = None,
+                      is_tg: bool = False):
+        """
+        Waits until a request may be made at priority.
+
+        Parameters
+        ----------
+        priority : int
+            The priority to wait at, by default the limiter's priority.
+        is_tg : bool
+            Whether or not the request is a telegram.
+        """
+        if priority is None:
+            priority = ns.TELEGRAM if is_tg else self.priority
+        with self.scheduler.waiting(priority):
+            wait = self.scheduler.poll(priority, is_tg)
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.scheduler.poll(priority, is_tg)
+
+    async def check(self):
+        """ Waits until a normal API request may be made. """
+        await self.acquire()
+
+    async def check_tg(self):
+        """ Waits until a telegram may be sent. """
+        await self.acquire(is_tg=True)
+
+
+class _Connection:
+    """
+    A single HTTP/1.1 connection over asyncio streams. Each read, and
+    the write of each request, gives up after timeout seconds, raising
+    asyncio.TimeoutError.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter, timeout: float = 30.0):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.last_used = time.monotonic()
+
+    async def _wait(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    async def request(self, host: str, path: str,
+                      headers: dict[str, str]) -> tuple[int, str, object,
+                                                        bytes, bool]:
+        """
+        Sends a GET request, and returns the status, reason, headers,
+        body and whether or not the server will close the connection.
+        """
+        lines = ['GET {} HTTP/1.1'.format(path),
+                 'Host: {}'.format(host),
+                 'Connection: keep-alive']
+        lines.extend('{}: {}'.format(*header) for header in headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await self._wait(self.writer.drain())
+
+        status_line = await self._wait(self.reader.readline())
+        if not status_line:
+            raise ConnectionResetError("Connection closed by NationStates")
+        status_parts = status_line.decode('latin-1').rstrip('\r\n')
+        version, status, reason = (status_parts.split(' ', 2) + [''])[:3]
+        header_lines = []
+        while True:
+            line = await self._wait(self.reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        response_headers = email.parser.BytesHeaderParser().parsebytes(
+            b''.join(header_lines))
+
+        will_close = ((response_headers.get('Connection', '').lower()
+                       == 'close') or version == 'HTTP/1.0')
+        if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif response_headers.get('Content-Length') is not None:
+            body = await self._wait(self.reader.readexactly(
+                int(response_headers['Content-Length'])))
+        else:
+            body = await self._wait(self.reader.read())
+            will_close = True
+        self.last_used = time.monotonic()
+        return int(status), reason, response_headers, body, will_close
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self._wait(self.reader.readline())
+                        ).split(b';')[0], 16)
+            if not size:
+                # Skip any trailers.
+                while (await self._wait(self.reader.readline())
+                       ) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._wait(self.reader.readexactly(size)))
+            await self._wait(self.reader.readexactly(2))
+
+    def close(self):
+        """ Closes the connection. """
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """
+    A pool of persistent HTTPS connections to NationStates, over
+    asyncio streams.
+
+    Parameters
+    ----------
+    host : str
+        The host every connection in the pool is made to.
+    size : int
+        The maximum number of idle connections kept open.
+    idle_timeout : float
+        How long, in seconds, an idle connection may sit in the pool
+        before it is thrown away instead of reused.
+    port : int
+        The port to connect to.
+    use_ssl : bool
+        Whether or not to connect over TLS.
+    timeout : float
+        How long, in seconds, to wait to connect, and for each read,
+        before giving up on a connection.
+
+    Attributes
+    ----------
+    handshakes : int
+        The number of new connections (and so TLS handshakes) made.
+    reuses : int
+        The number of requests sent over an already open connection.
+    reconnects : int
+        The number of requests retried because a pooled connection had
+        gone stale.
+
+    See Also
+    --------
+    ellis.ns.ConnectionPool : The blocking connection pool.
+    """
+
+    def __init__(self, host: str = "www.nationstates.net", size: int = 16,
+                 idle_timeout: float = 30.0, port: int = 443,
+                 use_ssl: bool = True, timeout: float = 30.0):
+        # pylint: disable=too-many-arguments
+        self.host = host
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.port = port
+        self.timeout = timeout
+        self.handshakes = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self._idle: collections.deque = collections.deque()
+        self._ssl = ssl.create_default_context() if use_ssl else None
+
+    async def _connect(self) -> _Connection:
+        self.handshakes += 1
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl),
+            self.timeout)
+        return _Connection(reader, writer, self.timeout)
+
+    async def _acquire(self) -> tuple[_Connection, bool]:
+        now = time.monotonic()
+        while self._idle:
+            connection = self._idle.pop()
+            if now - connection.last_used <= self.idle_timeout:
+                self.reuses += 1
+                return connection, True
+            connection.close()
+        return await self._connect(), False
+
+    def _release(self, connection: _Connection):
+        if len(self._idle) < self.size:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    async def request(self, url: str,
+                      headers: Optional[dict] = None) -> bytes:
+        """
+        Sends a GET request for url and returns the body.
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            If NationStates responds with an error status.
+        asyncio.TimeoutError
+            If NationStates took longer than timeout to connect, or to
+            send any part of the response. The connection is closed.
+
+        See Also
+        --------
+        ellis.ns.ConnectionPool.request : The blocking version.
+        """
+        split_url = urllib.parse.urlsplit(url)
+        path = split_url.path or '/'
+        if split_url.query:
+            path = '{}?{}'.format(path, split_url.query)
+        headers = dict(headers or {})
+
+        connection, reused = await self._acquire()
+        try:
+            response = await connection.request(self.host, path, headers)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            connection.close()
+            if not reused:
+                raise
+            self.reconnects += 1
+            connection = await self._connect()
+            try:
+                response = await connection.request(self.host, path, headers)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        status, reason, response_headers, body, will_close = response
+        if will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if status >= 400:
+            raise urllib.error.HTTPError(url, status, reason,
+                                         response_headers,  # type: ignore
+                                         io.BytesIO(body))
+        return body
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the pool's counters and how many connections idle. """
+        return {'handshakes': self.handshakes,
+                'reuses': self.reuses,
+                'reconnects': self.reconnects,
+                'idle': len(self._idle)}
+
+    def close(self):
+        """ Closes every idle connection in the pool. """
+        while self._idle:
+            self._idle.pop().close()
+
+
+class AsyncNS(ns._NSRequests):  # pylint: disable=protected-access
+    """
+    An asyncio version of ns.NS, every request method is a coroutine.
+
+    Parameters
+    ----------
+    limiter : AsyncLimiter
+        The NationStates API Limiter.
+    logger : logging.Logger
+        A logging object, By default it is the "NS" Logger.
+    pool : AsyncConnectionPool
+        The connections to send requests over, by default a new pool.
+
+    See Also
+    --------
+    ellis.ns.NS : The blocking NationStates Request Object
+    """
+
+    def __init__(self, limiter: AsyncLimiter,
+                 logger=logging.getLogger("NS"),
+                 pool: Optional[AsyncConnectionPool] = None):
+        self.limiter = limiter
+        self.log = logger
+        self.pool = pool if pool is not None else AsyncConnectionPool()
+        ns._check_config()  # pylint: disable=protected-access
+
+    async def _send_request(self, url):
+        """ Actually sends the request and returns the raw stuff. """
+        await self.limiter.check()
+        url = url.replace(" ", "_")
+        response = await self.pool.request(
+            url, {'User-Agent': ns._user_agent()})  # pylint: disable=W0212
+        return response.decode('utf-8')
+
+    async def get_nation_xml(self, nation_name: str,
+                             shards: Optional[Iterable[str]] = None) -> str:
+        """ Sends a Request to get the raw XML of a nation """
+        return await self._send_request(self._nation_url(nation_name,
+                                                         shards))
+
+    async def get_nation(self, nation_name: str,
+                         fields: Optional[Iterable[str]] = None,
+                         shards: Optional[Iterable[str]] = None) -> dict:
+        """ Returns a Dictionary-Like Object of a nation. """
+        nation_name = nation_name.replace(" ", "_")
+        return self._parse_nation(await self.get_nation_xml(nation_name,
+                                                            shards),
+                                  fields)
+
+    async def get_nation_and_recruitable(self, nation: str,
+                                         shards: Iterable[str],
+                                         region: Optional[str] = None
+                                         ) -> tuple[dict, bool]:
+        """ Returns the given shards of a nation, and whether or not it
+        is recruitable, from a single request. """
+        return self._parse_combined(
+            await self._send_request(self._combined_url(nation, list(shards),
+                                                        region)))
+
+    async def get_nation_recruitable(self, nation: str,
+                                     region: Optional[str] = None) -> bool:
+        """ Returns True if the nation is able to be sent a recruitment
+        TG, and False if it is not. """
+        response = await self._send_request(self._recruitable_url(nation,
+                                                                  region))
+        return self._parse_recruitable(response)
+
+    async def get_foundings(self,
+                            since_id: Optional[int] = None) -> list[dict]:
+        """ Returns a list of recent foundings from NationStates. """
+        return self._parse_foundings(
+            await self._send_request(self._foundings_url(since_id)))
+
+
+class AsyncNS_Telegram:  # pylint: disable=C0103,R0903
+    """
+    An asyncio version of ns.NS_Telegram.
+
+    Parameters
+    ----------
+    limiter : AsyncLimiter
+        The NationStates API Limiter.
+    tgid : str
+        The Telegram ID for the Telegram you wish to send.
+    tg_key : str
+        The Telegram Key for the Telegram you wish to send.
+    api_key : str
+        The Unique API Key to send a telegram.
+    pool : AsyncConnectionPool
+        The connections to send requests over, by default a new pool.
+
+    See Also
+    --------
+    ellis.ns.NS_Telegram : The blocking Telegram Object
+    """
+
+    ns_tg_url = ns.NS_Telegram.ns_tg_url
+
+    def __init__(self, limiter: AsyncLimiter, tgid, tg_key, api_key,
+                 pool: Optional[AsyncConnectionPool] = None):
+        # pylint: disable=too-many-arguments
+        self.ns_tg_url = self.ns_tg_url.format(client=api_key,
+                                               tgid=tgid,
+                                               key=tg_key)
+        self.limiter = limiter
+        self.pool = pool if pool is not None else AsyncConnectionPool(size=1)
+        ns._check_config()  # pylint: disable=protected-access
+
+    async def send_telegram(self, recipient):
+        """ Send a Recruitment Telegram to Recipient. """
+        recipient = recipient.replace(" ", "_")
+        await self._send_request('{}{}'.format(self.ns_tg_url, recipient))
+
+    async def _send_request(self, url):
+        """ Actually sends the request and returns the raw stuff. """
+        await self.limiter.check_tg()
+        url = url.replace(' ', "_")
+        response = await self.pool.request(
+            url, {'User-Agent': ns._user_agent()})  # pylint: disable=W0212
+        return response.decode('utf-8')
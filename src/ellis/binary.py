@@ -0,0 +1,170 @@
+"""
+This provides the binary encoding of the Ellis Protocol, the subset of
+MessagePack needed for JSON documents: nil, booleans, integers, floats,
+strings, binary, arrays and maps.
+
+Any MessagePack library may be used to read and write it.
+"""
+
+import struct
+from typing import Any
+
+
+class BinaryError(ValueError):
+    """ Raised when something can't be encoded or decoded. """
+
+
+_FLOAT = struct.Struct('>d')
+_UNSIGNED = ((0xff, 0xcc, '>B'), (0xffff, 0xcd, '>H'),
+             (0xffffffff, 0xce, '>I'), (0xffffffffffffffff, 0xcf, '>Q'))
+_SIGNED = ((-0x80, 0xd0, '>b'), (-0x8000, 0xd1, '>h'),
+           (-0x80000000, 0xd2, '>i'), (-0x8000000000000000, 0xd3, '>q'))
+
+
+def _length(out: bytearray, length: int, fix: int, fix_max: int,
+            codes: tuple[int, int, int]):
+    """ Writes the header of a str, bin, array or map of a length. """
+    if fix and length <= fix_max:
+        out.append(fix | length)
+    elif length <= 0xff and codes[0]:
+        out += struct.pack('>BB', codes[0], length)
+    elif length <= 0xffff:
+        out += struct.pack('>BH', codes[1], length)
+    elif length <= 0xffffffff:
+        out += struct.pack('>BI', codes[2], length)
+    else:
+        raise BinaryError("{} items is too long".format(length))
+
+
+def array_header(length: int) -> bytes:
+    """ Returns the header of an array, for items packed separately. """
+    out = bytearray()
+    _length(out, length, 0x90, 15, (0, 0xdc, 0xdd))
+    return bytes(out)
+
+
+def _pack(out: bytearray, obj: Any):
+    # pylint: disable=too-many-branches
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj <= 0x7f or -32 <= obj < 0:
+            out += struct.pack('>b' if obj < 0 else '>B', obj)
+            return
+        for (limit, code, layout) in (_UNSIGNED if obj >= 0 else _SIGNED):
+            if (obj <= limit) if obj >= 0 else (obj >= limit):
+                out.append(code)
+                out += struct.pack(layout, obj)
+                return
+        raise BinaryError("{} is too big".format(obj))
+    elif isinstance(obj, float):
+        out.append(0xcb)
+        out += _FLOAT.pack(obj)
+    elif isinstance(obj, str):
+        encoded = obj.encode('utf-8')
+        _length(out, len(encoded), 0xa0, 31, (0xd9, 0xda, 0xdb))
+        out += encoded
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        _length(out, len(obj), 0, 0, (0xc4, 0xc5, 0xc6))
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        _length(out, len(obj), 0x90, 15, (0, 0xdc, 0xdd))
+        for item in obj:
+            _pack(out, item)
+    elif isinstance(obj, dict):
+        _length(out, len(obj), 0x80, 15, (0, 0xde, 0xdf))
+        for (key, value) in obj.items():
+            _pack(out, key)
+            _pack(out, value)
+    else:
+        raise BinaryError("{} can't be encoded".format(type(obj).__name__))
+
+
+def packb(obj: Any) -> bytes:
+    """ Returns obj encoded. """
+    out = bytearray()
+    _pack(out, obj)
+    return bytes(out)
+
+
+# The layouts of the fixed size types, by their first byte.
+_FIXED = {0xca: struct.Struct('>f'), 0xcb: _FLOAT,
+          0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'),
+          0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+          0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'),
+          0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q')}
+# The layouts of the lengths of the sized types, by their first byte.
+_SIZED = {0xc4: ('bin', '>B'), 0xc5: ('bin', '>H'), 0xc6: ('bin', '>I'),
+          0xd9: ('str', '>B'), 0xda: ('str', '>H'), 0xdb: ('str', '>I'),
+          0xdc: ('array', '>H'), 0xdd: ('array', '>I'),
+          0xde: ('map', '>H'), 0xdf: ('map', '>I')}
+
+
+def _unpack(data: memoryview, offset: int) -> tuple[Any, int]:
+    # pylint: disable=too-many-return-statements,too-many-branches
+    code = data[offset]
+    offset += 1
+    if code <= 0x7f:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if code in _FIXED:
+        layout = _FIXED[code]
+        return layout.unpack_from(data, offset)[0], offset + layout.size
+    if code == 0xc0:
+        return None, offset
+    if code in (0xc2, 0xc3):
+        return code == 0xc3, offset
+    if 0xa0 <= code <= 0xbf:
+        kind, length = 'str', code & 0x1f
+    elif 0x90 <= code <= 0x9f:
+        kind, length = 'array', code & 0x0f
+    elif 0x80 <= code <= 0x8f:
+        kind, length = 'map', code & 0x0f
+    elif code in _SIZED:
+        kind, layout = _SIZED[code]
+        (length,) = struct.unpack_from(layout, data, offset)
+        offset += struct.calcsize(layout)
+    else:
+        raise BinaryError("0x{:02x} isn't supported".format(code))
+    if kind in ('str', 'bin'):
+        end = offset + length
+        if end > len(data):
+            raise BinaryError("Truncated")
+        if kind == 'str':
+            return str(data[offset:end], 'utf-8'), end
+        return data[offset:end].tobytes(), end
+    if kind == 'array':
+        items = []
+        for _ in range(length):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    mapping = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        mapping[key], offset = _unpack(data, offset)
+    return mapping, offset
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    Returns the object data encodes.
+
+    Raises
+    ------
+    BinaryError
+        If data isn't a single encoded object.
+    """
+    with memoryview(data) as view:
+        try:
+            obj, end = _unpack(view, 0)
+        except (IndexError, struct.error, UnicodeDecodeError) as ex:
+            raise BinaryError("Truncated or invalid: {}".format(ex)) from ex
+    if end != len(data):
+        raise BinaryError("{} bytes left over".format(len(data) - end))
+    return obj
@@ -0,0 +1,356 @@
+"""
+This provides the compiled form of Ellis's blacklist.
+
+Each root attribute of the blacklist names a nation field, and holds
+the ways it may match::
+
+    {"name": {"partial": ["puppet"], "exact": [], "prefix": ["zz"]},
+     "population": {"range": [null, 10]},
+     "rules": [{"all": [{"field": "region", "exact": ["the pacific"]},
+                        {"field": "motto", "regex": ["^$"]}]}]}
+
+partial, exact, prefix and suffix are lists of strings compared
+casefolded, regex is a list of case-insensitive regular expressions
+searched for in the field, and range is an inclusive [minimum, maximum]
+pair of numbers, where null leaves that end open. The rules attribute
+is a list of further rules, each either a field with the same ways to
+match, or all or any of a list of rules.
+
+As it always has, a root attribute's partial and exact lists are only
+checked if it has a partial list.
+"""
+
+import re
+from typing import Callable, Iterable, Optional
+
+
+class _Automaton:
+    """
+    An Aho-Corasick automaton, which finds whether any of a set of
+    substrings are in a string in a single pass over it.
+
+    Parameters
+    ----------
+    patterns : Iterable
+        The substrings to look for.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[bool] = [False]
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(False)
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._out[state] = True
+
+    def _link(self):
+        """ Builds the failure links, breadth first from the root. """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for (char, child) in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] or self._out[
+                    self._fail[child]]
+
+    def search(self, text: str) -> bool:
+        """ Returns True if any of the patterns are in text. """
+        if self._out[0]:
+            # The empty string is in everything.
+            return True
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                return True
+        return False
+
+
+class _View:  # pylint: disable=too-few-public-methods
+    """ A nation's fields, casefolded or as numbers, worked out once. """
+
+    __slots__ = ('nation', '_text', '_numbers')
+
+    def __init__(self, nation: dict):
+        self.nation = nation
+        self._text: dict[str, Optional[str]] = {}
+        self._numbers: dict[str, Optional[float]] = {}
+
+    def text(self, field: str) -> Optional[str]:
+        """
+        Returns the casefolded field, or None if it's missing or isn't a
+        string.
+        """
+        try:
+            return self._text[field]
+        except KeyError:
+            value = self.nation.get(field)
+            text = value.casefold() if isinstance(value, str) else None
+            self._text[field] = text
+            return text
+
+    def number(self, field: str) -> Optional[float]:
+        """ Returns the field as a number, or None if it isn't one. """
+        try:
+            return self._numbers[field]
+        except KeyError:
+            try:
+                number: Optional[float] = float(self.nation[field])
+            except (KeyError, TypeError, ValueError):
+                number = None
+            self._numbers[field] = number
+            return number
+
+
+class _Rule:  # pylint: disable=too-few-public-methods
+    """
+    A compiled rule.
+
+    Attributes
+    ----------
+    name : str
+        Where the rule came from in the blacklist.
+    test : Callable
+        Returns True if a nation, as a _View, matches the rule.
+    cost : int
+        Roughly how expensive test is, cheaper rules are run first.
+    field : str
+        The only field the rule looks at, or None if it looks at more.
+    hits : int
+        The number of nations the rule has matched.
+    """
+
+    __slots__ = ('name', 'test', 'cost', 'field', 'hits')
+
+    def __init__(self, name: str, test: Callable[[_View], bool], cost: int,
+                 field: Optional[str] = None):
+        self.name = name
+        self.test = test
+        self.cost = cost
+        self.field = field
+        self.hits = 0
+
+
+def _text_rule(name, field, cost, predicate) -> _Rule:
+    def test(view: _View) -> bool:
+        text = view.text(field)
+        return text is not None and predicate(text)
+    return _Rule(name, test, cost, field)
+
+
+def _field_rules(field: str, criteria: dict, name: str) -> list[_Rule]:
+    """
+    Compiles each way a field may match into its own rule.
+
+    Raises
+    ------
+    ValueError
+        If a way to match isn't one Ellis knows.
+    """
+    # pylint: disable=too-many-branches
+    rules = []
+    for (kind, patterns) in criteria.items():
+        rule_name = '{}.{}'.format(name, kind)
+        if kind in ('partial', 'exact', 'prefix', 'suffix'):
+            patterns = [pattern.casefold() for pattern in patterns]
+            if not patterns:
+                continue
+        if kind == 'partial':
+            rules.append(_text_rule(rule_name, field, 3,
+                                    _Automaton(patterns).search))
+        elif kind == 'exact':
+            rules.append(_text_rule(rule_name, field, 1,
+                                    frozenset(patterns).__contains__))
+        elif kind == 'prefix':
+            rules.append(_text_rule(rule_name, field, 2,
+                                    lambda text, p=tuple(patterns):
+                                    text.startswith(p)))
+        elif kind == 'suffix':
+            rules.append(_text_rule(rule_name, field, 2,
+                                    lambda text, p=tuple(patterns):
+                                    text.endswith(p)))
+        elif kind == 'regex':
+            if not patterns:
+                continue
+            try:
+                search = re.compile('|'.join('(?:{})'.format(pattern)
+                                             for pattern in patterns),
+                                    re.IGNORECASE).search
+            except re.error as ex:
+                raise ValueError("{} has a bad regex: {}".format(
+                    rule_name, ex)) from ex
+            rules.append(_text_rule(rule_name, field, 5,
+                                    lambda text, s=search:
+                                    s(text) is not None))
+        elif kind == 'range':
+            rules.append(_range_rule(rule_name, field, patterns))
+        elif kind != 'field':
+            raise ValueError("{} is not a kind of rule, in {}".format(
+                kind, name))
+    return rules
+
+
+def _range_rule(name: str, field: str, bounds) -> _Rule:
+    try:
+        minimum, maximum = bounds
+    except (TypeError, ValueError) as ex:
+        raise ValueError("{} must be a [minimum, maximum] pair".format(
+            name)) from ex
+    minimum = -float('inf') if minimum is None else float(minimum)
+    maximum = float('inf') if maximum is None else float(maximum)
+
+    def test(view: _View) -> bool:
+        number = view.number(field)
+        return number is not None and minimum <= number <= maximum
+    return _Rule(name, test, 2, field)
+
+
+def _compile(rule: dict, name: str) -> _Rule:
+    """ Compiles a rule from the rules list. """
+    if not isinstance(rule, dict):
+        raise ValueError("{} must be an object".format(name))
+    if 'field' in rule:
+        return _any(_field_rules(rule['field'], rule, name),
+                    name)
+    for combination in ('all', 'any'):
+        if combination in rule:
+            rules = [_compile(child, '{}.{}[{}]'.format(name, combination,
+                                                        index))
+                     for (index, child) in enumerate(rule[combination])]
+            if combination == 'all':
+                return _all(rules, name)
+            return _any(rules, name)
+    raise ValueError("{} needs a field, all or any".format(name))
+
+
+def _fields_of(rules: list[_Rule]) -> Optional[str]:
+    fields = {rule.field for rule in rules}
+    return fields.pop() if len(fields) == 1 else None
+
+
+def _all(rules: list[_Rule], name: str) -> _Rule:
+    rules = sorted(rules, key=lambda rule: rule.cost)
+    tests = [rule.test for rule in rules]
+    return _Rule(name, lambda view: all(test(view) for test in tests),
+                 sum(rule.cost for rule in rules), _fields_of(rules))
+
+
+def _any(rules: list[_Rule], name: str) -> _Rule:
+    rules = sorted(rules, key=lambda rule: rule.cost)
+    tests = [rule.test for rule in rules]
+    return _Rule(name, lambda view: any(test(view) for test in tests),
+                 sum(rule.cost for rule in rules), _fields_of(rules))
+
+
+def _referenced(rule, fields: set):
+    """ Adds every field a rule from the rules list looks at to fields. """
+    if isinstance(rule, dict):
+        if 'field' in rule:
+            fields.add(rule['field'])
+        for combination in ('all', 'any'):
+            for child in rule.get(combination, ()):
+                _referenced(child, fields)
+
+
+class Blacklist:
+    """
+    A blacklist, compiled once into rules that are run cheapest first,
+    and stop at the first that matches.
+
+    Parameters
+    ----------
+    blacklists : dict
+        The blacklist, as read from the blacklist file.
+
+    Attributes
+    ----------
+    fields : set
+        Every nation field the blacklist looks at.
+
+    Raises
+    ------
+    ValueError
+        If a rule can't be understood.
+
+    Notes
+    -----
+    A nation never matches a rule on a field it doesn't have. Hit counts
+    are kept without a lock, so may miss the odd hit between threads.
+    """
+
+    def __init__(self, blacklists: dict):
+        self.blacklists = blacklists
+        self.fields = set(blacklists).difference({'rules'})
+        rules: list[_Rule] = []
+        for (field, criteria) in blacklists.items():
+            if field == 'rules':
+                for (index, rule) in enumerate(criteria):
+                    rules.append(_compile(rule, 'rules[{}]'.format(index)))
+                    _referenced(rule, self.fields)
+                continue
+            if 'partial' not in criteria:
+                # Without partials, the partial and exact lists are ignored.
+                criteria = {kind: patterns
+                            for (kind, patterns) in criteria.items()
+                            if kind not in ('partial', 'exact')}
+            rules.extend(_field_rules(field, criteria, field))
+        self._rules = sorted(rules, key=lambda rule: rule.cost)
+
+    def matches(self, nation: dict) -> bool:
+        """ Returns True if the nation is blacklisted. """
+        view = _View(nation)
+        for rule in self._rules:
+            if rule.test(view):
+                rule.hits += 1
+                return True
+        return False
+
+    def filter(self, nations: Iterable[dict]) -> list[dict]:
+        """
+        Returns the nations that aren't blacklisted. Field values shared
+        between nations, such as their region, are only matched once by
+        each rule on that field.
+        """
+        verdicts: list[dict] = [{} for _ in self._rules]
+        kept = []
+        for nation in nations:
+            view = _View(nation)
+            for (seen, rule) in zip(verdicts, self._rules):
+                if rule.field is None or rule.field not in nation:
+                    blacklisted = rule.test(view)
+                else:
+                    value = nation[rule.field]
+                    try:
+                        blacklisted = seen[value]
+                    except KeyError:
+                        blacklisted = seen[value] = rule.test(view)
+                    except TypeError:
+                        # Repeated tags and nested shards can't be keys.
+                        blacklisted = rule.test(view)
+                if blacklisted:
+                    rule.hits += 1
+                    break
+            else:
+                kept.append(nation)
+        return kept
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the number of nations each rule has matched. """
+        return {rule.name: rule.hits for rule in self._rules}
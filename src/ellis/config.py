@@ -50,14 +50,29 @@ def remove_module_config(module_name: str):
     del Config[module_name]
 
 
+def load() -> dict:
+    """
+    Returns the contents of the Configuration File, without reading them
+    in.
+
+    Raises
+    ------
+    OSError
+        If the file can't be read.
+    ValueError
+        If the file isn't valid JSON.
+    """
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
 def read_in():
     """
     Reads in the Configruation File.
     """
     global Config
     try:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            Config = json.load(file)
+        Config = load()
     except (OSError, IOError):
         pass
 
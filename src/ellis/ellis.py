@@ -3,17 +3,24 @@ This module contains the core functionality
 of the Ellis Server and Protocol.
 """
 
+import os
 import json
+import math
+import collections
+import queue
 import socket
+import selectors
 import threading
 import time
+import concurrent.futures
 import urllib.error
 
 import logging
 
-from typing import Optional
+from typing import Optional, Union
 
-from ellis import config, ellis_modules, ns
+from ellis import (blacklist, config, ellis_modules, journal, leases, ns,
+                   pool, protocol, recruited, sqlite_pool)
 from ellis.tracecall import tracecall as logcall
 
 
@@ -23,6 +30,143 @@ RENTED_JSON_PATH = "./rented_nations"
 RECRUITED_JSON_PATH = "./recruited_nations"
 AVAILABLE_JSON_PATH = "./saved_nations"
 BLACKLIST_PATH = "./blacklist"
+WATERMARK_PATH = "./happenings_watermark"
+JOURNAL_PATH = "./ellis_state"
+DATABASE_PATH = "./ellis_state.db"
+RECRUITED_ARCHIVE_PATH = "./recruited_archive.jsonl.gz"
+
+# The nation shards always requested, on top of those the blacklist
+# filters on, and the fields that come from the founding happening.
+NATION_SHARDS = ('name', 'region')
+FOUNDING_FIELDS = ('founding_region', 'founded_at')
+
+# How long, in seconds, after its founding a nation may be handed out.
+MAX_NATION_AGE = 7 * 24 * 60 * 60
+
+# How many pipelined commands a client may have queued, before it isn't
+# read from until some are answered.
+MAX_PIPELINE = 64
+
+# The optional tuning settings in the Core config, and how each is read.
+SETTINGS = {'NS_Pool_Size': int, 'NS_Pool_Idle_Timeout': float,
+            'NS_Cache_Size': int, 'Pool_Max_Age': float,
+            'Journal_Sync_Interval': float, 'Journal_Compact_After': int,
+            'Server_Mode': str, 'Server_Workers': int,
+            'Reload_Interval': float, 'Lease_Time': float,
+            'Pull_Min_Interval': float, 'Pull_Max_Interval': float,
+            'Pull_Pool_Target': int, 'NS_Reserved_Telegram': int,
+            'NS_Reserved_Interactive': int}
+# Those of the settings that only take effect when the server starts.
+STARTUP_SETTINGS = ('Server_Mode', 'Server_Workers', 'NS_Pool_Size')
+
+
+class PullCadence:
+    """
+    Works out how long to wait between pulls of the founding happenings,
+    from how quickly nations are being founded.
+
+    Parameters
+    ----------
+    min_interval : float
+        The shortest time, in seconds, to wait between pulls.
+    max_interval : float
+        The longest time, in seconds, to wait between pulls.
+    target : float
+        The number of new foundings each pull should aim to find.
+    pool_target : int
+        Once this many nations are available, pulls back off to the
+        longest interval.
+    smoothing : float
+        How much weight, between 0 and 1, the newest pull has in the
+        estimated founding rate.
+
+    Attributes
+    ----------
+    rate : float
+        The estimated number of foundings per second.
+    interval : float
+        The current time, in seconds, to wait between pulls.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, min_interval: float = 10.0,
+                 max_interval: float = 300.0, target: float = 5.0,
+                 pool_target: int = 200, smoothing: float = 0.3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target
+        self.pool_target = pool_target
+        self.smoothing = smoothing
+        self.rate: Optional[float] = None
+        self.interval = min_interval
+        self._last_pull: Optional[float] = None
+
+    def observe(self, founded_at: list[float], available: int) -> float:
+        """
+        Updates the estimated founding rate after a pull.
+
+        Parameters
+        ----------
+        founded_at : list
+            The founding timestamps of the new nations the pull found.
+        available : int
+            How many nations are available after the pull.
+
+        Returns
+        -------
+        How long, in seconds, to wait before the next pull.
+        """
+        now = time.time()
+        if self._last_pull is not None:
+            elapsed = now - self._last_pull
+        elif founded_at:
+            # The first pull sees the whole feed, so use its span.
+            elapsed = now - min(founded_at)
+        else:
+            elapsed = 0
+        self._last_pull = now
+
+        if elapsed > 0:
+            sample = len(founded_at) / elapsed
+            if self.rate is None:
+                self.rate = sample
+            else:
+                self.rate = (self.smoothing * sample
+                             + (1 - self.smoothing) * self.rate)
+
+        if available >= self.pool_target or not self.rate:
+            self.interval = self.max_interval
+        else:
+            self.interval = min(max(self.target / self.rate,
+                                    self.min_interval),
+                                self.max_interval)
+        return self.interval
+
+    def stats(self) -> dict[str, Optional[float]]:
+        """ Returns the estimated founding rate, and current interval. """
+        return {'rate': self.rate, 'interval': self.interval}
+
+
+class _Client:  # pylint: disable=too-few-public-methods
+    """ A client connection being served by the event loop. """
+
+    def __init__(self, sock: socket.socket, address: tuple[str, int]):
+        self.sock = sock
+        self.address = address
+        self.decoder = protocol.Decoder()
+        self.commands: collections.deque = collections.deque()
+        self.outgoing = bytearray()
+        self.busy = False
+        self.ended = False
+        self.registered = False
+        self.deadline = math.inf
+        self.getting = False
+        # How many nations a waiting GET asked for, None if not a batch.
+        self.count: Optional[int] = None
+        # The fields asked for with FIELDS, and by the waiting GET.
+        self.fields: Optional[tuple[str, ...]] = None
+        self.get_fields: Optional[tuple[str, ...]] = None
 
 
 class EllisServer:
@@ -40,14 +184,27 @@ class EllisServer:
     ----------
     blacklists : dict
         The filter criteria for nations to be removed from the list.
-    available_nations : dict
-        The list of available nations to be given out to clients.
-    rented_nations : dict
-        The list of nations that are currently 'handed out' to other
-        clients.
-    recruited_nations : dict
-        The list of nations that we know have been 'recruited', or are
-        otherwise unavailable.
+    nations : pool.NationPool
+        Every nation Ellis is tracking, whether it is available to be
+        given out to clients, currently 'handed out' to a client, or
+        known to have been 'recruited' or otherwise unavailable.
+    leases : leases.Leases
+        The lease each rented nation is held under. A nation whose lease
+        runs out without being renewed or returned is reclaimed.
+    encoded : protocol.EncodeCache
+        The encoded forms of the nations recently handed out.
+    watermark : int
+        The ID of the newest founding happening pulled, or None.
+    reload_interval : float
+        How often, in seconds, the blacklist and config files are checked
+        for changes.
+    nation_ready : threading.Condition
+        Notified, under ns.lock, whenever a nation is made available.
+    mode : str
+        How clients are served, either 'threads' for a thread for each
+        client, or 'selector' for a single event loop.
+    workers : int
+        The number of threads running commands in 'selector' mode.
     log : logging.Logger
         The ellis Logger.
     """
@@ -55,10 +212,6 @@ class EllisServer:
     # pylint: disable=too-many-instance-attributes
     # The amount of attributes is what is required.
 
-    blacklists: dict = {}
-    available_nations: list[dict] = []
-    rented_nations: list[dict] = []
-    recruited_nations: list[dict] = []
     log = logging.getLogger("Ellis")
     Threads: list[threading.Thread] = []
 
@@ -66,7 +219,22 @@ class EllisServer:
         self.hostname = hostname
         self.port = port
         self.running = False
-        self.ns = ns.NS(ns.limit, self.log)  # pylint: disable=invalid-name
+        self.nations = pool.NationPool(max_age=MAX_NATION_AGE)
+        self.journal: Optional[journal.Journal] = None
+        self.leases = leases.Leases()
+        self.encoded = protocol.EncodeCache()
+        self.blacklists = {}
+        self.watermark: Optional[int] = None
+        self.cadence = PullCadence()
+        self.mode = 'threads'
+        self.workers = 8
+        self.reload_interval = 5.0
+        self._mtimes: dict[str, Optional[tuple[int, int]]] = {}
+        self._wakeup = threading.Event()
+        self.nation_ready = threading.Condition(ns.lock)
+        self._on_available: list = []
+        self._waiters: collections.deque = collections.deque()
+        self.ns = ns.NS(ns.scheduler, self.log)  # pylint: disable=C0103
         ellis_modules._Ellis_Registry._add_Ellis(self)
 
     @logcall()
@@ -78,23 +246,311 @@ class EllisServer:
         # The access is perfectly acceptable as it is an internal
         # API for Ellis to use within itself.
 
-        self.available_nations = self._read_in(AVAILABLE_JSON_PATH)
-        self.recruited_nations = self._read_in(RECRUITED_JSON_PATH)
-        self.rented_nations = self._read_in(RENTED_JSON_PATH)
-        self.blacklists = self._read_in(BLACKLIST_PATH)
+        self._mtimes = {path: self._mtime(path)
+                        for path in (BLACKLIST_PATH, config.CONFIG_PATH)}
         config.read_in()
+        self._open_nations()
+        self.blacklists = self._read_in(BLACKLIST_PATH) or {}
+        self.watermark = self._read_watermark()
+        self._apply_config()
+        self._lease_rented()
+        self._wakeup.clear()
         self.running = True
         ellis_modules._Ellis_Registry.start()
 
+    def _open_nations(self):
+        """
+        Opens the nation pool in the Core/State_Backend, either 'memory'
+        for an in-memory pool kept in a journal, or 'sqlite' for a
+        database at Core/State_Database.
+
+        The memory backend archives recruited nations at
+        Core/Recruited_Archive, rotated every Core/Recruited_Archive_Size
+        bytes.
+        """
+        core = config.Config['Core']
+        max_age = self.nations.max_age
+        archive = recruited.RecruitedArchive(
+            core.get('Recruited_Archive', RECRUITED_ARCHIVE_PATH),
+            int(core.get('Recruited_Archive_Size', 64 * 1024 * 1024)))
+        if core.get('State_Backend', 'memory') == 'sqlite':
+            self.journal = None
+            self.nations = sqlite_pool.SQLitePool(
+                core.get('State_Database', DATABASE_PATH), max_age)
+            if not len(self.nations):  # pylint: disable=C1802
+                # Carry over the nations from the memory backend, which
+                # only has the records of recruited nations archived.
+                saved_journal = journal.Journal(JOURNAL_PATH, logger=self.log)
+                saved = self._load_saved_nations(saved_journal, archive)
+                saved_journal.close()
+                with self.nations.batch():
+                    self.nations.extend(self._read_in(RECRUITED_JSON_PATH),
+                                        pool.RECRUITED)
+                    self.nations.extend(archive.read(), pool.RECRUITED)
+                    for state in (pool.RENTED, pool.AVAILABLE):
+                        self.nations.extend(saved.nations(state), state)
+            return
+        # Opened now, so the archive is measured before ns.lock is held
+        # around it.
+        archive.open()
+        self.journal = journal.Journal(JOURNAL_PATH, logger=self.log)
+        self.nations = self._load_saved_nations(self.journal, archive)
+        self.nations.max_age = max_age
+        if (self.nations.archive is not None
+                or (not self.journal.records and not self.journal.generation)):
+            # Snapshot the nations loaded from before there was an index
+            # of recruited nations, now their records are archived.
+            self._compact()
+        self.nations.journal = self.journal
+        self.nations.archive = archive
+
+    def _lease_rented(self):
+        """ Leases out afresh the nations rented before a restart. """
+        with ns.lock:
+            self.leases = leases.Leases(self.leases.duration)
+            for nation in self.nations.nations(pool.RENTED):
+                self.leases.grant(self.nations.key(nation))
+
+    def _load_saved_nations(self, saved: journal.Journal,
+                            archive: Optional[recruited.RecruitedArchive]
+                            = None) -> pool.NationPool:
+        """
+        Loads the nations from the journal, or the old JSON files. Those
+        recruited before there was an archive are archived, and the
+        archive is left attached to the pool if there were any.
+        """
+        nations = pool.NationPool()
+        if not saved.load(nations, archive):
+            # Carry over the nations saved before there was a journal.
+            nations = pool.NationPool()
+            nations.archive = archive
+            for (state, path) in ((pool.RECRUITED, RECRUITED_JSON_PATH),
+                                  (pool.RENTED, RENTED_JSON_PATH),
+                                  (pool.AVAILABLE, AVAILABLE_JSON_PATH)):
+                nations.extend(self._read_in(path), state)
+        return nations
+
+    @staticmethod
+    def _read_settings(core: dict) -> dict:
+        """
+        Returns the tuning settings given in a Core config, each read as
+        the type it should be.
+
+        Raises
+        ------
+        TypeError, ValueError
+            If a setting can't be read as its type.
+        """
+        return {name: kind(core[name]) for (name, kind) in SETTINGS.items()
+                if core.get(name) is not None}
+
+    def _apply_config(self, settings: Optional[dict] = None,
+                      reloading: bool = False):
+        """
+        Applies the optional tuning settings.
+
+        Parameters
+        ----------
+        settings : dict
+            The settings, as _read_settings returns them, by default
+            those in the Core config.
+        reloading : bool
+            Whether the server is already running, in which case the
+            settings only read at startup are left as they are.
+        """
+        if settings is None:
+            settings = self._read_settings(config.Config['Core'])
+        connections = ns.connections
+        if reloading:
+            current = {'Server_Mode': self.mode,
+                       'Server_Workers': self.workers,
+                       'NS_Pool_Size': connections.size}
+            for name in STARTUP_SETTINGS:
+                if settings.get(name, current[name]) != current[name]:
+                    self.log.warning("%s only changes on a restart", name)
+                settings[name] = current[name]
+        connections.size = settings.get('NS_Pool_Size', connections.size)
+        connections.idle_timeout = settings.get('NS_Pool_Idle_Timeout',
+                                                connections.idle_timeout)
+        ns.lookups.size = settings.get('NS_Cache_Size', ns.lookups.size)
+        if 'Pool_Max_Age' in settings:
+            self.nations.max_age = settings['Pool_Max_Age']
+        if self.journal is not None:
+            self.journal.sync_interval = settings.get(
+                'Journal_Sync_Interval', self.journal.sync_interval)
+            self.journal.compact_after = settings.get(
+                'Journal_Compact_After', self.journal.compact_after)
+        self.mode = settings.get('Server_Mode', self.mode)
+        self.workers = settings.get('Server_Workers', self.workers)
+        self.reload_interval = settings.get('Reload_Interval',
+                                            self.reload_interval)
+        self.leases.duration = settings.get('Lease_Time',
+                                            self.leases.duration)
+        cadence = self.cadence
+        cadence.min_interval = settings.get('Pull_Min_Interval',
+                                            cadence.min_interval)
+        cadence.max_interval = settings.get('Pull_Max_Interval',
+                                            cadence.max_interval)
+        cadence.pool_target = settings.get('Pull_Pool_Target',
+                                           cadence.pool_target)
+        reserved = ns.scheduler.reserved
+        reserved[ns.TELEGRAM] = settings.get('NS_Reserved_Telegram',
+                                             reserved[ns.TELEGRAM])
+        reserved[ns.INTERACTIVE] = settings.get('NS_Reserved_Interactive',
+                                                reserved[ns.INTERACTIVE])
+
     @logcall()
     def pull_nations(self):
         """ Pulls Nations from NationStates to autopopulate the Queue. """
+        with ns.scheduler.priority(ns.BACKGROUND):
+            while self.running:
+                self.log.debug("Sending Request to NS")
+                new_nations = self._get_recruitable()
+                founded_at = [float(nation['founded_at'])
+                              for nation in new_nations
+                              if nation.get('founded_at')]
+                new_nations = self.filter_nations(new_nations)
+                with ns.lock, self.nations.batch():
+                    if self.nations.extend(new_nations):
+                        self._nations_available()
+                    expired = self.nations.expire()
+                    available = self.nations.count(pool.AVAILABLE)
+                if expired:
+                    self.log.info("%d nations expired", len(expired))
+                interval = self.cadence.observe(founded_at, available)
+                self.log.info("Foundings per hour: %.1f, next pull in %.0fs",
+                              (self.cadence.rate or 0) * 3600, interval)
+                self._wakeup.wait(interval)
+
+    def watch_files(self):
+        """
+        Reloads the blacklist and config whenever their files change,
+        checking every reload_interval seconds. It also reclaims the
+        nations whose leases have run out, syncs and compacts the
+        journal, and flushes the recruited archive.
+        """
         while self.running:
-            self.log.debug("Sending Request to NS")
-            new_nations = self._get_recruitable()
-            new_nations = self.filter_nations(new_nations)
-            self.available_nations.extend(new_nations)
-        self.available_nations = list(set(self.available_nations))
+            self._wakeup.wait(self.reload_interval)
+            try:
+                if self.running:
+                    self.reload()
+                    self.reclaim_nations()
+                if self.running and self.journal is not None:
+                    self.journal.sync()
+                    if self.nations.archive is not None:
+                        with ns.lock:
+                            self.nations.archive.flush()
+                    if self.journal.needs_compaction():
+                        self._compact()
+            except Exception as ex:  # pylint: disable=broad-except
+                # Whatever went wrong, the next round may go better.
+                self.log.error(ex, exc_info=True)
+
+    def reclaim_nations(self, now: Optional[float] = None) -> list[dict]:
+        """
+        Makes the rented nations whose leases have run out available
+        again, in one batch.
+
+        They aren't checked with NationStates here, only against the
+        blacklist, as every nation is checked afresh when it is next
+        handed out.
+
+        Parameters
+        ----------
+        now : float
+            The current time, by default time.monotonic().
+
+        Returns
+        -------
+        The nations made available again.
+        """
+        with ns.lock:
+            keys = self.leases.expired(now)
+            if not keys:
+                return []
+            reclaimed = []
+            with self.nations.batch():
+                for key in keys:
+                    if (key not in self.nations
+                            or self.nations.state(key) != pool.RENTED):
+                        continue
+                    nation = self.nations.get(key)
+                    if self.filter_nation(nation):
+                        self.nations.move(key, pool.RECRUITED, pool.RENTED)
+                    else:
+                        self.nations.release(key)
+                        reclaimed.append(nation)
+                self.nations.expire()
+            if reclaimed:
+                self._nations_available()
+        for nation in reclaimed:
+            # Its client may have telegrammed it before going away.
+            self.ns.cache.invalidate(nation['name'])
+        self.log.info("Reclaimed %d of %d expired leases", len(reclaimed),
+                      len(keys))
+        return reclaimed
+
+    def _compact(self):
+        """ Snapshots the nation pool, and drops the journal before it. """
+        with ns.lock:
+            generation = self.journal.rotate()
+            snapshot = {state: [dict(nation)
+                                for nation in self.nations.nations(state)]
+                        for state in (pool.AVAILABLE, pool.RENTED)}
+            index = self.nations.recruited.copy()
+        self.journal.compact(snapshot, generation, index)
+
+    def reload(self):
+        """ Reloads whichever of the blacklist and config have changed. """
+        changed = []
+        for path in (BLACKLIST_PATH, config.CONFIG_PATH):
+            mtime = self._mtime(path)
+            if mtime != self._mtimes.get(path):
+                self._mtimes[path] = mtime
+                changed.append(path)
+        if BLACKLIST_PATH in changed:
+            self._reload_blacklist()
+        if config.CONFIG_PATH in changed:
+            self.log.info("Reloading the config")
+            # The config is only swapped in once all of it has been read.
+            try:
+                new_config = config.load()
+                settings = self._read_settings(new_config['Core'])
+            except (OSError, KeyError, TypeError, ValueError) as ex:
+                self.log.error("Not reloading the config: %s", ex)
+            else:
+                config.Config = new_config
+                self._apply_config(settings, reloading=True)
+
+    def _reload_blacklist(self):
+        """
+        Swaps in the blacklist from the blacklist file, and drops every
+        available nation it filters.
+        """
+        self.log.info("Reloading the blacklist")
+        try:
+            compiled = blacklist.Blacklist(self._read_in(BLACKLIST_PATH)
+                                           or {})
+        except (ValueError, AttributeError, TypeError) as ex:
+            self.log.error("Not reloading the blacklist: %s", ex)
+            return
+        self._blacklist = compiled
+        with ns.lock:
+            available = self.nations.nations(pool.AVAILABLE)
+        kept = {id(nation) for nation in compiled.filter(available)}
+        filtered = [nation for nation in available if id(nation) not in kept]
+        with ns.lock:
+            dropped = self.nations.drop(filtered)
+        self.log.info("%d available nations are now filtered", len(dropped))
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[tuple[int, int]]:
+        """ Returns when a file was modified and its size, if it exists. """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
     @logcall()
     def filter_nations(self, nations: list[dict]) -> list[dict]:
@@ -110,7 +566,7 @@ class EllisServer:
         -------
         A list of nations that is without the filterd names.
         """
-        return [x for x in nations if not self.filter_nation(x)]
+        return self._blacklist.filter(nations)
 
     @logcall()
     def filter_nation(self, nation: dict) -> bool:
@@ -126,18 +582,20 @@ class EllisServer:
         -------
         True if the nation should be filtered, or False if not.
         """
-        for field in self.blacklists:
-            try:
-                for partial in self.blacklists[field]['partial']:
-                    if partial.casefold() in nation[field].casefold():
-                        return True
-                for exact in self.blacklists[field]['exact']:
-                    if exact.casefold() == nation[field].casefold():
-                        return True
-            except KeyError:
-                self.log.debug("%s is not an attribute we can access!", field)
-                continue
-        return False
+        return self._blacklist.matches(nation)
+
+    def blacklist_stats(self) -> dict[str, int]:
+        """ Returns the number of nations each blacklist rule has caught. """
+        return self._blacklist.stats()
+
+    @property
+    def blacklists(self) -> dict:
+        """ The filter criteria, which are compiled when they are set. """
+        return self._blacklist.blacklists
+
+    @blacklists.setter
+    def blacklists(self, blacklists: dict):
+        self._blacklist = blacklist.Blacklist(blacklists)
 
     @logcall()
     def run(self):
@@ -149,22 +607,27 @@ class EllisServer:
             server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             server.bind((self.hostname, self.port))
             self.log.debug("Listening...")
-            server.listen(5)
+            server.listen(socket.SOMAXCONN)
             self.log.info("Starting Pulling...")
             self.Threads.append(threading.Thread(target=self.pull_nations))
             self.Threads[-1].start()
+            self.Threads.append(threading.Thread(target=self.watch_files))
+            self.Threads[-1].start()
             self.log.info("Starting Client Modules...")
 
             self.log.debug("Entering Main Loop...")
+            if self.mode == 'selector':
+                self._serve_selector(server)
             while self.running:
                 self.log.info("Waiting for Client...")
                 client, address = server.accept()
                 self.log.debug("Client accepted!")
+                self.Threads = [thread for thread in self.Threads
+                                if thread.is_alive()]
                 self.Threads.append(threading.Thread(target=self.handle_client,
                                                      args=[client, address]))
                 self.log.debug("Client Running!")
                 self.Threads[-1].start()
-                time.sleep(10)
 
             self.log.info("Goodbye!!!")
         finally:
@@ -179,22 +642,33 @@ class EllisServer:
                 # It's merely cleanup code.
                 pass
 
+    def _nation_shards(self) -> list[str]:
+        """ Returns the nation shards Ellis needs to filter nations. """
+        shards = set(NATION_SHARDS).union(self._blacklist.fields)
+        return sorted(shards.difference(FOUNDING_FIELDS))
+
     def _check_nation(self, nation_name: str) -> bool:
         """ Checks to see if a nation is recruitable. """
-        with ns.lock:
-            return self.ns.get_nation_recruitable(nation_name)
+        return self.ns.get_nation_recruitable(nation_name)
 
     @logcall()
     def _get_recruitable(self) -> list[dict]:
-        """ Gets the most recently recruitable nations. """
+        """ Gets the nations founded since the last time this was called. """
+        _foundings = self.ns.get_foundings(since_id=self.watermark)
+        # Drop the foundings already handled before enriching any.
         with ns.lock:
-            _foundings = self.ns.get_foundings()
+            seen = self.nations.known(founding['name']
+                                      for founding in _foundings)
         foundings = []
         for founding in _foundings:
+            name = ns.normalize_name(founding['name'])
+            if name in seen:
+                continue
+            seen.add(name)
             try:
-                with ns.lock:
-                    nation_info = self.ns.get_nation(founding['name'])
-                    founding.update(nation_info)
+                nation_info = self.ns.get_nation(founding['name'],
+                                                 shards=self._nation_shards())
+                founding.update(nation_info)
                 foundings.append(founding)
             except urllib.error.HTTPError as ex:
                 self.log.error(ex, exc_info=True)
@@ -203,34 +677,173 @@ class EllisServer:
                 else:
                     raise
 
+        event_ids = [founding['event_id'] for founding in _foundings
+                     if 'event_id' in founding]
+        if event_ids and max(event_ids) > (self.watermark or 0):
+            self.watermark = max(event_ids)
+            self._write_watermark()
         return foundings
 
+    def _nations_available(self):
+        """ Wakes anything waiting for a nation, called under ns.lock. """
+        self.nation_ready.notify_all()
+        for callback in self._on_available:
+            callback()
+
+    def _take_nations(self, count: int = 1,
+                      timeout: Optional[float] = None) -> list[dict]:
+        """
+        Takes up to count nations out of the available pool, waiting for
+        one if need be. Waiting clients are given nations in the order
+        they started waiting.
+
+        Parameters
+        ----------
+        count : int
+            The most nations to take.
+        timeout : float
+            How long, in seconds, to wait. By default it waits until a
+            nation is available or the server stops.
+
+        Returns
+        -------
+        The nations, none if none became available in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self.nation_ready:
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if self._waiters[0] is ticket:
+                        # Stale nations are dropped rather than handed out.
+                        self.nations.expire()
+                        if self.nations.count(pool.AVAILABLE):
+                            break
+                    if not self.running:
+                        return []
+                    if deadline is None:
+                        self.nation_ready.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return []
+                        self.nation_ready.wait(remaining)
+                taken = []
+                with self.nations.batch():
+                    for _ in range(min(count,
+                                       self.nations.count(pool.AVAILABLE))):
+                        nation = self.nations.checkout()
+                        self.leases.grant(self.nations.key(nation))
+                        taken.append(nation)
+                return taken
+            finally:
+                self._waiters.remove(ticket)
+                # Let the next waiter in line see if it's their turn.
+                self.nation_ready.notify_all()
+
     @logcall()
-    def _checkout_nation(self) -> Optional[dict]:
-        with ns.lock:
+    def _checkout_nations(self, count: int = 1,
+                          timeout: Optional[float] = 0) -> list[dict]:
+        """
+        Checks out up to count nations, and returns those that are still
+        recruitable, the rest are recruited.
+        """
+        # The nations are refreshed outside of the lock, so a request
+        # waiting on the limiter doesn't stall every other thread.
+        refreshed = []
+        for nation in self._take_nations(count, timeout):
             try:
-                nation = self.available_nations.pop()
-                nation_info = self.ns.get_nation(nation['name'])
-                nation.update(nation_info)
-                if self.filter_nation(nation):
-                    self.recruited_nations.append(nation)
-                    return None
-            except IndexError:
-                return None
-            self.rented_nations.append(nation)
+                nation_info, recruitable = \
+                    self.ns.get_nation_and_recruitable(
+                        nation['name'], self._nation_shards())
+            except urllib.error.HTTPError as ex:
+                if ex.code != 404:
+                    raise
+                self.log.info("%s no longer exists!", nation['name'])
+                nation_info, recruitable = {}, False
+            nation.update(nation_info)
+            refreshed.append((nation, recruitable))
 
-        return nation
+        checked_out = []
+        with ns.lock, self.nations.batch():
+            for (nation, recruitable) in refreshed:
+                if not recruitable or self.filter_nation(nation):
+                    self.leases.release(self.nations.key(nation))
+                    self.nations.recruit(nation)
+                    continue
+                self.nations.save(nation)
+                # The lease starts once the client has the nation.
+                self.leases.grant(self.nations.key(nation))
+                checked_out.append(nation)
+        return checked_out
+
+    def _checkout_nation(self, timeout: Optional[float] = 0
+                         ) -> Optional[dict]:
+        nations = self._checkout_nations(1, timeout)
+        return nations[0] if nations else None
 
     def _return_nation(self, nation: dict):
-        self.log.info("Returning Nation: %s", nation)
-        if not self._check_nation(nation['name']):
-            with ns.lock:
-                self.rented_nations.remove(nation)
-                self.recruited_nations.append(nation)
-        else:
-            with ns.lock:
-                self.rented_nations.remove(nation)
-                self.available_nations.append(nation)
+        self._return_nations([nation])
+
+    def _return_nations(self, nations: list[dict]):
+        """
+        Returns rented nations to the pool, or recruits them if they are
+        no longer recruitable. The pool is locked once to see which are
+        rented, and once to return them all.
+        """
+        self.log.info("Returning Nations: %s", nations)
+        valid = [nation for nation in nations if isinstance(nation, dict)
+                 and isinstance(nation.get('name'), str)]
+        if len(valid) < len(nations):
+            self.log.warning("%s aren't nations!",
+                             [nation for nation in nations
+                              if nation not in valid])
+            nations = valid
+        with ns.lock:
+            rented = [nation for nation in nations
+                      if nation in self.nations
+                      and self.nations.state(nation) == pool.RENTED]
+        if len(rented) < len(nations):
+            self.log.warning("%s weren't rented out!",
+                             [nation['name'] for nation in nations
+                              if nation not in rented])
+        checked = []
+        for nation in rented:
+            # The client has probably telegrammed it, so check it afresh.
+            self.ns.cache.invalidate(nation['name'])
+            checked.append((nation, self._check_nation(nation['name'])))
+        released = False
+        with ns.lock, self.nations.batch():
+            for (nation, recruitable) in checked:
+                try:
+                    if not recruitable:
+                        self.nations.move(nation, pool.RECRUITED,
+                                          pool.RENTED)
+                    else:
+                        self.nations.release(nation)
+                        released = True
+                except KeyError:
+                    self.log.warning("%s wasn't rented out!", nation['name'])
+                else:
+                    self.leases.release(self.nations.key(nation))
+            if released:
+                self._nations_available()
+
+    def _renew_nation(self, name: str) -> Optional[float]:
+        """
+        Renews the lease of a rented nation.
+
+        Returns
+        -------
+        How long, in seconds, the lease now lasts, or None if the nation
+        isn't leased.
+        """
+        with ns.lock:
+            key = self.nations.key(name)
+            if self.leases.renew(key) is None:
+                return None
+            return self.leases.remaining(key)
 
     def handle_client(self, client: socket.socket, address: tuple[str, int]):
         """
@@ -243,66 +856,586 @@ class EllisServer:
         address : tuple
             The address of the client.
         """
-        # pylint: disable=no-else-break,too-many-nested-blocks
-        # pylint: disable=too-many-branches
-
         self.log.info("Handling Client: %s", str(address))
         client_closed = False
+        decoder = protocol.Decoder()
+        fields = None
         try:
-            while self.running:
+            while self.running and not client_closed:
                 self.log.debug("Waiting for Command...")
-                command = client.recv(2048).decode('utf-8')
-                self.log.debug("Command Reciveved From: %s. Command: %s",
-                               str(address), command)
-                _command = command.lower().split(' ')[0]
-                try:
-                    is_return = bool(command.lower().split('return ')[1])
-                except IndexError:
-                    is_return = False
-                if _command == 'return' and is_return:
-                    self.log.info("Returning Nation!")
-                    self._return_nation(json.loads(command[len('return '):]))
-                elif _command == 'check':
-                    self.log.info("Checking Nation!")
-                    if self._check_nation(command.lower().split('check ')[1]):
-                        client.send(json.dumps({'recruitable': 1}
-                                               ).encode('utf-8'))
-                    else:
-                        client.send(json.dumps({'recruitable': 0}
-                                               ).encode('utf-8'))
-                elif command.lower() == 'end':
+                if not decoder.recv_into(client):
+                    # The client hung up without sending END.
                     client_closed = True
                     break
-                elif command.lower() == 'get':
-                    self.log.info("Sending Nation!")
-                    while True:
-                        nation = self._checkout_nation()
-                        if nation and self._check_nation(nation['name']):
-                            client.send(json.dumps(nation).encode('utf-8'))
-                            break
-                        else:
-                            self.log.debug("Waiting for an available nation")
-                            self.log.debug("Nation: %s", nation)
-                            time.sleep(30)
+                # Pipelined commands are answered in the order they came.
+                for message in decoder.messages():
+                    command = message.decode('utf-8')
+                    self.log.debug("Command Reciveved From: %s. Command: %s",
+                                   str(address), command)
+                    if (decoder.framing == protocol.LEGACY
+                            and protocol.is_negotiation(command)):
+                        client.sendall(self._negotiate(decoder, command))
+                        continue
+                    if command.lower().split(' ')[0] == 'fields':
+                        fields, response = self._fields_command(
+                            command, fields, decoder.encoding)
+                        client.sendall(self._frame(response, False,
+                                                   decoder.framing,
+                                                   decoder.encoding))
+                        continue
+                    response, client_closed = self._handle_command(
+                        command, decoder.encoding, fields)
+                    reply = self._frame(response, client_closed,
+                                        decoder.framing, decoder.encoding)
+                    if reply:
+                        client.sendall(reply)
+                    if client_closed:
+                        break
+        except (protocol.ProtocolError, UnicodeDecodeError) as ex:
+            self.log.warning("Disconnecting %s: %s", str(address), ex)
         except BaseException as ex:
             self.log.error(ex, exc_info=True)
             raise
         finally:
             if not client_closed:
-                client.send("END".encode('utf-8'))
+                client.send(protocol.encode(protocol.end(decoder.encoding),
+                                            decoder.framing))
             self.log.info("Disconnecting!")
             client.shutdown(socket.SHUT_RDWR)
             client.close()
 
+    def _negotiate(self, decoder: protocol.Decoder, command: str) -> bytes:
+        """
+        Switches a client to the framing its PROTOCOL command asks for.
+
+        Returns
+        -------
+        The reply to send, framed as the client now expects.
+        """
+        try:
+            framing, encoding = protocol.parse_negotiation(command)
+        except protocol.ProtocolError as ex:
+            self.log.warning("Staying on protocol 1: %s", ex)
+            return json.dumps({'protocol': 1}).encode('utf-8')
+        decoder.framing = framing
+        decoder.encoding = encoding
+        return protocol.encode(protocol.dumps({'protocol': protocol.VERSION,
+                                               'framing': framing,
+                                               'encoding': encoding},
+                                              encoding), framing)
+
+    @staticmethod
+    def _frame(response, ended: bool, framing: str,
+               encoding: str = protocol.JSON) -> bytes:
+        """
+        Returns a response framed to send to a client. From protocol 2,
+        every command but END is answered, those without a response of
+        their own with an empty object.
+        """
+        if response is None:
+            if framing == protocol.LEGACY or ended:
+                return b''
+            response = protocol.dumps({}, encoding)
+        return protocol.encode(response, framing)
+
+    def _fields_command(self, command: str,
+                        fields: Optional[tuple[str, ...]],
+                        encoding: str = protocol.JSON
+                        ) -> tuple[Optional[tuple[str, ...]], Union[str,
+                                                                   bytes]]:
+        """
+        Runs a FIELDS command, which sets the fields sent of each nation
+        for the rest of the connection.
+
+        Parameters
+        ----------
+        command : str
+            The command, as it was sent.
+        fields : tuple
+            The fields the connection was sending before, None for all.
+
+        Returns
+        -------
+        The fields to send from now on, and the response to the client,
+        which holds them.
+        """
+        try:
+            fields = protocol.parse_fields(command[len('fields'):])
+        except ValueError as ex:
+            self.log.warning("Bad FIELDS command: %s", ex)
+        return fields, protocol.dumps({'fields': fields and list(fields)},
+                                      encoding)
+
+    def _encode_nations(self, nations: list[dict],
+                        encoding: str = protocol.JSON, batch: bool = False,
+                        fields: Optional[tuple[str, ...]] = None):
+        """
+        Returns the nations encoded as a GET response, reusing their
+        encodings from the last time they were handed out if unchanged.
+        Unless it's a batch, only the first nation is sent, or an empty
+        object if there isn't one. Only the fields given are sent, if any
+        are.
+        """
+        # pylint: disable=too-many-arguments
+        keys = [self.nations.key(nation) for nation in nations]
+        if batch:
+            return self.encoded.encode_all(keys, nations, encoding, fields)
+        if not nations:
+            return protocol.dumps({}, encoding)
+        return self.encoded.encode(keys[0], nations[0], encoding, fields)
+
+    def _handle_command(self, command: str, encoding: str = protocol.JSON,
+                        fields: Optional[tuple[str, ...]] = None
+                        ) -> tuple[Optional[Union[str, bytes]], bool]:
+        """
+        Runs a single command sent by a client.
+
+        Parameters
+        ----------
+        command : str
+            The command, as it was sent.
+        encoding : str
+            How the response is encoded, as a str for JSON, or bytes for
+            MSGPACK.
+        fields : tuple
+            The fields of each nation the client asked for with FIELDS,
+            None for all of them.
+
+        Returns
+        -------
+        The response to send to the client, if there is one, and
+        whether or not the client ended the connection.
+        """
+        # pylint: disable=no-else-return
+        _command = command.lower().split(' ')[0]
+        try:
+            is_return = bool(command.lower().split('return ')[1])
+        except IndexError:
+            is_return = False
+        if _command == 'return' and is_return:
+            self.log.info("Returning Nation!")
+            try:
+                returned = json.loads(command[len('return '):])
+            except ValueError as ex:
+                self.log.warning("Bad RETURN command: %s", ex)
+                return None, False
+            if isinstance(returned, list):
+                self._return_nations(returned)
+            else:
+                self._return_nation(returned)
+        elif _command == 'check':
+            self.log.info("Checking Nation!")
+            try:
+                names = command.lower().split(maxsplit=1)[1]
+            except IndexError:
+                self.log.warning("CHECK without a nation")
+                return protocol.dumps({'error': 'CHECK needs a nation'},
+                                      encoding), False
+            if names.lstrip().startswith('['):
+                try:
+                    names = json.loads(names)
+                except ValueError as ex:
+                    self.log.warning("Bad CHECK command: %s", ex)
+                    return None, False
+                # Anything but a name is never recruitable.
+                return protocol.dumps([
+                    {'recruitable': int(isinstance(name, str)
+                                        and self._check_nation(name))}
+                    for name in names], encoding), False
+            if self._check_nation(names):
+                return protocol.dumps({'recruitable': 1}, encoding), False
+            else:
+                return protocol.dumps({'recruitable': 0}, encoding), False
+        elif _command == 'renew':
+            self.log.info("Renewing Nation!")
+            lease = self._renew_nation(command[len('renew '):].strip())
+            if lease is None:
+                return protocol.dumps({'renewed': 0}, encoding), False
+            return protocol.dumps({'renewed': 1, 'lease': lease},
+                                  encoding), False
+        elif command.lower() == 'end':
+            return None, True
+        elif _command == 'get':
+            self.log.info("Sending Nation!")
+            try:
+                count, timeout, get_fields = self._get_request(command)
+            except ValueError:
+                return None, False
+            nations = self._get_nations(count or 1, timeout)
+            if not nations and not self.running:
+                return None, False
+            # Empty if it timed out without a nation becoming available.
+            return self._encode_nations(nations, encoding, count is not None,
+                                        get_fields or fields), False
+        return None, False
+
+    @staticmethod
+    def _get_request(command: str) -> tuple[Optional[int], Optional[float],
+                                            Optional[tuple[str, ...]]]:
+        """
+        Returns how many nations a GET command asks for, None unless it
+        is a batch, the timeout given with it, if any, and the fields it
+        asks for, None unless it does.
+
+        Raises
+        ------
+        ValueError
+            If the arguments aren't understood.
+        """
+        try:
+            argument = command.split(' ', 1)[1].strip()
+        except IndexError:
+            return None, None, None
+        if argument.startswith('{'):
+            request = json.loads(argument)
+            if not set(request) <= {'count', 'timeout', 'fields'}:
+                raise ValueError("Expected count, timeout and fields")
+            count, timeout, fields = (request.get('count'),
+                                      request.get('timeout'),
+                                      request.get('fields'))
+            if count is not None and int(count) < 1:
+                raise ValueError("Expected a count of at least 1")
+            return (None if count is None else int(count),
+                    None if timeout is None else float(timeout),
+                    protocol.parse_fields(json.dumps(fields)))
+        if not argument.startswith('['):
+            return None, float(argument), None
+        batch = json.loads(argument)
+        if (not isinstance(batch, list) or not 1 <= len(batch) <= 2
+                or int(batch[0]) < 1):
+            raise ValueError("Expected GET [count] or GET [count, timeout]")
+        return int(batch[0]), (float(batch[1]) if len(batch) == 2
+                               else None), None
+
+    def _get_nations(self, count: int = 1,
+                     timeout: Optional[float] = None) -> list[dict]:
+        """
+        Checks out up to count recruitable nations, waiting until at
+        least one is available.
+
+        Parameters
+        ----------
+        count : int
+            The most nations to check out.
+        timeout : float
+            How long, in seconds, to wait. By default it waits until a
+            nation is available or the server stops.
+
+        Returns
+        -------
+        The nations, none if none became available in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.running:
+            remaining = (None if deadline is None
+                         else max(deadline - time.monotonic(), 0))
+            nations = self._checkout_nations(count, remaining)
+            if nations:
+                return nations
+            if remaining is not None and time.monotonic() >= deadline:
+                return []
+        return []
+
+    def _get_nation(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """ Checks out a single nation, or None, as _get_nations does. """
+        nations = self._get_nations(1, timeout)
+        return nations[0] if nations else None
+
+    def _serve_selector(self, server: socket.socket):
+        """
+        Serves every client from a single event loop, with the commands
+        themselves run on a bounded pool of workers.
+
+        A GET that has to wait for a nation doesn't hold a worker, it
+        waits in the loop until a nation is made available.
+
+        Parameters
+        ----------
+        server : socket.socket
+            The listening socket.
+        """
+        # pylint: disable=too-many-locals
+        selector = selectors.DefaultSelector()
+        wakeup, waker = socket.socketpair()
+        wakeup.setblocking(False)
+        server.setblocking(False)
+        selector.register(server, selectors.EVENT_READ)
+        selector.register(wakeup, selectors.EVENT_READ)
+        finished: queue.SimpleQueue = queue.SimpleQueue()
+        clients: dict[socket.socket, _Client] = {}
+        waiting: collections.deque = collections.deque()
+
+        def wake():
+            try:
+                waker.send(b'\0')
+            except BlockingIOError:
+                pass  # It's already going to wake up.
+
+        def run_command(client: _Client, command: str):
+            try:
+                response, ended = self._handle_command(
+                    command, client.decoder.encoding, client.fields)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.log.error(ex, exc_info=True)
+                response, ended = protocol.end(client.decoder.encoding), True
+            finished.put((client, response, ended))
+            wake()
+
+        def run_get(client: _Client):
+            try:
+                nations = self._get_nations(client.count or 1, 0)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.log.error(ex, exc_info=True)
+                finished.put((client, protocol.end(client.decoder.encoding),
+                              True))
+            else:
+                # None puts the client back to waiting.
+                response = nations and self._encode_nations(
+                    nations, client.decoder.encoding,
+                    client.count is not None, client.get_fields)
+                finished.put((client, response or None, False))
+            wake()
+
+        def start_next(client: _Client):
+            """ Starts the client's next command, once its last is done. """
+            while not client.busy and not client.ended and client.commands:
+                command = client.commands.popleft()
+                if command.lower().split(' ')[0] == 'fields':
+                    client.fields, response = self._fields_command(
+                        command, client.fields, client.decoder.encoding)
+                    client.outgoing += self._frame(response, False,
+                                                   client.decoder.framing,
+                                                   client.decoder.encoding)
+                    continue
+                if command.lower().split(' ')[0] != 'get':
+                    client.busy = True
+                    workers.submit(run_command, client, command)
+                    break
+                try:
+                    client.count, timeout, fields = self._get_request(
+                        command)
+                    client.get_fields = fields or client.fields
+                except ValueError:
+                    client.outgoing += self._frame(None, False,
+                                                   client.decoder.framing,
+                                                   client.decoder.encoding)
+                    continue
+                client.busy = True
+                client.deadline = (math.inf if timeout is None
+                                   else time.monotonic() + timeout)
+                waiting.append(client)
+            self._update_interest(client, selector)
+
+        waker.setblocking(False)
+        with self.nation_ready:
+            self._on_available.append(wake)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="Ellis-Worker") as workers:
+            try:
+                while self.running:
+                    timeout = self._dispatch_gets(waiting, workers, run_get,
+                                                  start_next)
+                    for (key, mask) in selector.select(timeout=timeout):
+                        if key.fileobj is server:
+                            self._accept_client(server, selector, clients)
+                        elif key.fileobj is wakeup:
+                            self._finish_commands(wakeup, finished, selector,
+                                                  clients, waiting,
+                                                  start_next)
+                        elif mask & selectors.EVENT_READ:
+                            if self._read_client(key.data, selector,
+                                                 clients):
+                                start_next(key.data)
+                        else:
+                            self._write_client(key.data, selector, clients)
+            finally:
+                with self.nation_ready:
+                    self._on_available.remove(wake)
+                for client in list(clients.values()):
+                    if not client.ended:
+                        try:
+                            client.sock.setblocking(True)
+                            client.sock.send(protocol.encode(
+                                protocol.end(client.decoder.encoding),
+                                client.decoder.framing))
+                        except OSError:
+                            pass
+                    self._close_client(client, selector, clients)
+                selector.close()
+                wakeup.close()
+                waker.close()
+
+    def _accept_client(self, server, selector, clients):
+        while True:
+            try:
+                sock, address = server.accept()
+            except BlockingIOError:
+                return
+            self.log.info("Handling Client: %s", str(address))
+            sock.setblocking(False)
+            client = _Client(sock, address)
+            clients[sock] = client
+            self._update_interest(client, selector)
+
+    def _read_client(self, client, selector, clients) -> bool:
+        """
+        Reads what it can from a client, and queues up its commands.
+
+        Returns
+        -------
+        True if the client is still connected.
+        """
+        try:
+            received = client.decoder.recv_into(client.sock)
+        except BlockingIOError:
+            return False
+        except OSError:
+            received = 0
+        if not received:
+            client.ended = True
+            self._close_client(client, selector, clients)
+            return False
+        try:
+            for message in client.decoder.messages():
+                command = message.decode('utf-8')
+                self.log.debug("Command Reciveved From: %s. Command: %s",
+                               str(client.address), command)
+                if (client.decoder.framing == protocol.LEGACY
+                        and protocol.is_negotiation(command)):
+                    client.outgoing += self._negotiate(client.decoder,
+                                                       command)
+                else:
+                    client.commands.append(command)
+        except (protocol.ProtocolError, UnicodeDecodeError) as ex:
+            self.log.warning("Disconnecting %s: %s", str(client.address), ex)
+            client.commands.clear()
+            client.outgoing += protocol.encode(
+                protocol.end(client.decoder.encoding), client.decoder.framing)
+            client.ended = True
+        return True
+
+    def _dispatch_gets(self, waiting, workers, run_get, start_next) -> float:
+        """
+        Hands waiting GETs to the workers while there are nations for
+        them, and answers those that timed out, in the order they came.
+
+        Returns
+        -------
+        How long the event loop may wait before it needs to check again.
+        """
+        # pylint: disable=too-many-arguments
+        now = time.monotonic()
+        for client in [client for client in waiting if client.deadline <= now]:
+            waiting.remove(client)
+            client.busy = False
+            client.outgoing += protocol.encode(
+                protocol.dumps({} if client.count is None else [],
+                               client.decoder.encoding),
+                client.decoder.framing)
+            start_next(client)
+        with ns.lock:
+            ready = self.nations.count(pool.AVAILABLE)
+        for _ in range(min(ready, len(waiting))):
+            client = waiting.popleft()
+            client.getting = True
+            workers.submit(run_get, client)
+        deadlines = [client.deadline for client in waiting]
+        return max(min(deadlines + [now + 1]) - now, 0)
+
+    def _finish_commands(self, wakeup, finished, selector, clients, waiting,
+                         start_next):
+        # pylint: disable=too-many-arguments
+        try:
+            while wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        returned = []
+        while not finished.empty():
+            client, response, ended = finished.get()
+            if client.sock not in clients:
+                continue
+            if client.getting:
+                client.getting = False
+                if response is None:
+                    # Somebody else got there first, so wait some more.
+                    returned.append(client)
+                    continue
+            client.busy = False
+            client.ended = client.ended or ended
+            client.outgoing += self._frame(response, ended,
+                                           client.decoder.framing,
+                                           client.decoder.encoding)
+            if client.ended and not client.outgoing:
+                self._close_client(client, selector, clients)
+            else:
+                start_next(client)
+        # They were waiting before anyone still in line.
+        waiting.extendleft(reversed(returned))
+
+    def _write_client(self, client, selector, clients):
+        try:
+            sent = client.sock.send(client.outgoing)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close_client(client, selector, clients)
+            return
+        del client.outgoing[:sent]
+        if client.ended and not client.outgoing:
+            self._close_client(client, selector, clients)
+        else:
+            self._update_interest(client, selector)
+
+    @staticmethod
+    def _update_interest(client, selector):
+        """ Watches for whatever the client is able to do next. """
+        events = 0
+        if client.decoder.framing == protocol.LEGACY:
+            # Protocol 1 can't tell commands apart, so only one is read
+            # at a time.
+            reading = not client.busy and not client.commands
+        else:
+            reading = len(client.commands) < MAX_PIPELINE
+        if reading and not client.ended:
+            events |= selectors.EVENT_READ
+        if client.outgoing:
+            events |= selectors.EVENT_WRITE
+        if events and client.registered:
+            selector.modify(client.sock, events, client)
+        elif events:
+            selector.register(client.sock, events, client)
+        elif client.registered:
+            selector.unregister(client.sock)
+        client.registered = bool(events)
+
+    def _close_client(self, client, selector, clients):
+        self.log.info("Disconnecting!")
+        if client.registered:
+            selector.unregister(client.sock)
+            client.registered = False
+        clients.pop(client.sock, None)
+        try:
+            client.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        client.sock.close()
+
     def stop(self):
         """ Stops the server. """
         # pylint: disable=protected-access
         # The registry is a part of ellis, so access is fine.
         self.running = False
+        self._wakeup.set()
+        with self.nation_ready:
+            self.nation_ready.notify_all()
         ellis_modules._Ellis_Registry.stop()
-        self._write_out(self.available_nations, AVAILABLE_JSON_PATH)
-        self._write_out(self.rented_nations, RENTED_JSON_PATH)
-        self._write_out(self.recruited_nations, RECRUITED_JSON_PATH)
+        self.log.info("Blacklist hits: %s", self.blacklist_stats())
+        if self.journal is not None:
+            self.journal.close()
+        self.nations.close()
+        ns.connections.close()
         config.write_out()
 
     @logcall()
@@ -324,6 +1457,21 @@ class EllisServer:
         with open(location, 'w', encoding='utf-8') as file:
             json.dump(state_list, file)
 
+    def _read_watermark(self) -> Optional[int]:
+        """ Reads in the ID of the newest founding happening handled. """
+        try:
+            with open(WATERMARK_PATH, 'r', encoding='utf-8') as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_watermark(self):
+        """ Writes out the watermark, replacing the old one atomically. """
+        temporary = "{}.tmp".format(WATERMARK_PATH)
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write(str(self.watermark))
+        os.replace(temporary, WATERMARK_PATH)
+
 
 def _set_ver():
     ns._set_ver(__version__)  # pylint: disable=protected-access
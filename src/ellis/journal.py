@@ -0,0 +1,255 @@
+"""
+This provides the write-ahead journal Ellis keeps its nation pool in.
+
+The pool is kept as a snapshot, and journals of every state change made
+since. Each journal is a generation, the snapshot holds every change in
+the generations before its own, and the journals from its generation on
+are replayed over it. The recruited nations' index is written beside
+the snapshot, as path.recruited.generation.
+"""
+
+import os
+import glob
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+from ellis import pool, recruited
+
+
+class Journal:
+    """
+    An append-only journal of the changes to a NationPool.
+
+    Parameters
+    ----------
+    path : str
+        The path the snapshot and journals are kept at, the snapshot is
+        path.snapshot and each journal is path.journal.generation.
+    sync_interval : float
+        How long, in seconds, a change may be held in memory before it
+        is synced to disk.
+    compact_after : int
+        How many changes may be journaled before the journal should be
+        compacted into a new snapshot.
+    logger : logging.Logger
+        A logging object, By default it is the "Journal" Logger.
+
+    Attributes
+    ----------
+    generation : int
+        The generation of the journal being written to.
+    records : int
+        The number of changes written since the last compaction.
+
+    Notes
+    -----
+    record_add and record_move are called by the pool, and so under
+    ns.lock. They only sync when sync_interval has passed, so sync
+    should also be called periodically.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path: str, sync_interval: float = 1.0,
+                 compact_after: int = 100000,
+                 logger=logging.getLogger("Journal")):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        self.log = logger
+        self.generation = 0
+        self.records = 0
+        self._file = None
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot_path(self) -> str:
+        """ The path of the snapshot. """
+        return '{}.snapshot'.format(self.path)
+
+    def recruited_path(self, generation: int) -> str:
+        """ Returns the path of a generation's recruited index. """
+        return '{}.recruited.{}'.format(self.path, generation)
+
+    def journal_path(self, generation: int) -> str:
+        """ Returns the path of a generation's journal. """
+        return '{}.journal.{}'.format(self.path, generation)
+
+    def _generations(self) -> list[int]:
+        generations = []
+        for path in glob.glob(glob.escape(self.path) + '.journal.*'):
+            try:
+                generations.append(int(path.rsplit('.', 1)[1]))
+            except ValueError:
+                continue
+        return sorted(generations)
+
+    def load(self, nations: pool.NationPool,
+             archive: Optional[recruited.RecruitedArchive] = None) -> bool:
+        """
+        Replays the snapshot and journals into nations, then opens the
+        journal to be written to.
+
+        Parameters
+        ----------
+        nations : pool.NationPool
+            The pool to replay into, it should be empty.
+        archive : recruited.RecruitedArchive
+            Where to archive the recruited nations of a snapshot from
+            before they were archived, if anywhere. It is attached to
+            nations only while such a snapshot is replayed.
+
+        Returns
+        -------
+        True if there was anything to replay, and False if not.
+        """
+        found = False
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            found = True
+        except FileNotFoundError:
+            snapshot = {'generation': 0}
+        self.generation = snapshot['generation']
+        if snapshot.get('recruited_index'):
+            nations.recruited = recruited.RecruitedIndex.load(
+                self.recruited_path(self.generation))
+        else:
+            # Every record replayed was written before the archive was.
+            nations.archive = archive
+        # Recruited wins over rented, which wins over available.
+        for state in reversed(pool.STATES):
+            nations.extend(snapshot.get(state, ()), state)
+
+        for generation in self._generations():
+            if generation < snapshot['generation']:
+                os.remove(self.journal_path(generation))
+                continue
+            found = True
+            self.generation = generation
+            self._replay(self.journal_path(generation), nations)
+        self._open()
+        return found
+
+    def _replay(self, path: str, nations: pool.NationPool):
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last change was only partly written.
+                    self.log.warning("Skipping a broken record in %s", path)
+                    continue
+                if record[0] == '+':
+                    nations.add(record[2], record[1])
+                elif record[1] in nations:
+                    try:
+                        nations.move(record[1], record[2])
+                    except KeyError:
+                        # Already recruited by the snapshot.
+                        pass
+                self.records += 1
+
+    def _open(self):
+        # pylint: disable=consider-using-with
+        self._file = open(self.journal_path(self.generation), 'a',
+                          encoding='utf-8')
+
+    def _write(self, record: list):
+        with self._lock:
+            if self._file is None:
+                self.log.warning("Not journaling %s, it's closed", record)
+                return
+            self._file.write(json.dumps(record, separators=(',', ':')))
+            self._file.write('\n')
+            self.records += 1
+            self._dirty = True
+            if time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def record_add(self, nation: dict, state: str):
+        """ Journals a nation being added to the pool. """
+        self._write(['+', state, nation])
+
+    def record_move(self, key: str, state: str):
+        """ Journals a nation, by its key, moving to a new state. """
+        self._write(['>', key, state])
+
+    def _sync(self):
+        if self._dirty and self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """ Syncs every change journaled so far to disk. """
+        with self._lock:
+            self._sync()
+
+    def needs_compaction(self) -> bool:
+        """ Returns True once compact_after changes have been journaled. """
+        return self.records >= self.compact_after
+
+    def rotate(self) -> int:
+        """
+        Starts a new generation of the journal. It should be called with
+        ns.lock held, while the pool's state is copied for compact.
+
+        Returns
+        -------
+        The new generation.
+        """
+        with self._lock:
+            self._sync()
+            self._file.close()
+            self.generation += 1
+            self.records = 0
+            self._open()
+            return self.generation
+
+    def compact(self, snapshot: dict[str, list[dict]], generation: int,
+                index: Optional[recruited.RecruitedIndex] = None):
+        """
+        Replaces the snapshot, and removes the journals it holds.
+
+        Parameters
+        ----------
+        snapshot : dict
+            The nations in each state, when generation was started.
+        generation : int
+            The generation rotate returned.
+        index : recruited.RecruitedIndex
+            A copy of the recruited nations' index, when generation was
+            started.
+        """
+        snapshot = dict(snapshot, generation=generation,
+                        recruited_index=index is not None)
+        if index is not None:
+            index.save(self.recruited_path(generation))
+        temporary = '{}.tmp'.format(self.snapshot_path)
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, separators=(',', ':'))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.snapshot_path)
+        for old in self._generations():
+            if old < generation:
+                os.remove(self.journal_path(old))
+        for path in glob.glob(glob.escape(self.path) + '.recruited.*'):
+            if path != self.recruited_path(generation):
+                os.remove(path)
+        self.log.info("Compacted the journal into generation %d", generation)
+
+    def close(self):
+        """ Syncs and closes the journal. """
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
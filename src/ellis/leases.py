@@ -0,0 +1,110 @@
+"""
+This provides the leases nations are rented out to clients under.
+"""
+
+import time
+import heapq
+from typing import Optional
+
+
+class Leases:
+    """
+    The deadline of every rented nation's lease, keyed on the nation's
+    key in the pool.
+
+    The deadlines are indexed by a heap, so the leases that have run out
+    are found without looking at any that haven't. Entries are left
+    behind when a lease is renewed or released, and are skipped as long
+    as they no longer match the lease's deadline.
+
+    Like the pool, leases don't lock themselves, ns.lock should be held
+    around them.
+
+    Parameters
+    ----------
+    duration : float
+        How long, in seconds, a lease lasts before it must be renewed.
+    """
+
+    def __init__(self, duration: float = 15 * 60):
+        self.duration = duration
+        self._deadlines: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def grant(self, key: str, now: Optional[float] = None) -> float:
+        """
+        Leases out a nation, replacing any lease it already had.
+
+        Parameters
+        ----------
+        key : str
+            The nation's key.
+        now : float
+            The current time, by default time.monotonic().
+
+        Returns
+        -------
+        The lease's deadline.
+        """
+        now = time.monotonic() if now is None else now
+        deadline = now + self.duration
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, key) for (key, deadline)
+                          in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return deadline
+
+    def renew(self, key: str, now: Optional[float] = None
+              ) -> Optional[float]:
+        """
+        Extends a nation's lease by another duration from now.
+
+        Returns
+        -------
+        The lease's new deadline, or None if the nation isn't leased.
+        """
+        if key not in self._deadlines:
+            return None
+        return self.grant(key, now)
+
+    def release(self, key: str):
+        """ Ends a nation's lease, if it has one. """
+        self._deadlines.pop(key, None)
+
+    def remaining(self, key: str, now: Optional[float] = None) -> float:
+        """
+        Returns how long, in seconds, is left on a nation's lease.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't leased.
+        """
+        now = time.monotonic() if now is None else now
+        return max(self._deadlines[key] - now, 0.0)
+
+    def expired(self, now: Optional[float] = None) -> list[str]:
+        """
+        Ends every lease that has run out, and returns their keys.
+
+        Parameters
+        ----------
+        now : float
+            The current time, by default time.monotonic().
+        """
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
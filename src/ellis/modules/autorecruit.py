@@ -6,7 +6,7 @@ import socket
 import time
 import json
 
-from ellis import config, ellis_modules, ns
+from ellis import config, ellis_modules, ns, protocol
 
 
 class Autorecruit(ellis_modules.EllisModule, module_name="Autorecruit"):
@@ -22,46 +22,61 @@ class Autorecruit(ellis_modules.EllisModule, module_name="Autorecruit"):
         setup. Somes changes might be needed to detach it a bit further, but
         otherwise it is independent. """
         connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        ellis = protocol.Connection(connection, protocol.LINE)
         server_closed = False
-        recruited = []
-        nation = None
+        # The nation rented out, and not yet returned.
+        rented = None
         try:
             ellis_modules.log.info("Connecting to Ellis...")
             connection.connect(("localhost", 4526))
+            ellis.negotiate()
+            # Only the nations' names are needed to telegram them.
+            ellis.send('FIELDS ["name"]')
+            ellis.receive()
             ellis_modules.log.info("Connected to Ellis!")
             ellis_modules.log.debug("Entering AutoTG Loop!")
             time.sleep(60)
+            ellis_modules.log.info("Getting Nation...")
+            ellis.send("GET")
             while self.running:
-                ellis_modules.log.info("Getting Nation...")
-                connection.send("GET".encode('utf-8'))
-                nation = connection.recv(2048).decode('utf-8')
+                nation = ellis.receive()
                 if nation.lower() == 'end':
                     server_closed = True
+                    break
                 try:
                     nation = json.loads(nation)
                 except json.JSONDecodeError as ex:
                     ellis_modules.log.error(ex, exc_info=1)
                     continue
+                if not nation:
+                    ellis.send("GET")
+                    continue
+                rented = nation
                 ellis_modules.log.info("Recieved Nation!")
                 ellis_modules.log.info("Recieved Nation: %s", nation)
                 ellis_modules.log.debug("Got Nation: %s", nation['name'])
                 ellis_modules.log.debug("Sending Telegram to %s!",
                                         nation['name'])
-                with ns.lock:
-                    self.ns_tg.send_telegram(nation['name'])
-                recruited.append(nation)
+                self.ns_tg.send_telegram(nation['name'])
+                # Return it straight away, so its lease isn't left to run
+                # out, and ask for the next one without waiting.
+                ellis_modules.log.info("Getting Nation...")
+                ellis.send('RETURN {}'.format(json.dumps(nation)), "GET")
+                rented = None
+                if ellis.receive().lower() == 'end':
+                    server_closed = True
+                    break
 
             ellis_modules.log.info("Shutting Down!")
         except BaseException as ex:
             ellis_modules.log.error(ex, exc_info=1, stack_info=True)
             raise
         finally:
-            ellis_modules.log.info("Returning Nations...")
-            for nation in recruited:
-                connection.send(('RETURN {}'
-                                 ).format(json.dumps(nation)).encode('utf-8'))
+            if rented is not None and not server_closed:
+                ellis_modules.log.info("Returning Nation...")
+                ellis.send('RETURN {}'.format(json.dumps(rented)))
             if not server_closed:
-                connection.send("END".encode('utf-8'))
+                ellis.send("END")
             connection.shutdown(socket.SHUT_RDWR)
             connection.close()
             ellis_modules.log.info("Goodbye...")
@@ -71,7 +86,7 @@ class Autorecruit(ellis_modules.EllisModule, module_name="Autorecruit"):
         # pylint: disable=attribute-defined-outside-init
         self.running = True
         try:
-            self.ns_tg = ns.NS_Telegram(ns.limit,
+            self.ns_tg = ns.NS_Telegram(ns.scheduler,
                                         (config.Config['Autorecruit']
                                          )['NS_TG_ID'],
                                         (config.Config['Autorecruit']
@@ -2,12 +2,21 @@
 This provides the NationStates interface for Ellis.
 """
 
+import io
+import math
+import bisect
+import heapq
+import itertools
+import contextlib
 import time
 import threading
 import logging
-import urllib.request
+import collections
+import http.client
+import urllib.error
+import urllib.parse
 from xml.etree import ElementTree
-from typing import Optional
+from typing import Iterable, Optional, Union
 
 
 from ellis import config
@@ -22,82 +31,965 @@ def _set_ver(version):
     VER = version
 
 
+def _user_agent() -> str:
+    """ Builds the User-Agent NationStates requires on every request. """
+    return ("Ellis v{} - written by Dusandria Founder (Chanku#4372),"
+            "request for {} on behalf of {}"
+            ).format(VER,
+                     config.Config['Core']['NS_Nation'],
+                     config.Config['Core']['NS_Region'])
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of persistent HTTPS connections to NationStates.
+
+    Parameters
+    ----------
+    host : str
+        The host every connection in the pool is made to.
+    size : int
+        The maximum number of idle connections kept open.
+    idle_timeout : float
+        How long, in seconds, an idle connection may sit in the pool
+        before it is thrown away instead of reused.
+    timeout : float
+        The socket timeout, in seconds, for each connection.
+
+    Attributes
+    ----------
+    handshakes : int
+        The number of new connections (and so TLS handshakes) made.
+    reuses : int
+        The number of requests sent over an already open connection.
+    reconnects : int
+        The number of requests retried because a pooled connection had
+        gone stale.
+
+    Notes
+    -----
+    Connections are handed out most-recently-used first, as those are
+    the least likely to have been closed by the other end.
+    """
+
+    def __init__(self, host: str = "www.nationstates.net", size: int = 4,
+                 idle_timeout: float = 30.0, timeout: float = 30.0):
+        self.host = host
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.handshakes = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self._idle: collections.deque = collections.deque()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPSConnection:
+        with self._lock:
+            self.handshakes += 1
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+
+    def _acquire(self) -> tuple[http.client.HTTPSConnection, bool]:
+        """ Returns a connection, and whether or not it was reused. """
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                _connection, last_used = self._idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    self.reuses += 1
+                    connection = _connection
+                    break
+                stale.append(_connection)
+        for _connection in stale:
+            _connection.close()
+        if connection is not None:
+            return connection, True
+        return self._connect(), False
+
+    def _release(self, connection: http.client.HTTPSConnection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    @staticmethod
+    def _perform(connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+
+    def request(self, url: str, headers: Optional[dict] = None) -> bytes:
+        """
+        Sends a GET request for url and returns the body.
+
+        Parameters
+        ----------
+        url : str
+            The full URL to request, it must be on the pool's host.
+        headers : dict
+            Any headers to send along with the request.
+
+        Returns
+        -------
+        The raw body of the response.
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            If NationStates responds with an error status.
+        """
+        split_url = urllib.parse.urlsplit(url)
+        path = split_url.path or '/'
+        if split_url.query:
+            path = '{}?{}'.format(path, split_url.query)
+        headers = dict(headers or {})
+
+        connection, reused = self._acquire()
+        try:
+            response, body = self._perform(connection, path, headers)
+        except (ConnectionError, http.client.BadStatusLine):
+            connection.close()
+            if not reused:
+                raise
+            # The server dropped a kept-alive connection, try a fresh one.
+            with self._lock:
+                self.reconnects += 1
+            connection = self._connect()
+            try:
+                response, body = self._perform(connection, path, headers)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status,
+                                         response.reason, response.msg,
+                                         io.BytesIO(body))
+        return body
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the pool's counters and how many connections idle. """
+        with self._lock:
+            return {'handshakes': self.handshakes,
+                    'reuses': self.reuses,
+                    'reconnects': self.reconnects,
+                    'idle': len(self._idle)}
+
+    def close(self):
+        """ Closes every idle connection in the pool. """
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            connection.close()
+
+
 class Limiter:
     """
-    This class is a limiter for accessing NationStates, and should
-    be locked around.
+    A sliding-window limiter for accessing NationStates.
+
+    Every request made (or reserved) is remembered by its timestamp,
+    and a new request is only allowed once fewer than the limit remain
+    within the window. The limiter keeps its own lock, and never sleeps
+    while holding it, so it does not need to be locked around.
+
+    Parameters
+    ----------
+    limit : int
+        The number of API requests allowed within window.
+    window : float
+        The length, in seconds, of the API window.
+    tg_limit : int
+        The number of telegrams allowed within tg_window.
+    tg_window : float
+        The length, in seconds, of the telegram window.
+
+    Notes
+    -----
+    A telegram is also an API request, and so counts against both
+    limits. The telegram defaults use the stricter recruitment limits.
     """
 
-    requests = 0
-    tg_requests = 0
-    last_request = None
-    last_tg_request = None
+    def __init__(self, limit: int = 50, window: float = 30.0,
+                 tg_limit: int = 1, tg_window: float = 180.0):
+        self.limit = limit
+        self.window = window
+        self.tg_limit = tg_limit
+        self.tg_window = tg_window
+        self._requests: collections.deque = collections.deque()
+        self._tg_requests: collections.deque = collections.deque()
+        self._lock = threading.Lock()
 
-    def __init__(self):
-        self.last_request = 0
-        self.last_tg_request = 0
+    @staticmethod
+    def _next_slot(requests, limit, window, now):
+        """ Returns the earliest time a request may be made at. """
+        while requests and requests[0] <= now - window:
+            requests.popleft()
+        if len(requests) < limit:
+            return now
+        if limit <= 0:
+            return math.inf
+        return max(now, requests[-limit] + window)
 
-    def check(self):
+    @staticmethod
+    def _record(requests, when):
+        if not requests or requests[-1] <= when:
+            requests.append(when)
+        else:
+            bisect.insort(requests, when)
+
+    def wait_time(self, headroom: int = 0) -> float:
+        """
+        Returns how long, in seconds, until an API request is allowed.
+
+        Parameters
+        ----------
+        headroom : int
+            The number of slots that must be left free afterwards.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return self._next_slot(self._requests, self.limit - headroom,
+                                   self.window, now) - now
+
+    def wait_time_tg(self, headroom: int = 0) -> float:
+        """ Returns how long, in seconds, until a telegram is allowed. """
+        with self._lock:
+            now = time.monotonic()
+            return max(self._next_slot(self._requests, self.limit - headroom,
+                                       self.window, now),
+                       self._next_slot(self._tg_requests, self.tg_limit,
+                                       self.tg_window, now)) - now
+
+    def available(self) -> int:
+        """ Returns how many API requests may be made right now. """
+        with self._lock:
+            now = time.monotonic()
+            self._next_slot(self._requests, self.limit, self.window, now)
+            return max(0, self.limit - len(self._requests))
+
+    def reserve(self) -> float:
         """
-        Checks to see when the last normal API request was.
+        Reserves the next free API request slot.
+
+        Returns
+        -------
+        How long, in seconds, the caller must wait before making the
+        request.
 
         Notes
         -----
-        This will block on call if a request can not be made.
+        The slot is taken as soon as this returns, so the caller should
+        always make the request once the wait is over.
         """
-        is_allowed = (self.requests + self.tg_requests) < 50
-        is_allowed = is_allowed or self.last_request + 62 < time.time()
-        if is_allowed:
-            if (self.requests + self.tg_requests) < 50:
-                self.requests += 1
-            else:
-                self.requests = 1
-            self.last_request = time.time()
-        else:
-            time.sleep(62)
-            self.requests = 0
-            self.check()
+        with self._lock:
+            now = time.monotonic()
+            slot = self._next_slot(self._requests, self.limit,
+                                   self.window, now)
+            self._record(self._requests, slot)
+            return slot - now
 
-    def check_tg(self):
+    def reserve_tg(self) -> float:
         """
-        Checks to see when the last TG API request was.
+        Reserves the next slot free in both the telegram and API windows.
+
+        Returns
+        -------
+        How long, in seconds, the caller must wait before sending the
+        telegram.
 
         See Also
         --------
-        check : Checks when the last regular API Request.
+        reserve : Reserves a regular API request slot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot(self._requests, self.limit,
+                                       self.window, now),
+                       self._next_slot(self._tg_requests, self.tg_limit,
+                                       self.tg_window, now))
+            self._record(self._requests, slot)
+            self._record(self._tg_requests, slot)
+            return slot - now
+
+    def try_acquire(self, headroom: int = 0) -> bool:
+        """
+        Takes an API request slot if one is free right now.
+
+        Parameters
+        ----------
+        headroom : int
+            The number of slots that must be left free afterwards, so
+            they stay available to more important requests.
+
+        Returns
+        -------
+        True if a slot was taken, or False if the caller would have had
+        to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._next_slot(self._requests, self.limit - headroom,
+                               self.window, now) > now:
+                return False
+            self._record(self._requests, now)
+            return True
+
+    def try_acquire_tg(self, headroom: int = 0) -> bool:
+        """
+        Takes a telegram slot if one is free right now.
+
+        Parameters
+        ----------
+        headroom : int
+            The number of API slots that must be left free afterwards.
+
+        See Also
+        --------
+        try_acquire : Takes a regular API request slot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            allowed = self._next_slot(self._requests, self.limit - headroom,
+                                      self.window, now) <= now
+            allowed = allowed and self._next_slot(self._tg_requests,
+                                                  self.tg_limit,
+                                                  self.tg_window, now) <= now
+            if allowed:
+                self._record(self._requests, now)
+                self._record(self._tg_requests, now)
+            return allowed
+
+    def check(self):
+        """
+        Waits until a normal API request may be made.
 
         Notes
         -----
-        This uses the stricter recruitment restrictions, due to this
-        largely being meant for autotelegramming.
-        This will eventually be removed in future.
-        """
-
-        nontg_request = (self.requests + self.tg_requests) < 50
-        nontg_request = nontg_request or self.last_request + 62 < time.time()
-        tg_request = self.tg_requests < 1
-        tg_request = tg_request or (self.last_tg_request + 180) < time.time()
-        if nontg_request and tg_request:
-            self.tg_requests += 1
-            self.last_tg_request = time.time()
-            self.last_request = time.time()
-        else:
-            time.sleep(182)
-            self.tg_requests = 0
-            self.check_tg()
+        This will block on call if a request can not be made, for
+        exactly as long as is needed.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
 
+    def check_tg(self):
+        """
+        Waits until a telegram may be sent.
+
+        Notes
+        -----
+        The slot is reserved up front, as check does, so a telegram
+        can't be starved by requests reserving slots ahead of it.
 
-class NS:
+        See Also
+        --------
+        check : Waits until a regular API Request may be made.
+        """
+        wait = self.reserve_tg()
+        if wait > 0:
+            time.sleep(wait)
+
+
+TELEGRAM = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+PRIORITIES = (TELEGRAM, INTERACTIVE, BACKGROUND)
+
+
+class Scheduler:
     """
-    An object repesenting state and all necessary information needed
-    for calling the NationStates API.
+    A priority-aware scheduler in front of a Limiter.
+
+    Requests wait in priority order (and then arrival order) for the
+    API budget, so a telegram is never stuck behind client checks, and
+    a client check is never stuck behind background pulls. It can be
+    given to NS and NS_Telegram in place of a Limiter.
 
     Parameters
     ----------
     limiter : Limiter
-        The NationStates API Limiter.
-    logger : logging.Logger
-        A logging object, By default it is the "NS" Logger.
+        The limiter whose budget is being scheduled.
+    reserved : dict
+        How many slots of the API window are held back for each
+        priority, a priority may only take a slot while more than the
+        slots reserved for every more important priority are free.
+
+    Notes
+    -----
+    The priority of a request is the one set for the calling thread
+    with priority(), or INTERACTIVE if none was set. Telegrams are
+    always sent as TELEGRAM.
+    """
+
+    def __init__(self, limiter: Limiter,
+                 reserved: Optional[dict[int, int]] = None):
+        self.limiter = limiter
+        if reserved is None:
+            reserved = {TELEGRAM: 1, INTERACTIVE: 10}
+        self.reserved = reserved
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._order = itertools.count()
+        self._local = threading.local()
+        self._stats = {priority: {'requests': 0,
+                                  'waiting': 0,
+                                  'total_wait': 0.0,
+                                  'max_wait': 0.0}
+                       for priority in PRIORITIES}
+
+    @contextlib.contextmanager
+    def priority(self, priority: int):
+        """
+        Runs every request made by this thread within the block at
+        priority.
+
+        Parameters
+        ----------
+        priority : int
+            One of TELEGRAM, INTERACTIVE or BACKGROUND.
+        """
+        previous = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self) -> int:
+        """ Returns the priority requests from this thread are made at. """
+        return getattr(self._local, 'priority', INTERACTIVE)
+
+    def _headroom(self, priority: int) -> int:
+        return sum(slots for (_priority, slots) in self.reserved.items()
+                   if _priority < priority)
+
+    def _try_acquire(self, priority: int, is_tg: bool) -> float:
+        """ Returns 0 if a slot was taken, or how long to wait if not. """
+        headroom = self._headroom(priority)
+        if is_tg:
+            if self.limiter.try_acquire_tg(headroom):
+                return 0
+            return max(self.limiter.wait_time_tg(headroom), 0.01)
+        if self.limiter.try_acquire(headroom):
+            return 0
+        return max(self.limiter.wait_time(headroom), 0.01)
+
+    def acquire(self, priority: Optional[int] = None, is_tg: bool = False):
+        """
+        Waits until a request may be made at priority.
+
+        Parameters
+        ----------
+        priority : int
+            The priority to wait at, by default the thread's priority.
+        is_tg : bool
+            Whether or not the request is a telegram.
+        """
+        if priority is None:
+            priority = TELEGRAM if is_tg else self.current_priority()
+        with self.waiting(priority), self._cond:
+            self._wait_for_turn(priority, is_tg)
+
+    @contextlib.contextmanager
+    def waiting(self, priority: int):
+        """
+        Counts a request as waiting at priority within the block, and
+        records how long it waited once the block is done.
+        """
+        start = time.monotonic()
+        stats = self._stats[priority]
+        with self._cond:
+            stats['waiting'] += 1
+        try:
+            yield
+        except BaseException:
+            with self._cond:
+                stats['waiting'] -= 1
+            raise
+        with self._cond:
+            stats['waiting'] -= 1
+            waited = time.monotonic() - start
+            stats['requests'] += 1
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+
+    def poll(self, priority: int, is_tg: bool = False) -> float:
+        """
+        Takes a slot at priority without waiting, for callers that can't
+        block, such as coroutines. A slot is only taken if no request as
+        important is queued for one.
+
+        Returns
+        -------
+        0 if a slot was taken, or how long, in seconds, to wait before
+        polling again.
+        """
+        with self._cond:
+            if self._queue and self._queue[0][0] <= priority:
+                return 0.01
+            return self._try_acquire(priority, is_tg)
+
+    def _wait_for_turn(self, priority: int, is_tg: bool):
+        while True:
+            if is_tg:
+                # A telegram waiting on the telegram window alone must
+                # not hold up everything queued behind it.
+                wait = self.limiter.wait_time_tg(self._headroom(priority))
+                while wait > 0:
+                    self._cond.wait(wait)
+                    wait = self.limiter.wait_time_tg(
+                        self._headroom(priority))
+            entry = (priority, next(self._order))
+            heapq.heappush(self._queue, entry)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] != entry:
+                        self._cond.wait()
+                        continue
+                    wait = self._try_acquire(priority, is_tg)
+                    if not wait:
+                        return
+                    headroom = self._headroom(priority)
+                    if is_tg and self.limiter.wait_time(headroom) <= 0:
+                        # Only the telegram window is shut, step aside.
+                        break
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def check(self):
+        """ Waits until a request may be made at the thread's priority. """
+        self.acquire()
+
+    def check_tg(self):
+        """ Waits until a telegram may be sent. """
+        self.acquire(is_tg=True)
+
+    def stats(self) -> dict[int, dict[str, float]]:
+        """
+        Returns the queue-wait metrics for each priority.
+
+        Returns
+        -------
+        A dictionary of each priority to how many requests it has made,
+        how many are waiting, and the total, mean and maximum time, in
+        seconds, that requests waited.
+        """
+        with self._cond:
+            stats = {}
+            for (priority, _stats) in self._stats.items():
+                stats[priority] = dict(_stats)
+                stats[priority]['mean_wait'] = (_stats['total_wait']
+                                                / max(_stats['requests'], 1))
+            return stats
+
+
+def _add_value(parent: dict, tag: str, value):
+    """ Adds a parsed child to parent, collecting repeated tags. """
+    if tag not in parent:
+        parent[tag] = value
+    elif isinstance(parent[tag], list):
+        parent[tag].append(value)
+    else:
+        parent[tag] = [parent[tag], value]
+
+
+_CHUNK_SIZE = 16 * 1024
+
+
+class _StopParsing(Exception):
+    """ Raised by a parser target once it has seen what it needs. """
+
+
+class _DictTarget:
+    """
+    An XMLParser target which builds the parse_xml dictionaries
+    directly, without building any elements.
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        self.wanted = set(fields) if fields is not None else None
+        self.root_tag: Optional[str] = None
+        # Each open element has the dictionary its children are added
+        # to, and the text it has so far.
+        self.stack: list[dict] = [{}]
+        self.text: list[list[str]] = [[]]
+
+    def start(self, tag, attrib):  # pylint: disable=unused-argument
+        """ Opens an element. """
+        if self.root_tag is None:
+            self.root_tag = tag.lower()
+        self.stack.append({})
+        self.text.append([])
+
+    def data(self, data):
+        """ Adds text to the open element. """
+        self.text[-1].append(data)
+
+    def end(self, tag):
+        """ Closes the open element, adding it to its parent. """
+        children = self.stack.pop()
+        text = self.text.pop()
+        tag = tag.lower()
+        if children:
+            _add_value(self.stack[-1], tag, children)
+        else:
+            _add_value(self.stack[-1], tag, ''.join(text) if text else None)
+        if self.wanted is not None and len(self.stack) == 2:
+            self.wanted.discard(tag)
+            if not self.wanted:
+                raise _StopParsing
+
+    def close(self) -> dict:
+        """ Returns everything parsed. """
+        if len(self.stack) > 1:
+            # Parsing stopped early, so the root is still open.
+            return {self.root_tag: self.stack[1]}
+        return self.stack[0]
+
+
+def parse_xml(xml: Union[str, bytes],
+              fields: Optional[Iterable[str]] = None) -> dict:
+    """
+    Incrementally parses a NationStates XML response into a dictionary.
+
+    Parameters
+    ----------
+    xml : str or bytes
+        The XML to parse.
+    fields : iterable
+        The lowercase names of the children of the root element the
+        caller needs. If given, parsing stops as soon as all of them
+        have been seen.
+
+    Returns
+    -------
+    A dictionary of the lowercased root tag to its contents. An element
+    without children is its text, and an element with children is a
+    dictionary of its children. Children that share a tag are
+    collected, in order, into a list.
+
+    Notes
+    -----
+    The dictionaries are built straight from the parser's events, so no
+    element tree is ever held in memory.
+    """
+    target = _DictTarget(fields)
+    parser = ElementTree.XMLParser(target=target)
+    try:
+        for start in range(0, len(xml), _CHUNK_SIZE):
+            parser.feed(xml[start:start + _CHUNK_SIZE])
+    except _StopParsing:
+        return target.close()
+    parser.close()
+    return target.close()
+
+
+class _FoundingsTarget:
+    """ An XMLParser target which collects founding happenings. """
+
+    def __init__(self):
+        self.foundings: list[dict] = []
+        self.event_id: Optional[str] = None
+        self.timestamp: list[str] = []
+        self.text: list[str] = []
+        self.current: Optional[list[str]] = None
+
+    def start(self, tag, attrib):
+        """ Starts collecting the text of a timestamp or event text. """
+        if tag == 'EVENT':
+            self.event_id = attrib.get('id')
+        elif tag == 'TIMESTAMP':
+            self.current = self.timestamp = []
+        elif tag == 'TEXT':
+            self.current = self.text = []
+
+    def data(self, data):
+        """ Collects text, if it is wanted. """
+        if self.current is not None:
+            self.current.append(data)
+
+    def end(self, tag):
+        """ Finishes an event, or the text being collected. """
+        self.current = None
+        if tag == 'EVENT':
+            text = ''.join(self.text)
+            founding = {'name': text.split("@@")[1],
+                        'founding_region': text.split("%%")[1],
+                        'founded_at': ''.join(self.timestamp)}
+            if self.event_id is not None:
+                founding['event_id'] = int(self.event_id)
+            self.foundings.append(founding)
+
+    def close(self) -> list[dict]:
+        """ Returns every founding parsed. """
+        return self.foundings
+
+
+def normalize_name(name: str) -> str:
+    """ Returns the form of a nation's name NationStates compares by. """
+    return name.strip().lower().replace(" ", "_")
+
+
+class Cache:
+    """
+    A bounded cache of NationStates lookups, with a time-to-live for
+    each kind of lookup and least-recently-used eviction.
+
+    Parameters
+    ----------
+    size : int
+        The maximum number of lookups kept.
+    ttls : dict
+        How long, in seconds, each kind of lookup is kept for. The
+        'missing' kind is how long a nation that doesn't exist is
+        remembered as not existing.
+
+    Attributes
+    ----------
+    hits : int
+        The number of lookups answered from the cache.
+    misses : int
+        The number of lookups that had to be sent to NationStates.
+    evictions : int
+        The number of lookups dropped to keep within size.
+    """
+
+    def __init__(self, size: int = 10000,
+                 ttls: Optional[dict[str, float]] = None):
+        self.size = size
+        self.ttls = {'nation': 300.0, 'recruitable': 60.0, 'missing': 300.0}
+        self.ttls.update(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._by_name: dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, name: str, key=None) -> tuple[bool, object]:
+        """
+        Looks up a cached lookup.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of lookup, such as 'nation' or 'recruitable'.
+        name : str
+            The normalized name of the nation.
+        key
+            Anything else the lookup depends on.
+
+        Returns
+        -------
+        Whether or not the lookup was cached, and if it was its value.
+
+        Raises
+        ------
+        urllib.error.HTTPError
+            If the nation is cached as not existing.
+        """
+        now = time.monotonic()
+        with self._lock:
+            missing = self._get(('missing', name, None), now)
+            if missing is not None:
+                self.hits += 1
+                raise urllib.error.HTTPError(missing[1], 404, 'Not Found',
+                                             None, None)  # type: ignore
+            entry = self._get((kind, name, key), now)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[1]
+
+    def _get(self, entry_key, now):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._remove(entry_key)
+            return None
+        self._entries.move_to_end(entry_key)
+        return entry
+
+    def put(self, kind: str, name: str, value, key=None):
+        """
+        Caches a lookup.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of lookup.
+        name : str
+            The normalized name of the nation.
+        value
+            The result of the lookup.
+        key
+            Anything else the lookup depends on.
+        """
+        entry_key = (kind, name, key)
+        with self._lock:
+            self._entries[entry_key] = (time.monotonic() + self.ttls[kind],
+                                        value)
+            self._entries.move_to_end(entry_key)
+            self._by_name.setdefault(name, set()).add(entry_key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def put_missing(self, name: str, url: str):
+        """ Caches that a nation doesn't exist, as it was a 404 at url. """
+        self.put('missing', name, url)
+
+    def _remove(self, entry_key):
+        del self._entries[entry_key]
+        keys = self._by_name[entry_key[1]]
+        keys.discard(entry_key)
+        if not keys:
+            del self._by_name[entry_key[1]]
+
+    def invalidate(self, name: Optional[str] = None):
+        """
+        Forgets every lookup of a nation.
+
+        Parameters
+        ----------
+        name : str
+            The nation to forget, or everything if it isn't given.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._by_name.clear()
+                return
+            for entry_key in list(self._by_name.get(normalize_name(name),
+                                                    ())):
+                self._remove(entry_key)
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the cache's hit, miss and eviction counts, and size. """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._entries)}
+
+
+def _normalize_url(url: str) -> str:
+    """ Returns the form of a NationStates API URL requests compare by. """
+    return url.strip().lower().replace(" ", "_")
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """ A single request in flight, and its outcome once it lands. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests, so callers asking for the
+    same thing at the same time wait on one request and share its
+    result.
+
+    Attributes
+    ----------
+    saved : int
+        The number of requests that didn't need to be sent, as an
+        identical one was already in flight.
+    """
+
+    def __init__(self):
+        self.saved = 0
+        self._flights: dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fetch):
+        """
+        Returns the result of fetch, sharing it with every concurrent
+        call with the same key.
+
+        Parameters
+        ----------
+        key
+            What identifies the request, such as its normalized URL.
+        fetch : callable
+            Sends the request and returns its result.
+
+        Raises
+        ------
+        Exception
+            Whatever fetch raised, in every caller that shared it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.saved += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except BaseException as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self) -> dict[str, int]:
+        """ Returns how many requests were saved, and how many in flight. """
+        with self._lock:
+            return {'saved': self.saved, 'in_flight': len(self._flights)}
+
+
+def _check_config():
+    """ Raises a ValueError if the nation or region isn't configured. """
+    nation = config.Config['Core']['NS_Nation']
+    region = config.Config['Core']['NS_Region']
+
+    nation_conf = nation.lower() == "unknown"
+    nation_conf = nation_conf or not bool(nation)
+    region_conf = region.lower() == "unknown"
+    region_conf = region_conf or not bool(region)
+
+    if nation_conf:
+        raise ValueError("You MUST provide a Nation!")
+    if region_conf:
+        raise ValueError("You MUST provide a Region!")
+
+
+class _NSRequests:
+    """
+    The URLs and response parsing shared between the blocking and the
+    asyncio NationStates clients.
 
     Attributes
     ----------
@@ -111,76 +1003,62 @@ class NS:
     ns_nation_url = "https://www.nationstates.net/cgi-bin/api.cgi?nation="
     ns_world_url = "https://www.nationstates.net/cgi-bin/api.cgi?q="
 
-    def __init__(self, limiter, logger=logging.getLogger("NS")):
-        self.limiter = limiter
-        self.log = logger
-
-        nation = config.Config['Core']['NS_Nation']
-        region = config.Config['Core']['NS_Region']
+    def _nation_url(self, nation_name: str,
+                    shards: Optional[Iterable[str]] = None) -> str:
+        url = '{}{nation}'.format(self.ns_nation_url, nation=nation_name)
+        if shards is not None:
+            url = '{}&q={}'.format(url, '+'.join(shards))
+        return url
 
-        nation_conf = nation.lower() == "unknown"
-        nation_conf = nation_conf or not bool(nation)
-        region_conf = region.lower() == "unknown"
-        region_conf = region_conf or not bool(region)
+    def _combined_url(self, nation: str, shards: Iterable[str],
+                      region: Optional[str] = None) -> str:
+        shards = [shard for shard in shards if shard != 'tgcanrecruit']
+        url = self._nation_url(nation.replace(" ", "_"),
+                               shards + ['tgcanrecruit'])
+        if region is not None:
+            url = "{};region={region}".format(url, region=region)
+        return url
 
-        if nation_conf:
-            raise ValueError("You MUST provide a Nation!")
-        if region_conf:
-            raise ValueError("You MUST provide a Region!")
+    def _recruitable_url(self, nation: str,
+                         region: Optional[str] = None) -> str:
+        nation = nation.replace(" ", "_")
+        query = '&q=tgcanrecruit'
+        if region is not None:
+            query = "{};region={region}".format(query, region=region)
+        return '{}{nation}{query}'.format(self.ns_nation_url,
+                                          nation=nation,
+                                          query=query)
 
-    def _send_request(self, url):
-        """ Actually sends the request and returns the raw stuff. """
-        self.limiter.check()
-        url = url.replace(" ", "_")
-        user_agent = ("Ellis v{} - written by Dusandria Founder (Chanku#4372),"
-                      "request for {} on behalf of {}"
-                      ).format(VER,
-                               config.Config['Core']['NS_Nation'],
-                               config.Config['Core']['NS_Region'])
-        request = urllib.request.Request(url,
-                                         headers={'User-Agent': user_agent})
-        with urllib.request.urlopen(request) as request:
-            return request.read().decode('utf-8')
-
-    def get_nation_xml(self, nation_name: str) -> str:
-        """ Sends a Request to get the raw XML of a nation """
-        return self._send_request('{}{nation}'.format(self.ns_nation_url,
-                                                      nation=nation_name))
+    def _foundings_url(self, since_id: Optional[int] = None) -> str:
+        url = '{}happenings;filter=founding'.format(self.ns_world_url)
+        if since_id is not None:
+            url = '{};sinceid={}'.format(url, since_id)
+        return url
 
-    def get_nation(self, nation_name: str) -> dict[str, str]:
-        """ Returns a Dictionary-Like Object of a nation. """
-        nation_name = nation_name.replace(" ", "_")
-        nation_xml = self.get_nation_xml(nation_name)
-        nation_root = ElementTree.fromstring(nation_xml)
-        parsed_nation = self._parse_element(nation_root)
+    @staticmethod
+    def _parse_nation(nation_xml: str,
+                      fields: Optional[Iterable[str]] = None) -> dict:
+        parsed_nation = parse_xml(nation_xml, fields)
         try:
             return parsed_nation['nation']
         except KeyError:
             return parsed_nation
 
     def _parse_element(self, tree):
+        """ Parses an already built tree, in the same way as parse_xml. """
         if len(tree) == 0:  # pylint: disable=no-else-return
             return {tree.tag.lower(): tree.text}
         else:
-            new_dict = {}
+            new_dict: dict = {}
             for child in tree:
-                new_dict.update(self._parse_element(child))
+                ((tag, value),) = self._parse_element(child).items()
+                _add_value(new_dict, tag, value)
             return {tree.tag.lower(): new_dict}
 
-    def get_nation_recruitable(self, nation: str,
-                               region: Optional[str] = None) -> bool:
-        """ Sends a Request and returns True if it is able to be sent
-        a recruitment TG, and False if it is not. A region is optional,
-        and will add that into the query"""
-        nation = nation.replace(" ", "_")
-        query = '&q=tgcanrecruit'
-        if region is not None:
-            query = "{};region={region}".format(nation, region=region)
-        response = self._send_request(('{}{nation}{query}'
-                                       ).format(self.ns_nation_url,
-                                                nation=nation,
-                                                query=query))
-        response = self._parse_element(ElementTree.fromstring(response))
+    @staticmethod
+    def _parse_recruitable(response: Union[str, dict]) -> bool:
+        if not isinstance(response, dict):
+            response = parse_xml(response, ('tgcanrecruit',))
         can_recruit = response['nation']['tgcanrecruit']
         if can_recruit == "1":  # pylint: disable=no-else-return
             return True
@@ -189,21 +1067,188 @@ class NS:
         else:
             raise SyntaxError("UNKNOWN RESPONSE: {}".format(response))
 
-    def get_foundings(self):
-        """ Requests a list of recent foundings from NationStates, and
-        then returns a Dictionary of Recent Foundings. """
-        foundings_xml = self._send_request(('{}happenings;filter=founding'
-                                            ).format(self.ns_world_url))
-        hapenings_root = ElementTree.fromstring(foundings_xml)[0]
-        foundings = []
-        for founding in hapenings_root:
-            timestamp = founding[0].text
-            nation = founding[1].text.split("@@")[1]
-            region = founding[1].text.split("%%")[1]
-            foundings.append({'name': nation,
-                              'founding_region': region,
-                              'founded_at': timestamp})
-        return foundings
+    def _parse_combined(self, response: str) -> tuple[dict, bool]:
+        parsed = parse_xml(response)
+        recruitable = self._parse_recruitable(parsed)
+        nation = parsed['nation']
+        del nation['tgcanrecruit']
+        return nation, recruitable
+
+    @staticmethod
+    def _parse_foundings(foundings_xml: str) -> list[dict]:
+        parser = ElementTree.XMLParser(target=_FoundingsTarget())
+        parser.feed(foundings_xml)
+        return parser.close()
+
+
+class NS(_NSRequests):
+    """
+    An object repesenting state and all necessary information needed
+    for calling the NationStates API.
+
+    Parameters
+    ----------
+    limiter : Limiter
+        The NationStates API Limiter.
+    logger : logging.Logger
+        A logging object, By default it is the "NS" Logger.
+    pool : ConnectionPool
+        The connections to send requests over, by default it is the
+        shared connections pool.
+    cache : Cache
+        The cache of lookups, by default it is the shared cache.
+    flights : SingleFlight
+        The requests in flight, by default it is the shared one.
+
+    See Also
+    --------
+    ellis.async_ns.AsyncNS : The asyncio NationStates Request Object
+    """
+
+    def __init__(self, limiter, logger=logging.getLogger("NS"), pool=None,
+                 cache=None, flights=None):
+        # pylint: disable=too-many-arguments
+        self.limiter = limiter
+        self.log = logger
+        self.pool = pool if pool is not None else connections
+        self.cache = cache if cache is not None else lookups
+        self.flights = flights if flights is not None else in_flight
+        _check_config()
+
+    def _cached(self, kind: str, nation: str, key, url: str, fetch):
+        """
+        Returns a cached lookup, or fetches and caches it. Concurrent
+        fetches of the same lookup share a single request.
+        """
+        name = normalize_name(nation)
+        found, value = self.cache.get(kind, name, key)
+        if found:
+            return value
+        try:
+            value = self.flights.do((kind, _normalize_url(url), key), fetch)
+        except urllib.error.HTTPError as ex:
+            if ex.code == 404:
+                self.cache.put_missing(name, ex.url)
+            raise
+        self.cache.put(kind, name, value, key)
+        return value
+
+    def _send_request(self, url):
+        """ Actually sends the request and returns the raw stuff. """
+        self.limiter.check()
+        url = url.replace(" ", "_")
+        response = self.pool.request(url, {'User-Agent': _user_agent()})
+        return response.decode('utf-8')
+
+    def get_nation_xml(self, nation_name: str,
+                       shards: Optional[Iterable[str]] = None) -> str:
+        """ Sends a Request to get the raw XML of a nation """
+        return self._send_request(self._nation_url(nation_name, shards))
+
+    def get_nation(self, nation_name: str,
+                   fields: Optional[Iterable[str]] = None,
+                   shards: Optional[Iterable[str]] = None) -> dict:
+        """
+        Returns a Dictionary-Like Object of a nation.
+
+        Parameters
+        ----------
+        nation_name : str
+            The name of the nation.
+        fields : iterable
+            If given, parsing stops once all of these fields are seen,
+            and fields after them may be missing.
+        shards : iterable
+            If given, only these shards are requested from NationStates,
+            instead of the default set.
+        """
+        nation_name = nation_name.replace(" ", "_")
+        if shards is not None:
+            shards = tuple(shards)
+        if fields is not None:
+            fields = tuple(fields)
+        url = self._nation_url(nation_name, shards)
+        return dict(self._cached('nation', nation_name, (shards, fields), url,
+                                 lambda: self._parse_nation(
+                                     self.get_nation_xml(nation_name,
+                                                         shards),
+                                     fields)))
+
+    def get_nation_and_recruitable(self, nation: str,
+                                   shards: Iterable[str],
+                                   region: Optional[str] = None
+                                   ) -> tuple[dict, bool]:
+        """
+        Fetches the given shards of a nation, and whether or not it can
+        be sent a recruitment TG, in a single request.
+
+        Parameters
+        ----------
+        nation : str
+            The name of the nation.
+        shards : iterable
+            The shards of the nation to fetch.
+        region : str
+            The region recruiting, as in get_nation_recruitable.
+
+        Returns
+        -------
+        The nation's shards, and True if it is recruitable or False if
+        not.
+
+        See Also
+        --------
+        get_nation : Fetches a nation.
+        get_nation_recruitable : Fetches only whether it's recruitable.
+        """
+        shards = tuple(shards)
+        name = normalize_name(nation)
+        found, nation_info = self.cache.get('nation', name, (shards, None))
+        if found:
+            found, recruitable = self.cache.get('recruitable', name, region)
+            if found:
+                return dict(nation_info), recruitable  # type: ignore
+        url = self._combined_url(nation, list(shards), region)
+        try:
+            nation_info, recruitable = self.flights.do(
+                ('combined', _normalize_url(url), None),
+                lambda: self._parse_combined(self._send_request(url)))
+        except urllib.error.HTTPError as ex:
+            if ex.code == 404:
+                self.cache.put_missing(name, ex.url)
+            raise
+        self.cache.put('nation', name, nation_info, (shards, None))
+        self.cache.put('recruitable', name, recruitable, region)
+        return dict(nation_info), recruitable
+
+    def get_nation_recruitable(self, nation: str,
+                               region: Optional[str] = None) -> bool:
+        """ Sends a Request and returns True if it is able to be sent
+        a recruitment TG, and False if it is not. A region is optional,
+        and will add that into the query"""
+        url = self._recruitable_url(nation, region)
+        return self._cached('recruitable', nation, region, url,
+                            lambda: self._parse_recruitable(
+                                self._send_request(url)))
+
+    def get_foundings(self, since_id: Optional[int] = None) -> list[dict]:
+        """
+        Requests a list of recent foundings from NationStates, and
+        then returns a Dictionary of Recent Foundings.
+
+        Parameters
+        ----------
+        since_id : int
+            If given, only foundings with a happening ID after it are
+            returned.
+
+        Returns
+        -------
+        A list of the foundings, each with its name, founding_region,
+        founded_at and, if NationStates provided it, its event_id.
+        """
+        return self._parse_foundings(
+            self._send_request(self._foundings_url(since_id)))
 
 
 class NS_Telegram():  # pylint: disable=C0103,R0903
@@ -221,6 +1266,9 @@ class NS_Telegram():  # pylint: disable=C0103,R0903
         The Telegram Key for the Telegram you wish to send.
     api_key : str
         The Unique API Key to send a telegram.
+    pool : ConnectionPool
+        The connections to send requests over, by default it is the
+        shared connections pool.
 
     Attributes
     ----------
@@ -231,50 +1279,39 @@ class NS_Telegram():  # pylint: disable=C0103,R0903
     See Also
     --------
     NS : The NationStates Request Object
+    ellis.async_ns.AsyncNS_Telegram : The asyncio Telegram Object
     """
 
     ns_tg_url = ('https://www.nationstates.net/cgi-bin/'
                  'api.cgi?a=sendTG&client={client}&tgid={tgid}&key={key}&to='
                  )
 
-    def __init__(self, limiter, tgid, tg_key, api_key):
+    def __init__(self, limiter, tgid, tg_key, api_key, pool=None):
+        # pylint: disable=too-many-arguments
         self.ns_tg_url = self.ns_tg_url.format(client=api_key,
                                                tgid=tgid,
                                                key=tg_key)
         self.limiter = limiter
-
-        nation = config.Config['Core']['NS_Nation']
-        region = config.Config['Core']['NS_Region']
-
-        nation_conf = nation.lower() == "unknown"
-        nation_conf = nation_conf or not bool(nation)
-        region_conf = region.lower() == "unknown"
-        region_conf = region_conf or not bool(region)
-
-        if nation_conf:
-            raise ValueError("You MUST provide a Nation!")
-        if region_conf:
-            raise ValueError("You MUST provide a Region!")
-
+        self.pool = pool if pool is not None else connections
+        _check_config()
 
     def send_telegram(self, recipient):
         """ Send a Recruitment Telegram to Recipient. """
         recipient = recipient.replace(" ", "_")
         self._send_request('{}{}'.format(self.ns_tg_url, recipient))
+        # Whether or not they can be recruited has likely just changed.
+        lookups.invalidate(recipient)
 
     def _send_request(self, url):
         """ Actually sends the request and returns the raw stuff. """
         self.limiter.check_tg()
         url = url.replace(' ', "_")
-        user_agent = ("Ellis v{} - written by Dusandria Founder (Chanku#4372),"
-                      "request for {} on behalf of {}"
-                      ).format(VER,
-                               config.Config['Core']['NS_Nation'],
-                               config.Config['Core']['NS_Region'])
-        request = urllib.request.Request(url,
-                                         headers={'User-Agent': user_agent})
-        with urllib.request.urlopen(request) as request:
-            return request.read().decode('utf-8')
+        response = self.pool.request(url, {'User-Agent': _user_agent()})
+        return response.decode('utf-8')
 
 
 limit = Limiter()
+scheduler = Scheduler(limit)
+connections = ConnectionPool()
+lookups = Cache()
+in_flight = SingleFlight()
@@ -0,0 +1,347 @@
+"""
+This provides the pool of nations Ellis keeps track of.
+"""
+
+import time
+import heapq
+import itertools
+import contextlib
+from typing import Iterable, Optional
+
+from ellis import ns, recruited as recruited_index
+
+
+AVAILABLE = 'available'
+RENTED = 'rented'
+RECRUITED = 'recruited'
+STATES = (AVAILABLE, RENTED, RECRUITED)
+
+
+class NationPool:
+    """
+    Every nation Ellis knows of, keyed on its normalized name, and in
+    exactly one state: available to be handed out, rented out to a
+    client, or recruited.
+
+    Available nations are handed out most recently founded first, and
+    once they are older than max_age they are moved to recruited in
+    bulk by expire. Rented and recruited state changes are O(1), those
+    into or out of available are O(log n), and a nation that is already
+    known is never added again.
+
+    Recruited nations are only kept in a compact index of their names,
+    their full records are written to the archive, if there is one.
+
+    The pool doesn't lock itself, ns.lock should be held around it.
+
+    This is the in-memory pool, sqlite_pool.SQLitePool keeps the same
+    interface in a database instead.
+
+    Parameters
+    ----------
+    available : Iterable
+        The nations available to be handed out.
+    rented : Iterable
+        The nations currently rented out to clients.
+    recruited : Iterable
+        The nations that have been recruited, or are otherwise
+        unavailable.
+    max_age : float
+        How long, in seconds, after its founding a nation may be handed
+        out. By default nations never expire.
+
+    Attributes
+    ----------
+    expired : int
+        The number of nations expire has moved to recruited.
+    journal : journal.Journal
+        Where every change of state is recorded, if anywhere.
+    archive : recruited.RecruitedArchive
+        Where the records of recruited nations are kept, if anywhere.
+    recruited : recruited.RecruitedIndex
+        The names of the recruited nations.
+
+    Notes
+    -----
+    Should a nation be given in more than one state, recruited wins over
+    rented, and rented wins over available.
+
+    A nation without a 'founded_at' timestamp is treated as if it had
+    been founded when it was made available.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, available: Iterable[dict] = (),
+                 rented: Iterable[dict] = (),
+                 recruited: Iterable[dict] = (),
+                 max_age: Optional[float] = None):
+        self.max_age = max_age
+        self.expired = 0
+        self.journal = None
+        self.archive = None
+        self.recruited = recruited_index.RecruitedIndex()
+        self._nations: dict[str, dict[str, dict]] = {
+            AVAILABLE: {},
+            RENTED: {}}
+        self._states: dict[str, str] = {}
+        # The available nations are indexed by two heaps, newest and
+        # oldest first. Entries are left behind when a nation stops
+        # being available, and are skipped as long as their sequence
+        # number no longer matches the nation's.
+        self._sequence: dict[str, int] = {}
+        self._newest: list[tuple[float, int, str]] = []
+        self._oldest: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        for (state, nations) in ((RECRUITED, recruited), (RENTED, rented),
+                                 (AVAILABLE, available)):
+            for nation in nations:
+                self.add(nation, state)
+
+    @staticmethod
+    def key(nation) -> str:
+        """ Returns the key for a nation, or the name of one. """
+        if isinstance(nation, dict):
+            nation = nation['name']
+        return ns.normalize_name(nation)
+
+    def __contains__(self, nation) -> bool:
+        key = self.key(nation)
+        return key in self._states or key in self.recruited
+
+    def __len__(self) -> int:
+        return len(self._states) + len(self.recruited)
+
+    def known(self, names: Iterable[str]) -> set[str]:
+        """ Returns the keys of those of the names already in the pool. """
+        return {key for key in map(self.key, names) if key in self}
+
+    def state(self, nation) -> str:
+        """
+        Returns the state of a nation.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool.
+        """
+        key = self.key(nation)
+        try:
+            return self._states[key]
+        except KeyError:
+            if key in self.recruited:
+                return RECRUITED
+            raise
+
+    def get(self, nation) -> dict:
+        """
+        Returns the nation stored in the pool for a nation or name.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool, or has been recruited.
+        """
+        key = self.key(nation)
+        return self._nations[self._states[key]][key]
+
+    def count(self, state: str = AVAILABLE) -> int:
+        """ Returns the number of nations in a state. """
+        if state == RECRUITED:
+            return len(self.recruited)
+        return len(self._nations[state])
+
+    def nations(self, state: str = AVAILABLE) -> list[dict]:
+        """
+        Returns the nations in a state. Only the names of recruited
+        nations are kept, so there are never any to return for them.
+        """
+        if state == RECRUITED:
+            return []
+        return list(self._nations[state].values())
+
+    @staticmethod
+    def founded_at(nation: dict) -> float:
+        """ Returns when a nation was founded, or the time if unknown. """
+        try:
+            return float(nation['founded_at'])
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+
+    def _place(self, key: str, nation: dict, state: str, new: bool = False):
+        if state == RECRUITED:
+            self.recruited.add(key)
+            if self.archive is not None:
+                self.archive.write(nation)
+        else:
+            self._nations[state][key] = nation
+            self._states[key] = state
+        if self.journal is not None:
+            if new:
+                self.journal.record_add(nation, state)
+            else:
+                self.journal.record_move(key, state)
+        if state != AVAILABLE:
+            return
+        founded_at = self.founded_at(nation)
+        sequence = next(self._counter)
+        self._sequence[key] = sequence
+        heapq.heappush(self._newest, (-founded_at, sequence, key))
+        heapq.heappush(self._oldest, (founded_at, sequence, key))
+
+    def _unplace(self, key: str) -> dict:
+        state = self._states.pop(key)
+        if state == AVAILABLE:
+            del self._sequence[key]
+            if (max(len(self._newest), len(self._oldest))
+                    > 2 * len(self._sequence) + 64):
+                self._compact()
+        return self._nations[state].pop(key)
+
+    def _compact(self):
+        """ Drops the heap entries of nations that aren't available. """
+        for heap in (self._newest, self._oldest):
+            heap[:] = [entry for entry in heap
+                       if self._sequence.get(entry[2]) == entry[1]]
+            heapq.heapify(heap)
+
+    def add(self, nation: dict, state: str = AVAILABLE) -> bool:
+        """
+        Adds a nation the pool doesn't know of yet.
+
+        Returns
+        -------
+        True if the nation was added, and False if it was already known.
+        """
+        key = self.key(nation)
+        if key in self._states or key in self.recruited:
+            return False
+        self._place(key, nation, state, new=True)
+        return True
+
+    def extend(self, nations: Iterable[dict],
+               state: str = AVAILABLE) -> list[dict]:
+        """ Adds several nations, and returns those that were new. """
+        return [nation for nation in nations if self.add(nation, state)]
+
+    def checkout(self) -> dict:
+        """
+        Rents out the most recently founded available nation.
+
+        Raises
+        ------
+        KeyError
+            If no nations are available.
+        """
+        while self._newest:
+            _, sequence, key = heapq.heappop(self._newest)
+            if self._sequence.get(key) == sequence:
+                nation = self._unplace(key)
+                self._place(key, nation, RENTED)
+                return nation
+        raise KeyError("No nations are available")
+
+    def expire(self, now: Optional[float] = None) -> list[dict]:
+        """
+        Moves every available nation older than max_age to recruited.
+
+        Parameters
+        ----------
+        now : float
+            The current time, by default time.time().
+
+        Returns
+        -------
+        The nations that expired.
+        """
+        if self.max_age is None:
+            return []
+        cutoff = (time.time() if now is None else now) - self.max_age
+        expired = []
+        while self._oldest and self._oldest[0][0] < cutoff:
+            _, sequence, key = heapq.heappop(self._oldest)
+            if self._sequence.get(key) == sequence:
+                nation = self._unplace(key)
+                self._place(key, nation, RECRUITED)
+                expired.append(nation)
+        self.expired += len(expired)
+        return expired
+
+    def move(self, nation, state: str, from_state=None) -> dict:
+        """
+        Moves a nation to a new state.
+
+        Parameters
+        ----------
+        nation : dict or str
+            The nation, or its name.
+        state : str
+            The state to move it to.
+        from_state : str
+            The state it must be in, by default any.
+
+        Returns
+        -------
+        The nation stored in the pool, or just its name if it had already
+        been recruited.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool, or isn't in from_state. Or
+            if it has been recruited, and is being moved out of it.
+        """
+        key = self.key(nation)
+        current = self.state(key)
+        if from_state is not None and current != from_state:
+            raise KeyError("{} is {}, not {}".format(key, current,
+                                                     from_state))
+        if current == RECRUITED:
+            if state != RECRUITED:
+                raise KeyError("{} has been recruited".format(key))
+            return {'name': key}
+        stored = self._unplace(key)
+        self._place(key, stored, state)
+        return stored
+
+    def release(self, nation) -> dict:
+        """ Makes a rented nation available again. """
+        return self.move(nation, AVAILABLE, RENTED)
+
+    def recruit(self, nation) -> dict:
+        """ Marks a nation as recruited. """
+        return self.move(nation, RECRUITED)
+
+    def drop(self, nations: Iterable[dict]) -> list[dict]:
+        """
+        Moves those of the nations that are still available to recruited,
+        and returns them.
+        """
+        dropped = []
+        for nation in nations:
+            key = self.key(nation)
+            if self._states.get(key) == AVAILABLE:
+                dropped.append(self.move(key, RECRUITED))
+        return dropped
+
+    def save(self, nation: dict):
+        """ Stores the latest information about a nation in the pool. """
+        key = self.key(nation)
+        if key in self._states:
+            self._nations[self._states[key]][key] = nation
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Groups the changes made within it, a no-op in memory. """
+        yield self
+
+    def close(self):
+        """ Closes the archive, if there is one. """
+        if self.archive is not None:
+            self.archive.close()
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the number of nations in each state. """
+        stats = {state: self.count(state) for state in STATES}
+        stats['expired'] = self.expired
+        return stats
@@ -0,0 +1,459 @@
+"""
+This provides the framing of messages sent over the Ellis Protocol.
+
+Protocol 1 has no framing, whatever a single read returns is taken to be
+one message. A client asks for protocol 2 by sending::
+
+    PROTOCOL 2 LINE\\n
+
+or ``PROTOCOL 2 LENGTH\\n`` as its first message. From then on, in both
+directions, LINE messages are each terminated by a newline, and LENGTH
+messages are each prefixed by their length, as a 4-byte big-endian
+unsigned integer.
+
+Responses are JSON by default, a LENGTH framed connection may instead
+ask for them in MessagePack, with ``PROTOCOL 2 LENGTH MSGPACK``.
+Commands are always sent as UTF-8 text.
+
+Whatever the protocol, a client may ask for only some of each nation's
+fields, for the connection with FIELDS, or for a single GET.
+"""
+
+import json
+import socket
+import struct
+import threading
+import collections
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from ellis import binary
+
+
+VERSION = 2
+LEGACY = 'LEGACY'
+LINE = 'LINE'
+LENGTH = 'LENGTH'
+FRAMINGS = (LINE, LENGTH)
+JSON = 'JSON'
+MSGPACK = 'MSGPACK'
+ENCODINGS = (JSON, MSGPACK)
+
+# The longest message either side may send.
+MAX_MESSAGE = 16 * 1024 * 1024
+
+_HEADER = struct.Struct('>I')
+_NEGOTIATE = b'protocol '
+_RAW_JSON = json.JSONDecoder()
+
+
+class ProtocolError(ValueError):
+    """ Raised when the other side doesn't follow the protocol. """
+
+
+def encode(message: Union[str, bytes], framing: str) -> bytes:
+    """ Returns a message framed to be sent. """
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    if framing == LINE:
+        if b'\n' in message:
+            raise ProtocolError("A LINE message can't hold a newline")
+        return message + b'\n'
+    if framing == LENGTH:
+        return _HEADER.pack(len(message)) + message
+    return message
+
+
+def dumps(obj: Any, encoding: str = JSON) -> Union[str, bytes]:
+    """ Returns a response encoded, as a str for JSON. """
+    if encoding == MSGPACK:
+        return binary.packb(obj)
+    return json.dumps(obj)
+
+
+def loads(message: Union[str, bytes], encoding: str = JSON) -> Any:
+    """ Returns the response a message holds. """
+    if encoding == MSGPACK:
+        return binary.unpackb(message)
+    return json.loads(message)
+
+
+def join(items: list, encoding: str = JSON) -> Union[str, bytes]:
+    """ Returns an array of already encoded items. """
+    if encoding == MSGPACK:
+        return binary.array_header(len(items)) + b''.join(items)
+    return '[{}]'.format(', '.join(items))
+
+
+def end(encoding: str = JSON) -> Union[str, bytes]:
+    """ Returns the END command, as it is sent in an encoding. """
+    return binary.packb('END') if encoding == MSGPACK else 'END'
+
+
+def negotiation(framing: str, encoding: str = JSON) -> bytes:
+    """ Returns the message a client sends to switch to a framing. """
+    if encoding == JSON:
+        return 'PROTOCOL {} {}\n'.format(VERSION, framing).encode('utf-8')
+    return 'PROTOCOL {} {} {}\n'.format(VERSION, framing,
+                                        encoding).encode('utf-8')
+
+
+def parse_negotiation(message: str) -> tuple[str, str]:
+    """
+    Returns the framing and encoding a PROTOCOL message asks for.
+
+    Raises
+    ------
+    ProtocolError
+        If the version, framing or encoding isn't supported.
+    """
+    try:
+        _, version, framing, *encoding = message.split()
+        version = int(version)
+    except ValueError as ex:
+        raise ProtocolError("Expected PROTOCOL version framing") from ex
+    framing = framing.upper()
+    encoding = encoding[0].upper() if len(encoding) == 1 else (
+        JSON if not encoding else 'unknown')
+    if version != VERSION or framing not in FRAMINGS:
+        raise ProtocolError("Protocol {} {} isn't supported".format(
+            version, framing))
+    if encoding not in ENCODINGS:
+        raise ProtocolError("Encoding {} isn't supported".format(encoding))
+    if encoding == MSGPACK and framing != LENGTH:
+        raise ProtocolError("MSGPACK needs LENGTH framing")
+    return framing, encoding
+
+
+def parse_fields(argument: str) -> Optional[tuple[str, ...]]:
+    """
+    Returns the fields a FIELDS command or GET asks for, always starting
+    with the name, or None if it asks for every field.
+
+    Parameters
+    ----------
+    argument : str
+        A JSON array of field names, or null or nothing for every field.
+
+    Raises
+    ------
+    ValueError
+        If the argument isn't an array of field names.
+    """
+    fields = json.loads(argument) if argument.strip() else None
+    if fields is None:
+        return None
+    if not isinstance(fields, list) or not all(isinstance(field, str)
+                                               for field in fields):
+        raise ValueError("Expected a list of field names")
+    return tuple(dict.fromkeys(['name'] + fields))
+
+
+def project(nation: dict, fields: Optional[tuple[str, ...]]) -> dict:
+    """ Returns the view of a nation holding only the fields it has. """
+    if fields is None:
+        return nation
+    return {field: nation[field] for field in fields if field in nation}
+
+
+class EncodeCache:
+    """
+    The encoded forms of recently handed out nations, so a nation that
+    comes back and goes out again isn't encoded again, unless it has
+    changed.
+
+    Nations projected to some of their fields are cached apart from the
+    whole nation, along with their projected view, so only the fields
+    sent are compared to see if they changed.
+
+    Parameters
+    ----------
+    size : int
+        The most encoded nations kept.
+
+    Attributes
+    ----------
+    hits : int
+        The number of times an encoding was reused.
+    misses : int
+        The number of times a nation had to be encoded.
+    """
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, key: str, nation: dict, encoding: str = JSON,
+               fields: Optional[tuple[str, ...]] = None
+               ) -> Union[str, bytes]:
+        """
+        Returns the nation, whose key in the pool is key, encoded. Only
+        the fields given are encoded, if any are.
+        """
+        view = project(nation, fields)
+        cache_key = (key, encoding, fields)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == view:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+        encoded = dumps(view, encoding)
+        with self._lock:
+            self.misses += 1
+            self._entries[cache_key] = (dict(view) if fields is None
+                                        else view, encoded)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return encoded
+
+    def encode_all(self, keys: Iterable[str], nations: list[dict],
+                   encoding: str = JSON,
+                   fields: Optional[tuple[str, ...]] = None
+                   ) -> Union[str, bytes]:
+        """ Returns the nations encoded as an array. """
+        return join([self.encode(key, nation, encoding, fields)
+                     for (key, nation) in zip(keys, nations)], encoding)
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the hits and misses, and how many are cached. """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries)}
+
+
+def is_negotiation(message: str) -> bool:
+    """ Returns True if the message is a PROTOCOL message. """
+    return message[:len(_NEGOTIATE)].lower() == _NEGOTIATE.decode()
+
+
+class Decoder:
+    """
+    Reads messages out of a stream of bytes, into a single reusable
+    buffer.
+
+    Parameters
+    ----------
+    framing : str
+        How messages are framed, LEGACY, LINE or LENGTH. It may be
+        changed between messages.
+    size : int
+        The starting size of the buffer, it grows to fit the longest
+        message.
+    max_message : int
+        The longest message that may be read.
+    encoding : str
+        How the connection's responses are encoded, JSON or MSGPACK. It
+        is negotiated along with the framing, though it isn't used to
+        read commands.
+
+    Notes
+    -----
+    Reads go straight into the free end of the buffer, and messages are
+    copied out of it once, when they are complete.
+    """
+
+    def __init__(self, framing: str = LEGACY, size: int = 4096,
+                 max_message: int = MAX_MESSAGE, encoding: str = JSON):
+        # pylint: disable=too-many-arguments
+        self.framing = framing
+        self.encoding = encoding
+        self.max_message = max_message
+        self._buffer = bytearray(size)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        """ The number of bytes buffered, and not yet read as messages. """
+        return self._end - self._start
+
+    def _make_room(self, needed: int = 1024):
+        if self._start == self._end:
+            self._start = self._end = 0
+        if len(self._buffer) - self._end >= needed:
+            return
+        if self._start:
+            length = len(self)
+            self._buffer[:length] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, length
+        if len(self._buffer) - self._end < needed:
+            self._buffer.extend(bytes(max(len(self._buffer),
+                                          needed)))
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """
+        Reads whatever the socket has into the buffer.
+
+        Returns
+        -------
+        The number of bytes read, 0 if the socket was closed.
+
+        Raises
+        ------
+        BlockingIOError
+            If the socket is non-blocking, and has nothing to read.
+        """
+        self._make_room()
+        with memoryview(self._buffer) as view, view[self._end:] as free:
+            received = sock.recv_into(free)
+        self._end += received
+        return received
+
+    def feed(self, data: bytes):
+        """ Adds bytes read some other way to the buffer. """
+        self._make_room(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def _take(self, start: int, end: int, resume: int) -> bytes:
+        with memoryview(self._buffer) as view:
+            message = view[start:end].tobytes()
+        self._start = resume
+        return message
+
+    def _next(self) -> Optional[bytes]:
+        start, end = self._start, self._end
+        if start == end:
+            return None
+        if self.framing == LENGTH:
+            if end - start < _HEADER.size:
+                return None
+            (length,) = _HEADER.unpack_from(self._buffer, start)
+            if length > self.max_message:
+                raise ProtocolError("A {} byte message is too long".format(
+                    length))
+            start += _HEADER.size
+            if end - start < length:
+                return None
+            return self._take(start, start + length, start + length)
+        negotiating = (self.framing == LEGACY and
+                       self._buffer[start:start + len(_NEGOTIATE)].lower()
+                       == _NEGOTIATE)
+        if self.framing == LINE or negotiating:
+            newline = self._buffer.find(b'\n', start, end)
+            if newline >= 0:
+                line_end = newline
+                if line_end > start and self._buffer[line_end - 1] == 13:
+                    line_end -= 1
+                return self._take(start, line_end, newline + 1)
+            if end - start > self.max_message:
+                raise ProtocolError("A line is too long")
+            if self.framing == LINE or end - start < 64:
+                return None
+        # Protocol 1 takes everything read as one message.
+        return self._take(start, end, end)
+
+    def messages(self) -> Iterator[bytes]:
+        """
+        Yields each complete message in the buffer. The framing may be
+        changed between messages, and the rest are read with it.
+
+        Raises
+        ------
+        ProtocolError
+            If a message is too long.
+        """
+        while True:
+            message = self._next()
+            if message is None:
+                return
+            yield message
+
+
+class Connection:
+    """
+    A client's connection to an Ellis server, over protocol 2. Commands
+    may be pipelined, as the answers come back in the order they were
+    sent.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected socket.
+    framing : str
+        The framing to ask for, LINE or LENGTH.
+    encoding : str
+        The encoding to ask for, JSON or MSGPACK.
+    """
+
+    def __init__(self, sock: socket.socket, framing: str = LINE,
+                 encoding: str = JSON):
+        self.sock = sock
+        self.framing = framing
+        self.encoding = encoding
+        self._decoder = Decoder(LEGACY)
+
+    def negotiate(self):
+        """
+        Asks the server for protocol 2.
+
+        Raises
+        ------
+        ProtocolError
+            If the server doesn't support it.
+        """
+        self.sock.sendall(negotiation(self.framing, self.encoding))
+        # A server that refuses answers with a bare JSON object, before
+        # any framing, so the framing is only switched once it agrees.
+        received = b''
+        while True:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionResetError("Ellis closed the connection")
+            received += chunk
+            if not received.startswith(b'{'):
+                break
+            try:
+                reply, _ = _RAW_JSON.raw_decode(received.decode('utf-8'))
+            except ValueError:
+                continue  # It isn't all here yet.
+            if not isinstance(reply, dict) or reply.get('protocol') != VERSION:
+                raise ProtocolError("The server doesn't support protocol "
+                                    "{}".format(VERSION))
+            break
+        self._decoder.framing = self.framing
+        self._decoder.feed(received)
+        try:
+            reply = self.receive_value()
+        except ValueError as ex:
+            raise ProtocolError("The server doesn't support protocol "
+                                "{}".format(VERSION)) from ex
+        if not isinstance(reply, dict) or reply.get('protocol') != VERSION:
+            raise ProtocolError("The server doesn't support protocol "
+                                "{}".format(VERSION))
+
+    def send(self, *commands: str):
+        """ Sends one or more commands, without waiting for answers. """
+        self.sock.sendall(b''.join(encode(command, self.framing)
+                                   for command in commands))
+
+    def receive(self) -> Union[str, bytes]:
+        """
+        Waits for the next message from the server, as a str, or bytes
+        if it is MSGPACK.
+
+        Raises
+        ------
+        ConnectionResetError
+            If the server closed the connection.
+        """
+        while True:
+            for message in self._decoder.messages():
+                if self.encoding == MSGPACK:
+                    return message
+                return message.decode('utf-8')
+            if not self._decoder.recv_into(self.sock):
+                raise ConnectionResetError("Ellis closed the connection")
+
+    def receive_value(self) -> Any:
+        """
+        Waits for the next response from the server, and decodes it. END
+        is returned as the string 'END'.
+        """
+        message = self.receive()
+        if isinstance(message, str) and message.upper() == 'END':
+            return 'END'
+        return loads(message, self.encoding)
@@ -0,0 +1,207 @@
+"""
+This provides the compact index of the nations Ellis has recruited, and
+the archive their full records are kept in.
+"""
+
+import os
+import gzip
+import json
+import heapq
+import bisect
+import hashlib
+from array import array
+from typing import Iterable
+
+
+class RecruitedIndex:
+    """
+    The nations that have been recruited, kept only as a sorted array of
+    64-bit hashes of their keys, eight bytes for each nation.
+
+    New hashes are held in a small set, and merged into the array once
+    there are enough of them to be worth it.
+
+    Parameters
+    ----------
+    keys : Iterable
+        The keys of the nations that have been recruited.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self._sorted = array('Q', sorted({self.hash(key) for key in keys}))
+        self._recent: set[int] = set()
+
+    @staticmethod
+    def hash(key: str) -> int:
+        """ Returns the hash a nation's key is indexed by. """
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'),
+                                              digest_size=8).digest(),
+                              'little')
+
+    def _in_sorted(self, hashed: int) -> bool:
+        index = bisect.bisect_left(self._sorted, hashed)
+        return index < len(self._sorted) and self._sorted[index] == hashed
+
+    def __contains__(self, key: str) -> bool:
+        hashed = self.hash(key)
+        return hashed in self._recent or self._in_sorted(hashed)
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._recent)
+
+    def add(self, key: str):
+        """ Adds a nation's key to the index. """
+        hashed = self.hash(key)
+        if hashed in self._recent or self._in_sorted(hashed):
+            return
+        self._recent.add(hashed)
+        if len(self._recent) > max(1024, len(self._sorted) // 16):
+            self._merge()
+
+    def _merge(self):
+        if self._recent:
+            self._sorted = array('Q', heapq.merge(self._sorted,
+                                                  sorted(self._recent)))
+            self._recent.clear()
+
+    def copy(self) -> 'RecruitedIndex':
+        """ Returns a copy of the index. """
+        self._merge()
+        copy = RecruitedIndex()
+        copy._sorted = array('Q', self._sorted)  # pylint: disable=W0212
+        return copy
+
+    def save(self, path: str):
+        """ Writes the index out to path, replacing it atomically. """
+        self._merge()
+        temporary = '{}.tmp'.format(path)
+        with open(temporary, 'wb') as file:
+            self._sorted.tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RecruitedIndex':
+        """ Reads in an index written by save. """
+        index = cls()
+        with open(path, 'rb') as file:
+            index._sorted.frombytes(file.read())  # pylint: disable=W0212
+        return index
+
+
+class RecruitedArchive:
+    """
+    The full records of recruited nations, appended to a gzipped file of
+    JSON lines, which is rotated once it holds max_bytes.
+
+    Parameters
+    ----------
+    path : str
+        The path of the archive being written to, rotated archives are
+        path.1, path.2 and so on, newest first.
+    max_bytes : int
+        How many bytes of records, before compression, an archive may
+        hold before it is rotated.
+    keep : int
+        How many rotated archives are kept.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024,
+                 keep: int = 10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._file = None
+        self._written = 0
+
+    def _size(self) -> int:
+        """ Returns how many bytes of records the archive holds. """
+        size = 0
+        if not os.path.exists(self.path):
+            return size
+        with gzip.open(self.path, 'rb') as file:
+            try:
+                chunk = file.read(1024 * 1024)
+                while chunk:
+                    size += len(chunk)
+                    chunk = file.read(1024 * 1024)
+            except EOFError:
+                # The archive wasn't closed, its last records are lost.
+                pass
+        return size
+
+    def open(self):
+        """
+        Opens the archive, and counts the records it already holds
+        towards max_bytes. That means reading all of it, so it shouldn't
+        be done while anything waits on the archive.
+        """
+        self.close()
+        self._written = self._size()
+        # pylint: disable=consider-using-with
+        self._file = gzip.open(self.path, 'ab')
+
+    def write(self, nation: dict):
+        """
+        Archives a nation's record, opening the archive if need be. The
+        records already in an archive are only counted if it was opened
+        with open first.
+        """
+        if self._file is None:
+            # pylint: disable=consider-using-with
+            self._file = gzip.open(self.path, 'ab')
+        record = (json.dumps(nation, separators=(',', ':')) + '\n'
+                  ).encode('utf-8')
+        self._file.write(record)
+        self._written += len(record)
+        if self._written >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """ Moves the current archive aside, and starts a new one. """
+        self.close()
+        self._written = 0
+        if not os.path.exists(self.path):
+            return
+        for number in range(self.keep, 0, -1):
+            older = '{}.{}'.format(self.path, number)
+            if number == self.keep:
+                if os.path.exists(older):
+                    os.remove(older)
+            elif os.path.exists(older):
+                os.replace(older, '{}.{}'.format(self.path, number + 1))
+        if self.keep:
+            os.replace(self.path, '{}.1'.format(self.path))
+        else:
+            os.remove(self.path)
+
+    def flush(self):
+        """ Writes out any records held in memory. """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """ Closes the archive. """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self) -> Iterable[dict]:
+        """ Yields every archived record, oldest first. """
+        self.flush()
+        paths = ['{}.{}'.format(self.path, number)
+                 for number in range(self.keep, 0, -1)] + [self.path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                try:
+                    for line in file:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+                except EOFError:
+                    # The archive is still open, or wasn't closed.
+                    continue
@@ -0,0 +1,345 @@
+"""
+This provides a nation pool kept in a SQLite database, so the nations
+Ellis has tracked don't all have to be held in memory.
+"""
+
+import json
+import time
+import sqlite3
+import contextlib
+from typing import Iterable, Optional
+
+from ellis import ns
+from ellis.pool import AVAILABLE, RECRUITED, RENTED, STATES, NationPool
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nations (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    founded_at REAL NOT NULL,
+    region TEXT,
+    changed_at REAL NOT NULL,
+    nation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nations_state_founded_at
+    ON nations (state, founded_at);
+CREATE INDEX IF NOT EXISTS nations_region_state
+    ON nations (region, state, changed_at);
+"""
+
+# SQLite can't take more variables than this in a single statement.
+_CHUNK_SIZE = 500
+
+
+class SQLitePool:
+    """
+    A nation pool kept in a SQLite database, with the same interface
+    as pool.NationPool.
+
+    Each nation is a row, with its key, state, when it was founded, its
+    region and when its state last changed indexed, so the database can
+    also be asked about the nations Ellis has seen.
+
+    Parameters
+    ----------
+    path : str
+        The path of the database, which is created if need be.
+    max_age : float
+        How long, in seconds, after its founding a nation may be handed
+        out. By default nations never expire.
+
+    Attributes
+    ----------
+    expired : int
+        The number of nations expire has moved to recruited.
+    journal : None
+        The database is durable itself, so there is never a journal.
+
+    Notes
+    -----
+    Every change is committed as it's made, unless it is made within
+    batch, which commits them all at once. Like NationPool, the pool
+    doesn't lock itself, ns.lock should be held around it.
+
+    See Also
+    --------
+    ellis.pool.NationPool : The in-memory pool.
+    """
+
+    key = staticmethod(NationPool.key)
+    founded_at = staticmethod(NationPool.founded_at)
+
+    def __init__(self, path: str, max_age: Optional[float] = None):
+        self.path = path
+        self.max_age = max_age
+        self.expired = 0
+        self.journal = None
+        self._db = sqlite3.connect(path, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Makes every change within it in a single transaction. """
+        if self._depth == 0:
+            self._db.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self._db.execute("ROLLBACK")
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self._db.execute("COMMIT")
+
+    def _query(self, sql: str, parameters=()) -> list[tuple]:
+        return self._db.execute(sql, parameters).fetchall()
+
+    def __contains__(self, nation) -> bool:
+        return bool(self._query("SELECT 1 FROM nations WHERE key = ?",
+                                (self.key(nation),)))
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM nations")[0][0]
+
+    def known(self, names: Iterable[str]) -> set[str]:
+        """ Returns the keys of those of the names already in the pool. """
+        keys = list(set(map(self.key, names)))
+        known = set()
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            chunk = keys[start:start + _CHUNK_SIZE]
+            known.update(key for (key,) in self._query(
+                "SELECT key FROM nations WHERE key IN ({})".format(
+                    ','.join('?' * len(chunk))), chunk))
+        return known
+
+    def _row(self, nation) -> tuple[str, dict]:
+        rows = self._query("SELECT state, nation FROM nations WHERE key = ?",
+                           (self.key(nation),))
+        if not rows:
+            raise KeyError(self.key(nation))
+        return rows[0][0], json.loads(rows[0][1])
+
+    def state(self, nation) -> str:
+        """
+        Returns the state of a nation.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool.
+        """
+        return self._row(nation)[0]
+
+    def get(self, nation) -> dict:
+        """
+        Returns the nation stored in the pool for a nation or name.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool.
+        """
+        return self._row(nation)[1]
+
+    def count(self, state: str = AVAILABLE, region: Optional[str] = None,
+              since: Optional[float] = None) -> int:
+        """
+        Returns the number of nations in a state.
+
+        Parameters
+        ----------
+        state : str
+            The state to count.
+        region : str
+            Only count the nations in this region.
+        since : float
+            Only count the nations that changed to the state after this
+            time, such as those recruited this week.
+        """
+        sql = "SELECT COUNT(*) FROM nations WHERE state = ?"
+        parameters: list = [state]
+        if region is not None:
+            sql += " AND region = ?"
+            parameters.append(ns.normalize_name(region))
+        if since is not None:
+            sql += " AND changed_at >= ?"
+            parameters.append(since)
+        return self._query(sql, parameters)[0][0]
+
+    def nations(self, state: str = AVAILABLE) -> list[dict]:
+        """ Returns the nations in a state. """
+        return [json.loads(row[0]) for row in
+                self._query("SELECT nation FROM nations WHERE state = ?",
+                            (state,))]
+
+    def add(self, nation: dict, state: str = AVAILABLE) -> bool:
+        """
+        Adds a nation the pool doesn't know of yet.
+
+        Returns
+        -------
+        True if the nation was added, and False if it was already known.
+        """
+        return bool(self.extend([nation], state))
+
+    def extend(self, nations: Iterable[dict],
+               state: str = AVAILABLE) -> list[dict]:
+        """ Adds several nations in one transaction, and returns those
+        that were new. """
+        new: dict[str, dict] = {}
+        for nation in nations:
+            new.setdefault(self.key(nation), nation)
+        with self.batch():
+            for key in self.known(new):
+                del new[key]
+            now = time.time()
+            self._db.executemany(
+                "INSERT INTO nations VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, state, self.founded_at(nation), self._region(nation),
+                  now, json.dumps(nation))
+                 for (key, nation) in new.items()])
+        return list(new.values())
+
+    def _set_state(self, keys: list[str], state: str):
+        self._db.executemany(
+            "UPDATE nations SET state = ?, changed_at = ? WHERE key = ?",
+            [(state, time.time(), key) for key in keys])
+
+    def checkout(self) -> dict:
+        """
+        Rents out the most recently founded available nation.
+
+        Raises
+        ------
+        KeyError
+            If no nations are available.
+        """
+        with self.batch():
+            rows = self._query("SELECT key, nation FROM nations "
+                               "WHERE state = ? "
+                               "ORDER BY founded_at DESC LIMIT 1",
+                               (AVAILABLE,))
+            if not rows:
+                raise KeyError("No nations are available")
+            self._set_state([rows[0][0]], RENTED)
+        return json.loads(rows[0][1])
+
+    def expire(self, now: Optional[float] = None) -> list[dict]:
+        """
+        Moves every available nation older than max_age to recruited.
+
+        Parameters
+        ----------
+        now : float
+            The current time, by default time.time().
+
+        Returns
+        -------
+        The nations that expired.
+        """
+        if self.max_age is None:
+            return []
+        cutoff = (time.time() if now is None else now) - self.max_age
+        with self.batch():
+            rows = self._query("SELECT key, nation FROM nations "
+                               "WHERE state = ? AND founded_at < ?",
+                               (AVAILABLE, cutoff))
+            self._set_state([row[0] for row in rows], RECRUITED)
+        self.expired += len(rows)
+        return [json.loads(row[1]) for row in rows]
+
+    def move(self, nation, state: str, from_state=None) -> dict:
+        """
+        Moves a nation to a new state.
+
+        Parameters
+        ----------
+        nation : dict or str
+            The nation, or its name.
+        state : str
+            The state to move it to.
+        from_state : str
+            The state it must be in, by default any.
+
+        Returns
+        -------
+        The nation stored in the pool.
+
+        Raises
+        ------
+        KeyError
+            If the nation isn't in the pool, or isn't in from_state.
+        """
+        with self.batch():
+            current, stored = self._row(nation)
+            if from_state is not None and current != from_state:
+                raise KeyError("{} is {}, not {}".format(self.key(nation),
+                                                         current,
+                                                         from_state))
+            self._set_state([self.key(nation)], state)
+        return stored
+
+    def release(self, nation) -> dict:
+        """ Makes a rented nation available again. """
+        return self.move(nation, AVAILABLE, RENTED)
+
+    def recruit(self, nation) -> dict:
+        """ Marks a nation as recruited. """
+        return self.move(nation, RECRUITED)
+
+    def drop(self, nations: Iterable[dict]) -> list[dict]:
+        """
+        Moves those of the nations that are still available to recruited,
+        and returns them.
+        """
+        dropped = []
+        with self.batch():
+            for nation in nations:
+                cursor = self._db.execute(
+                    "UPDATE nations SET state = ?, changed_at = ? "
+                    "WHERE key = ? AND state = ?",
+                    (RECRUITED, time.time(), self.key(nation), AVAILABLE))
+                if cursor.rowcount:
+                    dropped.append(nation)
+        return dropped
+
+    @staticmethod
+    def _region(nation: dict) -> Optional[str]:
+        """ Returns the region a nation is indexed by, if it has one. """
+        return (ns.normalize_name(nation['region'])
+                if nation.get('region') else None)
+
+    def save(self, nation: dict):
+        """
+        Stores the latest information about a nation in the pool. Its
+        indexed region and founding are only changed if it has them.
+        """
+        try:
+            founded_at: Optional[float] = float(nation['founded_at'])
+        except (KeyError, TypeError, ValueError):
+            founded_at = None
+        self._db.execute("UPDATE nations SET nation = ?, "
+                         "founded_at = COALESCE(?, founded_at), "
+                         "region = COALESCE(?, region) WHERE key = ?",
+                         (json.dumps(nation), founded_at,
+                          self._region(nation), self.key(nation)))
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the number of nations in each state. """
+        stats = dict.fromkeys(STATES, 0)
+        stats.update(self._query("SELECT state, COUNT(*) FROM nations "
+                                 "GROUP BY state"))
+        stats['expired'] = self.expired
+        return stats
+
+    def close(self):
+        """ Closes the database. """
+        self._db.close()
@@ -0,0 +1,217 @@
+""" This file tests the asyncio NS API. """
+
+import asyncio
+import urllib.error
+
+import pytest
+
+from ellis import async_ns, ns
+
+
+NATION_XML = b"<NATION><NAME>test</NAME><REGION>test</REGION></NATION>"
+RECRUITABLE_XML = b"<NATION><TGCANRECRUIT>1</TGCANRECRUIT></NATION>"
+FOUNDING_XML = (b"<WORLD><HAPPENINGS><EVENT>"
+                b"<TIMESTAMP>0</TIMESTAMP>"
+                b"<TEXT>@@test@@ in %%test%%</TEXT>"
+                b"</EVENT></HAPPENINGS></WORLD>")
+
+
+@pytest.fixture(autouse=True)
+def conf(monkeypatch):
+    monkeypatch.setattr('ellis.config.Config',
+                        {'Core': {'NS_Nation': 'Test',
+                                  'NS_Region': 'Test'}})
+
+
+async def serve(responses, connections, chunked=False):
+    """ Starts a tiny HTTP server, answering each request in turn. """
+    async def handle(reader, writer):
+        connections.append([])
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            connections[-1].append(request_line.decode().split(' ')[1])
+            status, body = responses.pop(0)
+            if chunked:
+                writer.write(b'HTTP/1.1 %d OK\r\n'
+                             b'Transfer-Encoding: chunked\r\n\r\n'
+                             b'%x\r\n%s\r\n0\r\n\r\n'
+                             % (status, len(body), body))
+            else:
+                writer.write(b'HTTP/1.1 %d OK\r\nContent-Length: %d\r\n\r\n%s'
+                             % (status, len(body), body))
+            await writer.drain()
+        writer.close()
+    server = await asyncio.start_server(handle, 'localhost', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncLimiter:
+    """ Tests the async_ns.py AsyncLimiter Logic. """
+
+    def test_default(self):
+        assert async_ns.AsyncLimiter().limiter is ns.limit
+
+    def test_check(self):
+        limit = ns.Limiter()
+        run(async_ns.AsyncLimiter(limit).check())
+        assert limit.available() == 49
+
+    def test_check_waits(self, monkeypatch):
+        waits = []
+        clock = [1000.0]
+
+        async def sleep(seconds):
+            waits.append(seconds)
+            clock[0] += seconds
+        monkeypatch.setattr('asyncio.sleep', sleep)
+        monkeypatch.setattr('ellis.ns.time.monotonic', lambda: clock[0])
+        limit = ns.Limiter(limit=2)
+        limiter = async_ns.AsyncLimiter(limit)
+        run(limiter.check())
+        run(limiter.check())
+        assert len(waits) == 1
+        assert 29 < waits[0] <= 30
+        stats = limiter.scheduler.stats()[ns.INTERACTIVE]
+        assert stats['requests'] == 2 and stats['waiting'] == 0
+
+    def test_scheduled(self):
+        scheduler = ns.Scheduler(ns.Limiter(limit=12))
+        assert async_ns.AsyncLimiter(scheduler).scheduler is scheduler
+        assert async_ns.AsyncLimiter().scheduler is ns.scheduler
+        limiter = async_ns.AsyncLimiter(scheduler, ns.BACKGROUND)
+
+        async def test():
+            # The slots held back for telegrams and interactive requests
+            # aren't taken by background requests.
+            await limiter.check()
+            return await asyncio.wait_for(limiter.check(), 0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            run(test())
+        run(limiter.acquire(ns.INTERACTIVE))
+        run(limiter.check_tg())
+        assert scheduler.limiter.available() == 9
+        assert scheduler.stats()[ns.BACKGROUND]['waiting'] == 0
+
+    def test_check_tg(self):
+        limit = ns.Limiter()
+        run(async_ns.AsyncLimiter(limit).check_tg())
+        assert not limit.try_acquire_tg()
+
+
+class TestAsyncNS:
+    """ Tests the async_ns.py AsyncNS Logic. """
+
+    def make(self, port):
+        pool = async_ns.AsyncConnectionPool('localhost', port=port,
+                                            use_ssl=False)
+        return async_ns.AsyncNS(async_ns.AsyncLimiter(ns.Limiter()),
+                                pool=pool)
+
+    def test_creation_bad(self, monkeypatch):
+        monkeypatch.setattr('ellis.config.Config',
+                            {'Core': {'NS_Nation': 'Test',
+                                      'NS_Region': ''}})
+        with pytest.raises(ValueError):
+            async_ns.AsyncNS(async_ns.AsyncLimiter())
+
+    @pytest.mark.parametrize('chunked', [False, True])
+    def test_requests(self, chunked):
+        async def test():
+            connections = []
+            server, port = await serve([(200, NATION_XML),
+                                        (200, RECRUITABLE_XML),
+                                        (200, FOUNDING_XML)],
+                                       connections, chunked)
+            nationstates = self.make(port)
+            nation = await nationstates.get_nation('a test')
+            recruitable = await nationstates.get_nation_recruitable('test')
+            foundings = await nationstates.get_foundings()
+            nationstates.pool.close()
+            server.close()
+            return nation, recruitable, foundings, connections, nationstates
+        nation, recruitable, foundings, connections, nationstates = run(test())
+        assert nation == {'name': 'test', 'region': 'test'}
+        assert recruitable is True
+        assert foundings == [{'name': 'test', 'founding_region': 'test',
+                              'founded_at': '0'}]
+        assert len(connections) == 1
+        assert connections[0][0] == '/cgi-bin/api.cgi?nation=a_test'
+        assert nationstates.pool.stats()['handshakes'] == 1
+        assert nationstates.pool.stats()['reuses'] == 2
+
+    def test_concurrent(self):
+        async def test():
+            connections = []
+            server, port = await serve([(200, NATION_XML)] * 5, connections)
+            nationstates = self.make(port)
+            nations = await asyncio.gather(*[nationstates.get_nation('test')
+                                             for _ in range(5)])
+            nationstates.pool.close()
+            server.close()
+            return nations
+        assert len(run(test())) == 5
+
+    def test_http_error(self):
+        async def test():
+            server, port = await serve([(404, b'')], [])
+            nationstates = self.make(port)
+            try:
+                await nationstates.get_nation('test')
+            finally:
+                nationstates.pool.close()
+                server.close()
+        with pytest.raises(urllib.error.HTTPError) as ex:
+            run(test())
+        assert ex.value.code == 404
+
+
+def test_pool_timeout():
+    async def test():
+        accepted = []
+
+        async def stall(reader, writer):
+            accepted.append(writer)
+            await reader.read()
+        server = await asyncio.start_server(stall, 'localhost', 0)
+        pool = async_ns.AsyncConnectionPool(
+            'localhost', port=server.sockets[0].getsockname()[1],
+            use_ssl=False, timeout=0.1)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.request('http://localhost/')
+            return pool.stats()
+        finally:
+            pool.close()
+            for writer in accepted:
+                writer.close()
+            server.close()
+    assert run(test())['idle'] == 0
+
+
+class TestAsyncNsTg:
+    """ Tests the async_ns.py Telegram Logic. """
+
+    def test_send_telegram(self):
+        async def test():
+            connections = []
+            server, port = await serve([(200, b'queued')], connections)
+            pool = async_ns.AsyncConnectionPool('localhost', port=port,
+                                                use_ssl=False)
+            telegram = async_ns.AsyncNS_Telegram(
+                async_ns.AsyncLimiter(ns.Limiter()), 'id', 'key', 'api',
+                pool=pool)
+            result = await telegram.send_telegram('a test')
+            pool.close()
+            server.close()
+            return result, connections
+        result, connections = run(test())
+        assert result is None
+        assert connections[0][0].endswith('tgid=id&key=key&to=a_test')
@@ -0,0 +1,59 @@
+""" This tests the binary encoding of the Ellis Protocol. """
+
+import json
+
+import pytest
+
+from ellis import binary
+
+
+@pytest.mark.parametrize('obj, packed', [
+    (None, b'\xc0'),
+    (True, b'\xc3'),
+    (False, b'\xc2'),
+    (1, b'\x01'),
+    (-1, b'\xff'),
+    (200, b'\xcc\xc8'),
+    (-200, b'\xd1\xff\x38'),
+    (70000, b'\xce\x00\x01\x11\x70'),
+    (1.5, b'\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00'),
+    ('abc', b'\xa3abc'),
+    (b'ab', b'\xc4\x02ab'),
+    ([1, 2], b'\x92\x01\x02'),
+    ({'a': 1}, b'\x81\xa1a\x01')])
+def test_pack(obj, packed):
+    assert binary.packb(obj) == packed
+    assert binary.unpackb(packed) == obj
+
+
+@pytest.mark.parametrize('obj', [
+    'x' * 40, 'x' * 300, 'x' * 70000, list(range(20)), list(range(70000)),
+    {str(i): i for i in range(20)}, 2 ** 64 - 1, -2 ** 63, -33, 2 ** 40,
+    {'name': 'Ünïcödé', 'nested': [{'a': None}, 0.25, -5]}])
+def test_round_trip(obj):
+    assert binary.unpackb(binary.packb(obj)) == obj
+
+
+def test_smaller_than_json():
+    nation = {'name': 'Potato', 'region': 'the_potato_fields',
+              'founded_at': 1700000000, 'population': 5, 'flag': None}
+    assert len(binary.packb(nation)) < len(json.dumps(nation))
+
+
+def test_array_header():
+    items = [binary.packb(i) for i in range(20)]
+    assert binary.unpackb(binary.array_header(20) + b''.join(items)) == \
+        list(range(20))
+
+
+@pytest.mark.parametrize('obj', [2 ** 64, object(), {1.5j: 1}])
+def test_pack_bad(obj):
+    with pytest.raises(binary.BinaryError):
+        binary.packb(obj)
+
+
+@pytest.mark.parametrize('data', [b'', b'\xa3ab', b'\x92\x01', b'\x01\x02',
+                                  b'\xc1', b'\xcd\x01'])
+def test_unpack_bad(data):
+    with pytest.raises(binary.BinaryError):
+        binary.unpackb(data)
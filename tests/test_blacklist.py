@@ -0,0 +1,168 @@
+""" This tests the compiled blacklist. """
+
+import random
+
+import pytest
+
+from ellis import blacklist
+
+
+def reference(blacklists, nation):
+    """ How EllisServer.filter_nation always matched nations. """
+    for field in blacklists:
+        try:
+            for partial in blacklists[field]['partial']:
+                if partial.casefold() in nation[field].casefold():
+                    return True
+            for exact in blacklists[field]['exact']:
+                if exact.casefold() == nation[field].casefold():
+                    return True
+        except KeyError:
+            continue
+    return False
+
+
+@pytest.mark.parametrize('patterns, text, expected', [
+    (['he', 'she', 'his', 'hers'], 'ushers', True),
+    (['he', 'she', 'his', 'hers'], 'usher', True),
+    (['abcd', 'bcx'], 'abcx', True),
+    (['abcd', 'cdx'], 'abcdx', True),
+    (['abcd', 'bce'], 'abce', True),
+    (['aab'], 'aaab', True),
+    (['abc'], 'ab', False),
+    ([''], 'anything', True),
+    (['x'], '', False)])
+def test_automaton(patterns, text, expected):
+    assert blacklist._Automaton(patterns).search(text) == expected
+
+
+@pytest.mark.parametrize('blacklists, nation, expected', [
+    ({'name': {'partial': [], 'exact': ['POTATO']}}, {'name': 'Potato'}, True),
+    ({'name': {'partial': ['TAT'], 'exact': []}}, {'name': 'Potato'}, True),
+    ({'name': {'partial': ['tata'], 'exact': ['tato']}}, {'name': 'Potato'},
+     False),
+    ({'name': {'exact': ['potato']}}, {'name': 'Potato'}, False),
+    ({'name': {'partial': ['pot']}}, {'name': 'Potato'}, True),
+    ({'name': {'partial': [''], 'exact': []}}, {'name': 'Potato'}, True),
+    ({'name': {'partial': [''], 'exact': []}}, {'region': 'Potato'}, False),
+    ({'name': {'partial': ['ß'], 'exact': []}}, {'name': 'Strasse'}, True),
+    ({'name': {'partial': ['ss'], 'exact': []}}, {'name': 'Straße'}, True),
+    ({'name': {}, 'region': {'partial': ['land'], 'exact': []}},
+     {'name': 'a', 'region': 'Lands'}, True)])
+def test_matches(blacklists, nation, expected):
+    assert blacklist.Blacklist(blacklists).matches(nation) == expected
+    assert reference(blacklists, nation) == expected
+
+
+def test_filter():
+    compiled = blacklist.Blacklist({'name': {'exact': ["Potato"],
+                                             'partial': ['tata']}})
+    nations = [{'name': 'Potato'}, {'name': "potata"},
+               {'name': "Taco Supreme"}, {'region': 'none'}]
+    assert compiled.filter(nations) == [{'name': "Taco Supreme"},
+                                        {'region': 'none'}]
+
+
+@pytest.mark.parametrize('blacklists', [
+    {'name': {'partial': ['x'], 'exact': []}},
+    {'name': {'regex': ['a']}},
+    {'name': {'range': [0, 10]}},
+    {'rules': [{'field': 'name', 'prefix': ['a']}]}])
+def test_filter_unhashable(blacklists):
+    compiled = blacklist.Blacklist(blacklists)
+    nations = [{'name': ['a', 'b']}, {'name': {'a': 'b'}},
+               {'name': ['a', 'b']}]
+    assert compiled.filter(nations) == [
+        nation for nation in nations if not compiled.matches(nation)]
+    assert compiled.filter(nations) == nations
+
+
+def test_random_against_reference():
+    rng = random.Random(4526)
+    alphabet = 'abAB ßs'
+
+    def word(longest):
+        return ''.join(rng.choice(alphabet)
+                       for _ in range(rng.randint(0, longest)))
+
+    for _ in range(200):
+        blacklists = {}
+        for field in rng.sample(['name', 'region', 'motto'], 2):
+            criteria = {}
+            if rng.random() < 0.9:
+                criteria['partial'] = [word(3) for _ in range(rng.randint(0, 4))
+                                       if rng.random() < 0.8]
+            if rng.random() < 0.9:
+                criteria['exact'] = [word(4) for _ in range(rng.randint(0, 4))]
+            blacklists[field] = criteria
+        nations = [{field: word(6) for field in ['name', 'region', 'motto']
+                    if rng.random() < 0.8} for _ in range(20)]
+        compiled = blacklist.Blacklist(blacklists)
+        for nation in nations:
+            assert compiled.matches(nation) == reference(blacklists, nation)
+        assert compiled.filter(nations) == [
+            nation for nation in nations if not reference(blacklists, nation)]
+
+
+@pytest.mark.parametrize('blacklists, nation, expected', [
+    ({'name': {'prefix': ['ZZ']}}, {'name': 'zzTop'}, True),
+    ({'name': {'prefix': ['zz']}}, {'name': 'Top zz'}, False),
+    ({'name': {'suffix': ['Puppet', 'bot']}}, {'name': 'A puppet'}, True),
+    ({'name': {'regex': [r'\d{3}$']}}, {'name': 'Potato 123'}, True),
+    ({'name': {'regex': ['^potato$']}}, {'name': 'POTATO'}, True),
+    ({'name': {'regex': [r'\d{3}$']}}, {'region': 'Potato 123'}, False),
+    ({'population': {'regex': ['5']}}, {'population': 5}, False),
+    ({'population': {'exact': ['5'], 'partial': ['5']}}, {'population': 5},
+     False),
+    ({'population': {'range': [None, 10]}}, {'population': '5.5'}, True),
+    ({'population': {'range': [20, None]}}, {'population': '5'}, False),
+    ({'population': {'range': [0, 10]}}, {'population': 'many'}, False),
+    ({'rules': [{'all': [{'field': 'region', 'exact': ['The Pacific']},
+                         {'field': 'population', 'range': [None, 10]}]}]},
+     {'region': 'the pacific', 'population': '5'}, True),
+    ({'rules': [{'all': [{'field': 'region', 'exact': ['The Pacific']},
+                         {'field': 'population', 'range': [None, 10]}]}]},
+     {'region': 'the pacific', 'population': '50'}, False),
+    ({'rules': [{'any': [{'field': 'region', 'exact': ['The Pacific']},
+                         {'all': [{'field': 'name', 'prefix': ['a']},
+                                  {'field': 'name', 'suffix': ['z']}]}]}]},
+     {'region': 'osiris', 'name': 'abcz'}, True),
+    ({'rules': [{'field': 'name', 'partial': ['x'], 'exact': ['potato']}]},
+     {'name': 'Potato'}, True)])
+def test_rules(blacklists, nation, expected):
+    assert blacklist.Blacklist(blacklists).matches(nation) == expected
+    assert bool(blacklist.Blacklist(blacklists).filter([nation])) \
+        != expected
+
+
+@pytest.mark.parametrize('blacklists', [
+    {'rules': [{'field': 'name', 'contains': ['x']}]},
+    {'rules': [{'nothing': []}]},
+    {'rules': ['name']},
+    {'name': {'range': [1]}},
+    {'name': {'regex': ['(']}},
+    {'region': {'exactt': ['x']}}])
+def test_rules_bad(blacklists):
+    with pytest.raises(ValueError):
+        blacklist.Blacklist(blacklists)
+
+
+def test_fields():
+    compiled = blacklist.Blacklist({
+        'name': {}, 'rules': [{'any': [{'field': 'population',
+                                        'range': [0, 1]},
+                                       {'field': 'motto', 'exact': ['']}]}]})
+    assert compiled.fields == {'name', 'population', 'motto'}
+
+
+def test_order_and_stats():
+    compiled = blacklist.Blacklist({
+        'name': {'regex': ['o'], 'partial': ['t'], 'exact': ['potato'],
+                 'prefix': ['p']}})
+    assert [rule.name for rule in compiled._rules] == [
+        'name.exact', 'name.prefix', 'name.partial', 'name.regex']
+    nations = [{'name': 'Potato'}, {'name': 'Pear'}, {'name': 'tea'},
+               {'name': 'Onion'}, {'name': 'Onion'}, {'name': 'kiwi'}]
+    assert compiled.filter(nations) == [{'name': 'kiwi'}]
+    assert compiled.stats() == {'name.exact': 1, 'name.prefix': 1,
+                                'name.partial': 1, 'name.regex': 2}
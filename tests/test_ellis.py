@@ -3,6 +3,8 @@
 import pytest
 import socket
 import json
+import threading
+import time
 
 TEST_FORMAT = [{'name':'Potato', 'region':'potato'}, {'name':'Potato2', 'region':'potato'}]
 TEST_JSON = '[{"name":"Potato","region":"potato"},{"name":"Potato2","region":"potato"}]\n'
@@ -31,6 +33,13 @@ def patch_nation(monkeypatch):
     monkeypatch.undo()
 
 from ellis import ellis
+from ellis import ns
+from ellis import pool
+from ellis import protocol
+
+@pytest.fixture(autouse=True)
+def clear_lookups():
+    ns.lookups.invalidate()
 
 @pytest.fixture()
 def json_fake_dump_read(monkeypatch):
@@ -52,6 +61,12 @@ def hide_actual_files(monkeypatch, tmp_path):
     monkeypatch.setattr('ellis.ellis.AVAILABLE_JSON_PATH', available.as_posix())
     monkeypatch.setattr('ellis.ellis.RENTED_JSON_PATH', rented.as_posix())
     monkeypatch.setattr('ellis.ellis.RECRUITED_JSON_PATH', recruited.as_posix())
+    monkeypatch.setattr('ellis.ellis.JOURNAL_PATH',
+                        (tmp_path / "ellis_state").as_posix())
+    monkeypatch.setattr('ellis.ellis.WATERMARK_PATH',
+                        (tmp_path / "watermark").as_posix())
+    monkeypatch.setattr('ellis.ellis.RECRUITED_ARCHIVE_PATH',
+                        (tmp_path / "recruited_archive").as_posix())
     yield
     monkeypatch.undo()
 
@@ -107,6 +122,136 @@ def test_filter_nations():
     new_ellis.blacklists = blacklist
     assert new_ellis.filter_nations(nations) == [{"name":"Taco Supreme"}]
 
+def test_reload(monkeypatch, tmp_path):
+    blacklist_file = tmp_path / "blacklist"
+    config_file = tmp_path / "ellis.conf"
+    monkeypatch.setattr('ellis.ellis.BLACKLIST_PATH', blacklist_file.as_posix())
+    monkeypatch.setattr('ellis.config.CONFIG_PATH', config_file.as_posix())
+    blacklist_file.write_text(json.dumps({'name': {'partial': ['a'],
+                                                   'exact': []}}))
+    new_ellis = ellis.EllisServer()
+    new_ellis.start()
+    new_ellis.nations = pool.NationPool([{'name': 'apple'}, {'name': 'kiwi'},
+                                         {'name': 'lime'}],
+                                        rented=[{'name': 'lemon'}])
+    new_ellis.reload()
+    assert new_ellis.nations.count(pool.AVAILABLE) == 3
+
+    blacklist_file.write_text(json.dumps({'name': {'partial': ['i'],
+                                                   'exact': []}}))
+    config_file.write_text(json.dumps({'Core': {'NS_Nation': 'Test',
+                                                'NS_Region': 'Test',
+                                                'Lease_Time': '60',
+                                                'Server_Workers': '3'}}))
+    new_ellis.reload()
+    assert new_ellis.filter_nation({'name': 'fig'})
+    assert new_ellis.nations.nations() == [{'name': 'apple'}]
+    assert new_ellis.nations.state('lemon') == pool.RENTED
+    assert new_ellis.leases.duration == 60
+    # The workers are only started once, so they need a restart.
+    assert new_ellis.workers != 3
+
+    # A config that can't be read is ignored, all of it.
+    config_file.write_text(json.dumps({'Core': {'Lease_Time': '90',
+                                                'Server_Workers': 'x'}}))
+    new_ellis.reload()
+    assert new_ellis.leases.duration == 60
+    assert ellis.config.Config['Core']['Lease_Time'] == '60'
+    config_file.write_text(json.dumps({'Lease_Time': '90'}))
+    new_ellis.reload()
+    assert new_ellis.leases.duration == 60
+
+    blacklist_file.write_text('{"name": ')
+    new_ellis.reload()
+    assert new_ellis.filter_nation({'name': 'fig'})
+    new_ellis.running = False
+
+def test_start_journal(monkeypatch, tmp_path):
+    monkeypatch.setattr('ellis.config.CONFIG_PATH',
+                        (tmp_path / "ellis.conf").as_posix())
+    with open(ellis.AVAILABLE_JSON_PATH, 'w', encoding='utf-8') as file:
+        json.dump(TEST_FORMAT, file)
+    new_ellis = ellis.EllisServer()
+    new_ellis.start()
+    assert new_ellis.nations.stats()['available'] == 2
+    new_ellis.nations.checkout()
+    new_ellis.stop()
+    restarted = ellis.EllisServer()
+    restarted.start()
+    assert restarted.nations.stats()['rented'] == 1
+    restarted.stop()
+
+@pytest.mark.parametrize("legacy", ['json', 'snapshot'])
+def test_start_archives_recruited(monkeypatch, tmp_path, legacy):
+    monkeypatch.setattr('ellis.config.CONFIG_PATH',
+                        (tmp_path / "ellis.conf").as_posix())
+    if legacy == 'json':
+        with open(ellis.RECRUITED_JSON_PATH, 'w', encoding='utf-8') as file:
+            json.dump(TEST_FORMAT, file)
+    else:
+        # A snapshot from before recruited nations were archived.
+        with open(ellis.JOURNAL_PATH + '.snapshot', 'w',
+                  encoding='utf-8') as file:
+            json.dump({'generation': 0, 'recruited': TEST_FORMAT}, file)
+    for _ in range(2):
+        new_ellis = ellis.EllisServer()
+        new_ellis.start()
+        assert new_ellis.nations.stats()['recruited'] == 2
+        assert list(new_ellis.nations.archive.read()) == TEST_FORMAT
+        new_ellis.stop()
+
+def test_start_sqlite(monkeypatch, tmp_path):
+    database = (tmp_path / "state.db").as_posix()
+    monkeypatch.setattr('ellis.config.CONFIG_PATH',
+                        (tmp_path / "ellis.conf").as_posix())
+    monkeypatch.setattr('ellis.config.Config',
+                        {'Core': {'NS_Nation': 'Test', 'NS_Region': 'Test',
+                                  'State_Backend': 'sqlite',
+                                  'State_Database': database}})
+    with open(ellis.RECRUITED_JSON_PATH, 'w', encoding='utf-8') as file:
+        json.dump(TEST_FORMAT, file)
+    new_ellis = ellis.EllisServer()
+    new_ellis.start()
+    assert new_ellis.nations.stats()['recruited'] == 2
+    new_ellis.nations.add({'name': 'Potato3'})
+    new_ellis.stop()
+    restarted = ellis.EllisServer()
+    restarted.start()
+    assert restarted.nations.stats()['available'] == 1
+    assert restarted.journal is None
+    restarted.stop()
+
+def test_nation_shards():
+    new_ellis = ellis.EllisServer()
+    new_ellis.blacklists = {'name': {}, 'population': {},
+                            'founding_region': {}}
+    assert new_ellis._nation_shards() == ['name', 'population', 'region']
+
+@pytest.mark.parametrize('recruitable, expected',
+                         [(True, {'name': 'Potato', 'region': 'potato'}),
+                          (False, None)])
+def test_checkout_nation(monkeypatch, recruitable, expected):
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({'region': 'potato'},
+                                                    recruitable))
+    new_ellis = ellis.EllisServer()
+    new_ellis.nations = pool.NationPool([{'name': 'Potato'}])
+    assert new_ellis._checkout_nation() == expected
+    assert new_ellis.nations.count(pool.RENTED) == int(recruitable)
+    assert new_ellis.nations.count(pool.RECRUITED) == int(not recruitable)
+
+@pytest.mark.parametrize('recruitable, state',
+                         [(True, pool.AVAILABLE), (False, pool.RECRUITED)])
+def test_return_nation(monkeypatch, recruitable, state):
+    new_ellis = ellis.EllisServer()
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: recruitable)
+    new_ellis.nations = pool.NationPool(rented=[{'name': 'Potato'}])
+    new_ellis._return_nation({'name': 'potato'})
+    assert new_ellis.nations.state('Potato') == state
+    new_ellis._return_nation({'name': 'Potato'})
+    new_ellis._return_nation({'name': 'Unknown'})
+    assert new_ellis.nations.stats()[state] == 1
+
 @pytest.fixture()
 def monkeypatch_sockets(monkeypatch):
     def recv(self, b, c=['GET', 'END', 'GET']): 
@@ -135,7 +280,7 @@ def monkeypatch_ns(monkeypatch):
 def test_handle_client(capsys, monkeypatch_sockets, monkeypatch_ns):
     s = socket.socket()
     new_ellis = ellis.EllisServer()
-    new_ellis.available_nations = [{'name':'Potato'}, {'name':'Potato'}]
+    new_ellis.nations = pool.NationPool([{'name':'Potato'}, {'name':'Potato'}])
     new_ellis.start()
     new_ellis.handle_client(s, ('', 1))
     new_ellis.stop()
@@ -143,6 +288,448 @@ def test_handle_client(capsys, monkeypatch_sockets, monkeypatch_ns):
     print(captured)
     assert False
 
+@pytest.mark.parametrize("command,expected", [
+    ('END', (None, True)),
+    ('CHECK potato', ('{"recruitable": 1}', False)),
+    ('GET', ('{"name": "Potato"}', False)),
+    ('RENEW potato', ('{"renewed": 0}', False)),
+    ('NONSENSE', (None, False))])
+def test_handle_command(monkeypatch, command, expected):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: True)
+    monkeypatch.setattr(new_ellis, '_checkout_nations',
+                        lambda count=1, timeout=0: [{'name': 'Potato'}])
+    assert new_ellis._handle_command(command) == expected
+
+def test_leases(monkeypatch):
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, True))
+    clock = [1000.0]
+    monkeypatch.setattr('time.monotonic', lambda: clock[0])
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    new_ellis.leases.duration = 60
+    new_ellis.blacklists = {'name': {'partial': ['bad'], 'exact': []}}
+    new_ellis.nations = pool.NationPool([{'name': 'Potato'},
+                                         {'name': 'Potato2'}])
+    assert new_ellis._get_nation(0) == {'name': 'Potato2'}
+    assert new_ellis._get_nation(0) == {'name': 'Potato'}
+    with ns.lock:
+        new_ellis.nations.add({'name': 'Bad'}, pool.RENTED)
+        new_ellis.leases.grant('bad', now=900)
+    clock[0] = 1030.0
+    assert new_ellis._handle_command('RENEW Potato2') == (
+        '{"renewed": 1, "lease": 60.0}', False)
+    assert new_ellis.reclaim_nations(now=1059) == []
+    assert new_ellis.nations.state('bad') == pool.RECRUITED
+    assert new_ellis.reclaim_nations(now=1061) == [{'name': 'Potato'}]
+    assert new_ellis.nations.state('Potato') == pool.AVAILABLE
+    assert new_ellis._handle_command('RENEW potato') == (
+        '{"renewed": 0}', False)
+    assert 'potato2' in new_ellis.leases
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: False)
+    new_ellis._return_nation({'name': 'Potato2'})
+    assert not new_ellis.leases
+
+def test_start_leases_rented(monkeypatch, tmp_path):
+    monkeypatch.setattr('ellis.config.CONFIG_PATH',
+                        (tmp_path / "ellis.conf").as_posix())
+    with open(ellis.RENTED_JSON_PATH, 'w', encoding='utf-8') as file:
+        json.dump(TEST_FORMAT, file)
+    new_ellis = ellis.EllisServer()
+    new_ellis.start()
+    assert len(new_ellis.leases) == 2
+    new_ellis.reclaim_nations(now=time.monotonic() + 3600)
+    assert new_ellis.nations.count(pool.AVAILABLE) == 2
+    new_ellis.stop()
+
+@pytest.mark.parametrize("command,expected", [
+    ('GET', (None, None, None)),
+    ('GET 2.5', (None, 2.5, None)),
+    ('GET [3]', (3, None, None)),
+    ('GET [3, 0.5]', (3, 0.5, None)),
+    ('GET {}', (None, None, None)),
+    ('GET {"timeout": 1, "fields": ["founded_at"]}',
+     (None, 1.0, ('name', 'founded_at'))),
+    ('GET {"count": 2, "fields": ["name", "a", "a"]}',
+     (2, None, ('name', 'a')))])
+def test_get_request(command, expected):
+    assert ellis.EllisServer._get_request(command) == expected
+
+@pytest.mark.parametrize("command", [
+    'GET soon', 'GET [0]', 'GET []', 'GET [1, 2, 3]', 'GET [two]',
+    'GET {"count": 0}', 'GET {"fields": "name"}', 'GET {"limit": 1}'])
+def test_get_request_bad(command):
+    with pytest.raises(ValueError):
+        ellis.EllisServer._get_request(command)
+
+def test_handle_command_batches(monkeypatch):
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, name != 'Gone'))
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr(new_ellis, '_check_nation',
+                        lambda name: name.lower() != 'potato2')
+    new_ellis.nations = pool.NationPool(
+        [{'name': name, 'founded_at': founded_at} for (founded_at, name)
+         in enumerate(['Potato', 'Gone', 'Potato2', 'Potato3'])])
+    response, _ = new_ellis._handle_command('GET [3]')
+    assert json.loads(response) == [
+        {'name': 'Potato3', 'founded_at': 3},
+        {'name': 'Potato2', 'founded_at': 2}]
+    assert new_ellis.nations.state('Gone') == pool.RECRUITED
+    assert len(new_ellis.leases) == 2
+    assert new_ellis._handle_command('CHECK ["Potato", "Potato2"]') == (
+        '[{"recruitable": 1}, {"recruitable": 0}]', False)
+    assert new_ellis._handle_command(
+        'RETURN [{"name": "Potato3"}, {"name": "Potato2"},'
+        ' {"name": "Unknown"}]') == (None, False)
+    assert new_ellis.nations.state('Potato3') == pool.AVAILABLE
+    assert new_ellis.nations.state('Potato2') == pool.RECRUITED
+    assert not new_ellis.leases
+    response, _ = new_ellis._handle_command('GET [5, 0]')
+    assert [nation['name'] for nation in json.loads(response)] == [
+        'Potato3', 'Potato']
+    assert new_ellis._handle_command('GET [5, 0]') == ('[]', False)
+
+def test_handle_command_return(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    returned = []
+    monkeypatch.setattr(new_ellis, '_return_nation', returned.append)
+    assert new_ellis._handle_command('RETURN {"name": "Potato"}') == (None, False)
+    assert returned == [{'name': 'Potato'}]
+
+def test_handle_command_malformed(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: True)
+    new_ellis.nations = pool.NationPool(rented=[{'name': 'Potato'}])
+    for command in ('RETURN ["Potato", 1, {"name": 2}]', 'RETURN "Potato"',
+                    'RETURN {"name": ', 'CHECK [1'):
+        assert new_ellis._handle_command(command) == (None, False)
+    assert new_ellis.nations.state('Potato') == pool.RENTED
+    for command in ('CHECK', 'CHECK ', 'check  '):
+        assert new_ellis._handle_command(command) == (
+            '{"error": "CHECK needs a nation"}', False)
+    assert new_ellis._handle_command('CHECK [1, null, "Potato"]') == (
+        '[{"recruitable": 0}, {"recruitable": 0}, {"recruitable": 1}]',
+        False)
+
+@pytest.fixture()
+def selector_server(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    new_ellis.workers = 2
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: False)
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, True))
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('localhost', 0))
+    server.listen()
+    loop = threading.Thread(target=new_ellis._serve_selector, args=[server])
+    loop.start()
+    try:
+        yield new_ellis, server.getsockname()
+    finally:
+        new_ellis.running = False
+        loop.join(5)
+        server.close()
+    assert not loop.is_alive()
+
+def test_serve_selector(selector_server):
+    new_ellis, address = selector_server
+    new_ellis.nations = pool.NationPool([{'name': 'Potato'}])
+    first = socket.create_connection(address, timeout=5)
+    second = socket.create_connection(address, timeout=5)
+    second.send(b'CHECK potato')
+    first.send(b'GET')
+    assert json.loads(first.recv(2048)) == {'name': 'Potato'}
+    assert json.loads(second.recv(2048)) == {'recruitable': 0}
+    first.send(b'END')
+    assert first.recv(2048) == b''
+    first.close()
+    new_ellis.running = False
+    assert second.recv(2048) == b'END'
+    second.close()
+
+def test_serve_selector_waiting_get(selector_server):
+    new_ellis, address = selector_server
+    clients = [socket.create_connection(address, timeout=5) for _ in range(3)]
+    for client in clients[:2]:
+        client.send(b'GET')
+    clients[-1].send(b'GET 0.1')
+    assert json.loads(clients[-1].recv(2048)) == {}
+    with ns.lock:
+        new_ellis.nations.extend([{'name': 'Potato2'}, {'name': 'Potato'}])
+        new_ellis._nations_available()
+    got = [json.loads(client.recv(2048))['name'] for client in clients[:2]]
+    assert sorted(got) == ['Potato', 'Potato2']
+    for client in clients:
+        client.close()
+
+@pytest.mark.parametrize('framing', [protocol.LINE, protocol.LENGTH])
+def test_serve_selector_pipelined(selector_server, framing):
+    new_ellis, address = selector_server
+    new_ellis.nations = pool.NationPool([{'name': 'Potato'},
+                                         {'name': 'Potato2'}])
+    sock = socket.create_connection(address, timeout=5)
+    connection = protocol.Connection(sock, framing)
+    connection.negotiate()
+    big = {'name': 'Potato', 'motto': 'x' * 10000}
+    connection.send('GET', 'GET', 'RETURN ' + json.dumps(big), 'CHECK potato',
+                    'GET 0', 'NONSENSE')
+    answers = [json.loads(connection.receive()) for _ in range(6)]
+    assert answers == [{'name': 'Potato2'}, {'name': 'Potato'}, {},
+                       {'recruitable': 0}, {}, {}]
+    assert new_ellis.nations.state('potato') == pool.RECRUITED
+    connection.send('END')
+    assert sock.recv(2048) == b''
+    sock.close()
+
+def test_serve_selector_msgpack(selector_server):
+    new_ellis, address = selector_server
+    nation = {'name': 'Potato', 'population': 5, 'motto': 'ü' * 40}
+    new_ellis.nations = pool.NationPool([nation])
+    sock = socket.create_connection(address, timeout=5)
+    connection = protocol.Connection(sock, protocol.LENGTH, protocol.MSGPACK)
+    connection.negotiate()
+    connection.send('GET', 'RETURN ' + json.dumps(nation), 'CHECK potato',
+                    'GET [1, 0]', 'GET 0')
+    answers = [connection.receive_value() for _ in range(5)]
+    assert answers == [nation, {}, {'recruitable': 0}, [], {}]
+    connection.send('NONSENSE')
+    assert connection.receive_value() == {}
+    sock.close()
+
+def test_encode_nations_cached(monkeypatch):
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, True))
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: True)
+    new_ellis.nations = pool.NationPool([{'name': 'Potato'}])
+    for _ in range(3):
+        assert new_ellis._handle_command('GET') == ('{"name": "Potato"}',
+                                                    False)
+        new_ellis._return_nation({'name': 'Potato'})
+    assert new_ellis.encoded.stats() == {'hits': 2, 'misses': 1, 'size': 1}
+    response, _ = new_ellis._handle_command('GET [1]', protocol.MSGPACK)
+    assert protocol.loads(response, protocol.MSGPACK) == [{'name': 'Potato'}]
+
+def test_serve_selector_fields(selector_server):
+    new_ellis, address = selector_server
+    nations = [{'name': name, 'founding_region': 'potato',
+                'founded_at': founded_at, 'flag': 'x' * 4096}
+               for (founded_at, name) in enumerate(('Potato', 'Potato2'))]
+    new_ellis.nations = pool.NationPool(nations)
+    sock = socket.create_connection(address, timeout=5)
+    connection = protocol.Connection(sock, protocol.LINE)
+    connection.negotiate()
+    connection.send('GET {"fields": ["founded_at"]}',
+                    'FIELDS ["founding_region"]', 'GET [1, 5]', 'FIELDS',
+                    'FIELDS "flag"')
+    answers = [connection.receive_value() for _ in range(5)]
+    assert answers == [
+        {'name': 'Potato2', 'founded_at': 1},
+        {'fields': ['name', 'founding_region']},
+        [{'name': 'Potato', 'founding_region': 'potato'}],
+        {'fields': None}, {'fields': None}]
+    assert new_ellis.encoded.stats()['size'] == 2
+    sock.close()
+
+def test_handle_client_fields(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr(new_ellis, '_checkout_nations',
+                        lambda count=1, timeout=0: [{'name': 'Potato',
+                                                     'region': 'the_east'}])
+    server, sock = socket.socketpair()
+    handler = threading.Thread(target=new_ellis.handle_client,
+                               args=[server, ('', 1)])
+    handler.start()
+    sock.sendall(b'FIELDS ["name"]')
+    assert json.loads(sock.recv(2048)) == {'fields': ['name']}
+    sock.sendall(b'GET')
+    assert json.loads(sock.recv(2048)) == {'name': 'Potato'}
+    sock.sendall(b'END')
+    handler.join(5)
+    assert not handler.is_alive()
+    sock.close()
+
+def test_handle_client_pipelined(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr(new_ellis, '_check_nation', lambda name: True)
+    server, sock = socket.socketpair()
+    handler = threading.Thread(target=new_ellis.handle_client,
+                               args=[server, ('', 1)])
+    handler.start()
+    sock.sendall(b'PROTOCOL 2 LINE\nCHECK a\nRETURN {"name": "a"}\n')
+    sock.sendall(b'CHECK b\nEND\n')
+    received = b''
+    while received.count(b'\n') < 4:
+        received += sock.recv(2048)
+    assert received.split(b'\n')[:4] == [
+        b'{"protocol": 2, "framing": "LINE", "encoding": "JSON"}',
+        b'{"recruitable": 1}', b'{}',
+        b'{"recruitable": 1}']
+    handler.join(5)
+    assert not handler.is_alive()
+    sock.close()
+
+def test_handle_client_legacy_negotiation(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    server, sock = socket.socketpair()
+    handler = threading.Thread(target=new_ellis.handle_client,
+                               args=[server, ('', 1)])
+    handler.start()
+    sock.sendall(b'PROTOCOL 9 LINE\n')
+    assert json.loads(sock.recv(2048)) == {'protocol': 1}
+    sock.sendall(b'END')
+    handler.join(5)
+    assert not handler.is_alive()
+    sock.close()
+
+def test_serve_selector_batch_get(selector_server):
+    new_ellis, address = selector_server
+    sock = socket.create_connection(address, timeout=5)
+    connection = protocol.Connection(sock, protocol.LINE)
+    connection.negotiate()
+    connection.send('GET [2, 0.05]', 'GET [2]')
+    assert json.loads(connection.receive()) == []
+    with ns.lock:
+        new_ellis.nations.extend([{'name': 'Potato'}, {'name': 'Potato2'},
+                                  {'name': 'Potato3'}])
+        new_ellis._nations_available()
+    assert len(json.loads(connection.receive())) == 2
+    assert new_ellis.nations.count(pool.AVAILABLE) == 1
+    sock.close()
+
+def test_get_nation_waits(monkeypatch):
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, True))
+    got = []
+    waiters = [threading.Thread(target=lambda: got.append(new_ellis._get_nation()))
+               for _ in range(2)]
+    for waiter in waiters:
+        waiter.start()
+        while len(new_ellis._waiters) < len(got) + 1:
+            time.sleep(0.01)
+    for name in ['Potato', 'Potato2']:
+        with ns.lock:
+            new_ellis.nations.add({'name': name})
+            new_ellis._nations_available()
+        while len(got) < ['Potato', 'Potato2'].index(name) + 1:
+            time.sleep(0.01)
+    for waiter in waiters:
+        waiter.join(5)
+    assert got == [{'name': 'Potato'}, {'name': 'Potato2'}]
+
+def test_get_nation_expired(monkeypatch):
+    monkeypatch.setattr('ellis.ns.NS.get_nation_and_recruitable',
+                        lambda self, name, shards: ({}, True))
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    now = time.time()
+    new_ellis.nations = pool.NationPool(
+        [{'name': 'Stale', 'founded_at': now - 7200},
+         {'name': 'Fresh', 'founded_at': now - 60}], max_age=3600)
+    assert new_ellis._get_nation(0)['name'] == 'Fresh'
+    assert new_ellis._get_nation(0) is None
+    assert new_ellis.nations.state('Stale') == pool.RECRUITED
+
+def test_get_nation_timeout():
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    assert new_ellis._get_nation(0.05) is None
+    assert new_ellis._handle_command('GET 0') == ('{}', False)
+    assert not new_ellis._waiters
+
+def test_get_nation_stopped():
+    new_ellis = ellis.EllisServer()
+    new_ellis.running = True
+    waiter = threading.Thread(target=new_ellis._get_nation)
+    waiter.start()
+    while not new_ellis._waiters:
+        time.sleep(0.01)
+    new_ellis.running = False
+    with new_ellis.nation_ready:
+        new_ellis.nation_ready.notify_all()
+    waiter.join(5)
+    assert not waiter.is_alive()
+
+def test_get_recruitable(monkeypatch):
+    since_ids = []
+    def get_foundings(self, since_id):
+        since_ids.append(since_id)
+        return [{'name': 'Potato', 'event_id': 5},
+                {'name': 'known', 'event_id': 7},
+                {'name': 'potato', 'event_id': 6}]
+    monkeypatch.setattr('ellis.ns.NS.get_foundings', get_foundings)
+    monkeypatch.setattr('ellis.ns.NS.get_nation',
+                        lambda self, name, shards: {'region': 'potato'})
+    new_ellis = ellis.EllisServer()
+    new_ellis.nations = pool.NationPool(recruited=[{'name': 'Known'}])
+    new_ellis.watermark = None
+    assert new_ellis._get_recruitable() == [{'name': 'Potato',
+                                             'event_id': 5,
+                                             'region': 'potato'}]
+    assert new_ellis.watermark == 7
+    new_ellis._get_recruitable()
+    assert since_ids == [None, 7]
+    assert new_ellis._read_watermark() == 7
+
+def test_watermark_missing():
+    assert ellis.EllisServer()._read_watermark() is None
+
+class TestPullCadence:
+    """ Tests the adaptive pull interval. """
+
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        now = [100000.0]
+        monkeypatch.setattr('time.time', lambda: now[0])
+        return now
+
+    def test_first_pull(self, clock):
+        cadence = ellis.PullCadence(target=5)
+        # Ten foundings over the last 100 seconds.
+        interval = cadence.observe([clock[0] - 10 * i
+                                    for i in range(1, 11)], 0)
+        assert cadence.rate == pytest.approx(0.1)
+        assert interval == pytest.approx(50)
+        assert cadence.stats() == {'rate': cadence.rate, 'interval': interval}
+
+    def test_quiet(self, clock):
+        cadence = ellis.PullCadence(max_interval=300)
+        assert cadence.observe([], 0) == 300
+        clock[0] += 300
+        assert cadence.observe([], 0) == 300
+        assert cadence.rate == 0
+
+    def test_busy(self, clock):
+        cadence = ellis.PullCadence(min_interval=10, smoothing=1)
+        cadence.observe([], 0)
+        clock[0] += 10
+        assert cadence.observe([clock[0]] * 100, 0) == 10
+
+    def test_pool_full(self, clock):
+        cadence = ellis.PullCadence(pool_target=10, max_interval=300)
+        cadence.observe([clock[0] - 10 * i for i in range(10)], 10)
+        assert cadence.interval == 300
+
+    def test_smoothing(self, clock):
+        cadence = ellis.PullCadence(smoothing=0.5)
+        cadence.observe([], 0)
+        clock[0] += 10
+        cadence.observe([clock[0]] * 10, 0)
+        clock[0] += 10
+        cadence.observe([], 0)
+        assert cadence.rate == pytest.approx(0.5)
+
 def test_setver():
     ellis._set_ver()
     from ellis import ns
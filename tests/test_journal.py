@@ -0,0 +1,147 @@
+""" This tests the journal the nation pool is kept in. """
+
+import os
+
+import pytest
+
+from ellis import journal, pool
+
+
+@pytest.fixture()
+def path(tmp_path):
+    return (tmp_path / "state").as_posix()
+
+
+def journaled(path, **kwargs):
+    state = journal.Journal(path, **kwargs)
+    nations = pool.NationPool()
+    found = state.load(nations)
+    nations.journal = state
+    return state, nations, found
+
+
+def test_empty(path):
+    state, nations, found = journaled(path)
+    assert not found
+    assert len(nations) == 0
+    state.close()
+
+
+def test_replay(path):
+    state, nations, _ = journaled(path)
+    nations.extend([{'name': 'a', 'founded_at': 1},
+                    {'name': 'b', 'founded_at': 2},
+                    {'name': 'c', 'founded_at': 3}])
+    nations.add({'name': 'd'}, pool.RECRUITED)
+    nations.checkout()
+    nations.release('c')
+    nations.checkout()
+    nations.recruit('b')
+    assert state.records == 8
+    state.close()
+
+    state, replayed, found = journaled(path)
+    assert found
+    assert {state_: sorted(nation['name']
+                           for nation in replayed.nations(state_))
+            for state_ in (pool.AVAILABLE, pool.RENTED)} == {
+                'available': ['a'], 'rented': ['c']}
+    assert replayed.state('b') == replayed.state('d') == pool.RECRUITED
+    assert replayed.count(pool.RECRUITED) == 2
+    state.close()
+
+
+def test_broken_record(path):
+    state, nations, _ = journaled(path)
+    nations.add({'name': 'a'})
+    state.close()
+    with open(state.journal_path(0), 'a', encoding='utf-8') as file:
+        file.write('[">","a","rec')
+    state, nations, _ = journaled(path)
+    assert nations.state('a') == pool.AVAILABLE
+    state.close()
+
+
+def test_batched_sync(path, monkeypatch):
+    syncs = []
+    monkeypatch.setattr('os.fsync', syncs.append)
+    state, nations, _ = journaled(path, sync_interval=60)
+    nations.extend({'name': str(i)} for i in range(100))
+    assert not syncs
+    state.sync()
+    state.sync()
+    assert len(syncs) == 1
+    state.close()
+
+
+def test_compact(path):
+    state, nations, _ = journaled(path, compact_after=3)
+    nations.extend([{'name': 'a'}, {'name': 'b'}])
+    assert not state.needs_compaction()
+    nations.checkout()
+    assert state.needs_compaction()
+    generation = state.rotate()
+    snapshot = {state_: nations.nations(state_) for state_ in pool.STATES}
+    nations.recruit('a')
+    state.compact(snapshot, generation)
+    assert not os.path.exists(state.journal_path(0))
+    assert os.path.exists(state.snapshot_path)
+    state.close()
+
+    state, replayed, _ = journaled(path)
+    assert replayed.stats() == nations.stats()
+    assert state.generation == 1
+    state.close()
+
+
+def test_compact_interrupted(path):
+    state, nations, _ = journaled(path)
+    nations.add({'name': 'a'})
+    generation = state.rotate()
+    nations.recruit('a')
+    state.close()
+    # The snapshot was never written, so both journals are replayed.
+    state, replayed, _ = journaled(path)
+    assert replayed.state('a') == pool.RECRUITED
+    assert state.generation == generation
+    state.close()
+
+
+def test_compact_recruited_index(path):
+    state, nations, _ = journaled(path)
+    nations.extend([{'name': 'a'}, {'name': 'b'}, {'name': 'c'}])
+    nations.recruit('a')
+    generation = state.rotate()
+    snapshot = {state_: nations.nations(state_)
+                for state_ in (pool.AVAILABLE, pool.RENTED)}
+    state.compact(snapshot, generation, nations.recruited.copy())
+    nations.recruit('b')
+    state.close()
+    assert os.path.exists(state.recruited_path(generation))
+
+    state, replayed, _ = journaled(path)
+    assert replayed.stats() == nations.stats()
+    assert replayed.state('a') == replayed.state('b') == pool.RECRUITED
+    generation = state.rotate()
+    state.compact({}, generation, replayed.recruited.copy())
+    assert not os.path.exists(state.recruited_path(generation - 1))
+    state.close()
+
+
+def test_replay_over_index(path):
+    state, nations, _ = journaled(path)
+    nations.add({'name': 'a'})
+    nations.checkout()
+    generation = state.rotate()
+    nations.recruit('a')
+    state.close()
+    # The snapshot has 'a' recruited, but its journals were never removed.
+    index = nations.recruited.copy()
+    state = journal.Journal(path)
+    state.compact({}, generation, index)
+    with open(state.journal_path(0), 'w', encoding='utf-8') as file:
+        file.write('["+","available",{"name":"a"}]\n[">","a","rented"]\n')
+    state, replayed, _ = journaled(path)
+    assert replayed.state('a') == pool.RECRUITED
+    assert len(replayed) == 1
+    state.close()
@@ -0,0 +1,46 @@
+""" This tests the leases nations are rented out under. """
+
+from ellis import leases
+
+
+def test_grant_and_expire():
+    leased = leases.Leases(duration=10)
+    assert leased.grant('a', now=0) == 10
+    leased.grant('b', now=5)
+    assert 'a' in leased
+    assert len(leased) == 2
+    assert leased.remaining('b', now=7) == 8
+    assert leased.expired(now=9) == []
+    assert leased.expired(now=10) == ['a']
+    assert 'a' not in leased
+    assert leased.expired(now=100) == ['b']
+    assert not leased
+
+
+def test_renew():
+    leased = leases.Leases(duration=10)
+    leased.grant('a', now=0)
+    assert leased.renew('a', now=8) == 18
+    assert leased.renew('unknown', now=8) is None
+    assert 'unknown' not in leased
+    # The entry for the old deadline is skipped.
+    assert leased.expired(now=12) == []
+    assert leased.expired(now=18) == ['a']
+
+
+def test_release():
+    leased = leases.Leases(duration=10)
+    leased.grant('a', now=0)
+    leased.release('a')
+    leased.release('unknown')
+    assert leased.expired(now=20) == []
+
+
+def test_many_renewals():
+    leased = leases.Leases(duration=10)
+    for now in range(10000):
+        leased.renew('a', now=now) or leased.grant('a', now=now)
+    # Stale entries are compacted away, rather than piling up.
+    assert len(leased._heap) < 200  # pylint: disable=protected-access
+    assert leased.expired(now=10008) == []
+    assert leased.expired(now=10009) == ['a']
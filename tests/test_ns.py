@@ -1,158 +1,245 @@
 """ This file tests the minimal NS API. """
 
+import threading
+import time as time_module
+import urllib.error
 from xml.etree import ElementTree
-from time import time
 from ellis import ns
 
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def clear_lookups():
+    ns.lookups.invalidate()
+
+
 class test_globals():
     """ Tests the global stuff."""
     assert ns.VER == "0.0.0"
     ns._set_ver("1.0.0")
     assert ns.VER == "1.0.0"
     assert isinstance(ns.limit, ns.Limiter)
+    assert isinstance(ns.connections, ns.ConnectionPool)
+    assert ns.scheduler.limiter is ns.limit
 
 
 class TestLimiter:
     """ Tests the NS.py Limiter Logic. """
-    def test_creation(self):
-        limit = ns.Limiter()
-        assert limit.requests == 0
-        assert limit.last_request == 0
-        assert limit.tg_requests == 0
 
-    def test_check(self):
-        limit = ns.Limiter()
-        limit.check()
-        assert limit.requests >= 1
-        assert limit.tg_requests == 0
-        assert bool(limit.last_request)
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        """ A fake clock, which sleeping advances. """
+        now = [1000.0]
+        monkeypatch.setattr('time.monotonic', lambda: now[0])
 
-    def test_after50(self):
-        limit = ns.Limiter()
-        limit.requests = 50
-        limit.check()
-        assert limit.requests < 50
-        assert limit.requests == 1
+        def sleep(seconds):
+            now[0] += seconds
+        monkeypatch.setattr('time.sleep', sleep)
+        return now
 
-    def test_after50tg(self):
+    def test_creation(self):
         limit = ns.Limiter()
-        limit.requests = 49
-        limit.tg_requests = 1
-        limit.check()
-        assert limit.requests == 1
+        assert limit.limit == 50
+        assert limit.window == 30
+        assert limit.available() == 50
+        assert limit.wait_time() == 0
 
-    def test_toosoon(self):
+    def test_check(self, clock):
         limit = ns.Limiter()
-        limit.last_request = time() + 60
         limit.check()
-        assert limit.requests == 1
-
-    def test_toosoon_after50(self, monkeypatch):
-        def rewrite(x, y):
-            y.last_request = 0
-            return x
-        limit = ns.Limiter()
-        monkeypatch.setattr("time.sleep",
-                            lambda x: rewrite(x, limit))
-        limit.last_request = time() + 60
-        limit.requests = 50
+        assert limit.available() == 49
+        assert clock[0] == 1000
+
+    def test_try_acquire(self, clock):
+        limit = ns.Limiter(limit=2)
+        assert limit.try_acquire()
+        assert limit.try_acquire()
+        assert not limit.try_acquire()
+        assert limit.available() == 0
+
+    def test_exact_wait(self, clock):
+        limit = ns.Limiter(limit=2, window=30)
         limit.check()
-        assert limit.requests == 1
-
-    def test_toosoon_after50tg(self, monkeypatch):
-        def rewrite(x, y):
-            y.last_request = 0
-            return x
-        limit = ns.Limiter()
-        monkeypatch.setattr("time.sleep",
-                            lambda x: rewrite(x, limit))
-        limit.last_request = time() + 60
-        limit.requests = 49
-        limit.tg_requests = 1
+        clock[0] += 10
         limit.check()
-        assert limit.requests == 1
+        assert limit.wait_time() == 20
+        limit.check()
+        assert clock[0] == 1030
 
-    def test_check_tg(self):
+    def test_window_slides(self, clock):
+        limit = ns.Limiter(limit=2, window=30)
+        limit.check()
+        clock[0] += 31
+        assert limit.available() == 2
+        assert limit.try_acquire()
+
+    def test_reserve(self, clock):
+        limit = ns.Limiter(limit=2, window=30)
+        assert limit.reserve() == 0
+        assert limit.reserve() == 0
+        assert limit.reserve() == 30
+        assert limit.reserve() == 30
+        assert limit.reserve() == 60
+
+    def test_reserve_blocks_try_acquire(self, clock):
+        limit = ns.Limiter(limit=1, window=30)
+        assert limit.reserve() == 0
+        assert not limit.try_acquire()
+        clock[0] += 30
+        assert limit.try_acquire()
+
+    def test_check_tg(self, clock):
         limit = ns.Limiter()
         limit.check_tg()
-        assert limit.tg_requests == 1
-        assert limit.requests == 0
-        assert bool(limit.last_tg_request)
+        assert limit.available() == 49
+        assert limit.wait_time_tg() == 180
+        assert limit.wait_time() == 0
 
-    def test_after50_tg(self):
+    def test_tg_waits(self, clock):
         limit = ns.Limiter()
-        limit.requests = 50
         limit.check_tg()
-        assert limit.tg_requests == 1
-        assert limit.requests == 50
-
-    def test_after50tg_tg(self):
-        limit = ns.Limiter()
-        limit.requests = 49
-        limit.tg_requests = 1
         limit.check_tg()
-        assert limit.requests == 49
-        assert limit.tg_requests == 2
+        assert clock[0] == 1180
 
-    def test_toosoon_tg(self, monkeypatch):
-        limit = ns.Limiter()
-        def rewrite(x):
-            limit.last_tg_request = 0
-            limit.tg_requests = 0
-            limit.requests = 0
-            return x
-        monkeypatch.setattr("time.sleep",
-                            lambda x: rewrite(x))
-        limit.last_tg_request = time() + 180
+    def test_tg_waits_for_api(self, clock):
+        limit = ns.Limiter(limit=1, window=30)
+        limit.check()
+        assert not limit.try_acquire_tg()
         limit.check_tg()
-        assert limit.tg_requests == 1
+        assert clock[0] == 1030
 
-    def test_toosoon_after50_tg(self, monkeypatch):
-        limit = ns.Limiter()
-        def rewrite(x):
-            limit.last_tg_request = 0
-            limit.tg_requests = 0
-            limit.requests = 0
-            return x
-        monkeypatch.setattr("time.sleep",
-                            lambda x: rewrite(x))
-        limit.last_request = time() + 180
-        limit.requests = 50
+    def test_tg_not_starved(self, clock):
+        limit = ns.Limiter(limit=2, window=30)
+        limit.check()
+        limit.check()
+        # Requests reserved after the telegram don't take its slot.
+        assert limit.reserve_tg() == 30
+        assert limit.reserve() == 30
+        assert limit.reserve() == 60
+        assert limit.wait_time_tg() == 210
+
+    def test_no_sleep_under_lock(self, clock, monkeypatch):
+        limit = ns.Limiter(limit=1)
+
+        def sleep(seconds):
+            assert not limit._lock.locked()
+            clock[0] += seconds
+        monkeypatch.setattr('time.sleep', sleep)
+        limit.check()
+        limit.check()
         limit.check_tg()
-        assert limit.tg_requests == 1
 
-    def test_toosoon_after50tg_tg(self, monkeypatch):
+
+class TestScheduler:
+    """ Tests the ns.py Scheduler Logic. """
+
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('time.monotonic', lambda: now[0])
+        return now
+
+    def test_default_priority(self):
+        scheduler = ns.Scheduler(ns.Limiter())
+        assert scheduler.current_priority() == ns.INTERACTIVE
+        with scheduler.priority(ns.BACKGROUND):
+            assert scheduler.current_priority() == ns.BACKGROUND
+        assert scheduler.current_priority() == ns.INTERACTIVE
+
+    def test_check(self, clock):
         limit = ns.Limiter()
-        def rewrite(x):
-            limit.last_tg_request = 0
-            limit.tg_requests = 0
-            limit.requests = 0
-            return x
-        monkeypatch.setattr("time.sleep",
-                            lambda x: rewrite(x))
-        limit.last_tg_request = time() + 180
-        limit.tg_requests = 1
-        limit.check_tg()
-        assert limit.tg_requests == 1
+        scheduler = ns.Scheduler(limit)
+        scheduler.check()
+        with scheduler.priority(ns.BACKGROUND):
+            scheduler.check()
+        stats = scheduler.stats()
+        assert stats[ns.INTERACTIVE]['requests'] == 1
+        assert stats[ns.BACKGROUND]['requests'] == 1
+        assert stats[ns.TELEGRAM]['requests'] == 0
+        assert limit.available() == 48
+
+    def test_reserved(self, clock):
+        limit = ns.Limiter(limit=4)
+        scheduler = ns.Scheduler(limit, {ns.TELEGRAM: 1, ns.INTERACTIVE: 1})
+        with scheduler.priority(ns.BACKGROUND):
+            scheduler.check()
+            scheduler.check()
+        assert scheduler._try_acquire(ns.BACKGROUND, False) == 30
+        assert scheduler._try_acquire(ns.INTERACTIVE, False) == 0
+        assert scheduler._try_acquire(ns.INTERACTIVE, False) == 30
+        assert scheduler._try_acquire(ns.TELEGRAM, True) == 0
+
+    def test_priority_order(self):
+        limit = ns.Limiter(limit=1, window=0.2)
+        scheduler = ns.Scheduler(limit, {})
+        order = []
+        scheduler.check()
+
+        def request(priority):
+            with scheduler.priority(priority):
+                scheduler.check()
+            order.append(priority)
+
+        background = threading.Thread(target=request, args=[ns.BACKGROUND])
+        background.start()
+        while not scheduler.stats()[ns.BACKGROUND]['waiting']:
+            time_module.sleep(0.001)
+        # The background request is at the head, so hold it back until
+        # the interactive request is queued too.
+        with scheduler._cond:
+            interactive = threading.Thread(target=request,
+                                           args=[ns.INTERACTIVE])
+            interactive.start()
+            while not scheduler._stats[ns.INTERACTIVE]['waiting']:
+                scheduler._cond.wait(0.001)
+        background.join()
+        interactive.join()
+        assert order == [ns.INTERACTIVE, ns.BACKGROUND]
+
+    def test_stats(self):
+        scheduler = ns.Scheduler(ns.Limiter())
+        scheduler.check_tg()
+        stats = scheduler.stats()[ns.TELEGRAM]
+        assert stats['requests'] == 1
+        assert stats['waiting'] == 0
+        assert stats['max_wait'] >= stats['mean_wait'] >= 0
+
+
+class MockResponse:
+    def __init__(self, body, status=200, will_close=False):
+        self.body = body
+        self.status = status
+        self.reason = 'OK' if status < 400 else 'Not Found'
+        self.msg = {}
+        self.will_close = will_close
+
+    def read(self):
+        return self.body
 
 
+class MockConnection:
+    """ Stands in for http.client.HTTPSConnection. """
+    created = []
 
-class MockRequest:
-    rval = None
-    def __init__(self, rval):
-        self.rval = rval
+    def __init__(self, host, timeout=None):
+        self.host = host
+        self.requests = []
+        self.closed = False
+        self.fail = False
+        self.response = MockResponse(REQUEST_XML.encode('utf-8'))
+        MockConnection.created.append(self)
 
-    def __enter__(self, *args, **kwargs):
-        return self
+    def request(self, method, path, headers=None):
+        if self.fail:
+            raise ConnectionResetError
+        self.requests.append((method, path, headers))
 
-    def __exit__(self, *args, **kwargs):
-        pass
+    def getresponse(self):
+        return self.response
 
-    def read(self):
-        return self.rval
+    def close(self):
+        self.closed = True
 
 REQUEST_XML = "<NATION>test</NATION>"
 REQUEST_XML_ALT = "<REGION>test</REGION>"
@@ -163,6 +250,10 @@ NESTED_XML = "<NATION><NAME>test</NAME></NATION>"
 NESTED_PARSED = {'nation':{'name':'test'}}
 COMPLEX_XML = "<ROOT><NATION>test</NATION><REGION><NAME>test</NAME></REGION></ROOT>"
 COMPLEX_PARSED = {'root':{'nation':'test', 'region':{'name':'test'}}}
+REPEATED_XML = ("<HAPPENINGS><EVENT><TEXT>a</TEXT></EVENT>"
+                "<EVENT><TEXT>b</TEXT></EVENT><EVENT>c</EVENT></HAPPENINGS>")
+REPEATED_PARSED = {'happenings': {'event': [{'text': 'a'}, {'text': 'b'},
+                                            'c']}}
 FOUNDING_XML = ("<WORLD><HAPPENINGS><EVENT>"
                 "<TIMESTAMP>0</TIMESTAMP>"
                 "<TEXT>@@test@@ in %%test%%</TEXT>"
@@ -171,6 +262,238 @@ FOUNDING_PARSED = [{'name':'test',
                     'founding_region':'test',
                     'founded_at':'0'}]
 
+class TestConnectionPool:
+    """ Tests the ns.py ConnectionPool Logic. """
+
+    @pytest.fixture(autouse=True)
+    def mock_connection(self, monkeypatch):
+        MockConnection.created = []
+        monkeypatch.setattr('http.client.HTTPSConnection', MockConnection)
+
+    def test_request(self):
+        pool = ns.ConnectionPool()
+        data = pool.request('https://www.nationstates.net/cgi-bin/'
+                            'api.cgi?nation=test', {'User-Agent': 'test'})
+        assert data == REQUEST_XML.encode('utf-8')
+        assert MockConnection.created[0].requests == [
+            ('GET', '/cgi-bin/api.cgi?nation=test', {'User-Agent': 'test'})]
+
+    def test_reuse(self):
+        pool = ns.ConnectionPool()
+        pool.request('https://www.nationstates.net/a')
+        pool.request('https://www.nationstates.net/b')
+        assert len(MockConnection.created) == 1
+        assert pool.stats()['handshakes'] == 1
+        assert pool.stats()['reuses'] == 1
+
+    def test_will_close(self):
+        pool = ns.ConnectionPool()
+        pool.request('https://www.nationstates.net/a')
+        MockConnection.created[0].response.will_close = True
+        pool.request('https://www.nationstates.net/b')
+        assert MockConnection.created[0].closed
+        assert pool.stats()['idle'] == 0
+
+    def test_idle_timeout(self, monkeypatch):
+        pool = ns.ConnectionPool(idle_timeout=10)
+        pool.request('https://www.nationstates.net/a')
+        now = time_module.monotonic()
+        monkeypatch.setattr('time.monotonic', lambda: now + 60)
+        pool.request('https://www.nationstates.net/b')
+        assert MockConnection.created[0].closed
+        assert pool.stats()['handshakes'] == 2
+
+    def test_size(self):
+        pool = ns.ConnectionPool(size=1)
+        first = pool._acquire()[0]
+        second = pool._acquire()[0]
+        pool._release(first)
+        pool._release(second)
+        assert pool.stats()['idle'] == 1
+        assert second.closed
+
+    def test_stale_reconnect(self):
+        pool = ns.ConnectionPool()
+        pool.request('https://www.nationstates.net/a')
+        MockConnection.created[0].fail = True
+        data = pool.request('https://www.nationstates.net/b')
+        assert data == REQUEST_XML.encode('utf-8')
+        assert MockConnection.created[0].closed
+        assert pool.stats()['reconnects'] == 1
+        assert pool.stats()['handshakes'] == 2
+
+    def test_fresh_failure(self, monkeypatch):
+        def request(self, *args, **kwargs):
+            raise ConnectionResetError
+        monkeypatch.setattr(MockConnection, 'request', request)
+        with pytest.raises(ConnectionResetError):
+            ns.ConnectionPool().request('https://www.nationstates.net/a')
+
+    def test_http_error(self):
+        pool = ns.ConnectionPool()
+        pool.request('https://www.nationstates.net/a')
+        MockConnection.created[0].response = MockResponse(b'', status=404)
+        with pytest.raises(urllib.error.HTTPError) as ex:
+            pool.request('https://www.nationstates.net/b')
+        assert ex.value.code == 404
+        assert pool.stats()['idle'] == 1
+
+    def test_close(self):
+        pool = ns.ConnectionPool()
+        pool.request('https://www.nationstates.net/a')
+        pool.close()
+        assert MockConnection.created[0].closed
+        assert pool.stats()['idle'] == 0
+
+
+class TestCache:
+    """ Tests the ns.py Cache Logic. """
+
+    @pytest.fixture()
+    def clock(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('time.monotonic', lambda: now[0])
+        return now
+
+    def test_normalize_name(self):
+        assert ns.normalize_name(" Some Nation ") == "some_nation"
+
+    def test_get_put(self, clock):
+        cache = ns.Cache()
+        assert cache.get('nation', 'a') == (False, None)
+        cache.put('nation', 'a', {'name': 'a'})
+        assert cache.get('nation', 'a') == (True, {'name': 'a'})
+        assert cache.get('nation', 'a', 'other') == (False, None)
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 2
+
+    def test_ttl(self, clock):
+        cache = ns.Cache(ttls={'recruitable': 10})
+        cache.put('recruitable', 'a', True)
+        clock[0] += 9
+        assert cache.get('recruitable', 'a') == (True, True)
+        clock[0] += 1
+        assert cache.get('recruitable', 'a') == (False, None)
+        assert cache.stats()['size'] == 0
+
+    def test_lru(self, clock):
+        cache = ns.Cache(size=2)
+        cache.put('nation', 'a', 1)
+        cache.put('nation', 'b', 2)
+        cache.get('nation', 'a')
+        cache.put('nation', 'c', 3)
+        assert cache.get('nation', 'b') == (False, None)
+        assert cache.get('nation', 'a') == (True, 1)
+        assert cache.stats()['evictions'] == 1
+
+    def test_missing(self, clock):
+        cache = ns.Cache()
+        cache.put('nation', 'a', 1)
+        cache.put_missing('a', 'url')
+        with pytest.raises(urllib.error.HTTPError) as ex:
+            cache.get('nation', 'a')
+        assert ex.value.code == 404
+
+    def test_invalidate(self, clock):
+        cache = ns.Cache()
+        cache.put('nation', 'a_b', 1)
+        cache.put('recruitable', 'a_b', True)
+        cache.put('nation', 'c', 3)
+        cache.invalidate('A B')
+        assert cache.get('nation', 'a_b') == (False, None)
+        assert cache.get('recruitable', 'a_b') == (False, None)
+        assert cache.get('nation', 'c') == (True, 3)
+        cache.invalidate()
+        assert cache.stats()['size'] == 0
+
+
+class TestSingleFlight:
+    """ Tests the ns.py SingleFlight Logic. """
+
+    def test_do(self):
+        flights = ns.SingleFlight()
+        assert flights.do('a', lambda: 1) == 1
+        assert flights.do('a', lambda: 2) == 2
+        assert flights.stats() == {'saved': 0, 'in_flight': 0}
+
+    def test_coalesce(self):
+        flights = ns.SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            release.wait()
+            return {'name': 'a'}
+
+        def request():
+            results.append(flights.do('a', fetch))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flights.stats()['saved'] < 4:
+            time_module.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert calls == [1]
+        assert results == [{'name': 'a'}] * 5
+        assert flights.stats() == {'saved': 4, 'in_flight': 0}
+
+    def test_error_shared(self):
+        flights = ns.SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def fetch():
+            release.wait()
+            raise ValueError
+
+        def request():
+            try:
+                flights.do('a', fetch)
+            except ValueError as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=request) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while flights.stats()['saved'] < 1:
+            time_module.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(errors) == 2
+
+    def test_ns_coalesces(self, monkeypatch):
+        monkeypatch.setattr('ellis.config.Config',
+                            {'Core': {'NS_Nation': 'Test',
+                                      'NS_Region': 'Test'}})
+        release = threading.Event()
+        urls = []
+
+        def send(self, url):
+            urls.append(url)
+            release.wait()
+            return "<NATION><NAME>a</NAME></NATION>"
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nationstates = ns.NS(ns.Limiter(), cache=ns.Cache(),
+                             flights=ns.SingleFlight())
+        threads = [threading.Thread(target=nationstates.get_nation,
+                                    args=[name])
+                   for name in ("A", "a")]
+        for thread in threads:
+            thread.start()
+        while nationstates.flights.stats()['saved'] < 1:
+            time_module.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(urls) == 1
+
+
 class TestNS:
     """ Tests the ns.py NS Class Logic. """
 
@@ -178,16 +501,16 @@ class TestNS:
     def mock_request(self, monkeypatch):
         i = REQUEST_XML.encode('utf-8')
         def patch(*args, **kwargs):
-            return MockRequest(i)
-        monkeypatch.setattr('urllib.request.urlopen',
+            return i
+        monkeypatch.setattr('ellis.ns.ConnectionPool.request',
                             patch)
 
     @pytest.fixture()
     def mock_request_alt(self, monkeypatch):
         i = REQUEST_XML_ALT.encode('utf-8')
         def patch(*args, **kwargs):
-            return MockRequest(i)
-        monkeypatch.setattr('urllib.request.urlopen',
+            return i
+        monkeypatch.setattr('ellis.ns.ConnectionPool.request',
                             patch)
 
     @pytest.fixture(autouse=True)
@@ -228,6 +551,59 @@ class TestNS:
         parsed = nationstates._parse_element(etree)
         assert parsed == expected
 
+    @pytest.mark.parametrize("test_input,expected",
+                             [(SIMPLE_XML, SIMPLE_PARSED),
+                              (NESTED_XML, NESTED_PARSED),
+                              (COMPLEX_XML, COMPLEX_PARSED),
+                              (REPEATED_XML, REPEATED_PARSED)])
+    def test_parse_xml(self, test_input, expected):
+        assert ns.parse_xml(test_input) == expected
+        assert ns.parse_xml(test_input.encode('utf-8')) == expected
+
+    def test_parse_element_repeated(self):
+        nationstates = ns.NS(ns.Limiter())
+        etree = ElementTree.fromstring(REPEATED_XML)
+        assert nationstates._parse_element(etree) == REPEATED_PARSED
+
+    def test_parse_xml_fields(self):
+        xml = "<NATION><NAME>a</NAME><REGION>b</REGION><FLAG>c</FLAG></NATION>"
+        assert ns.parse_xml(xml, ['name']) == {'nation': {'name': 'a'}}
+        assert ns.parse_xml(xml, ['region', 'name']) == \
+            {'nation': {'name': 'a', 'region': 'b'}}
+        assert ns.parse_xml(xml, ['missing']) == \
+            {'nation': {'name': 'a', 'region': 'b', 'flag': 'c'}}
+
+    def test_get_nation_fields(self, monkeypatch):
+        monkeypatch.setattr('ellis.ns.NS._send_request',
+                            lambda x, y: COMPLEX_XML)
+        nationstates = ns.NS(ns.Limiter())
+        assert nationstates.get_nation("test", fields=['nation']) == \
+            {'root': {'nation': 'test'}}
+
+    def test_foundings_many(self, monkeypatch):
+        monkeypatch.setattr('ellis.ns.NS._send_request',
+                            lambda x, y: FOUNDING_XML.replace(
+                                "<HAPPENINGS>", "<HAPPENINGS>" + (
+                                    "<EVENT><TIMESTAMP>1</TIMESTAMP>"
+                                    "<TEXT>@@new@@ in %%here%%</TEXT>"
+                                    "</EVENT>")))
+        nationstates = ns.NS(ns.Limiter())
+        foundings = nationstates.get_foundings()
+        assert foundings == [{'name': 'new',
+                              'founding_region': 'here',
+                              'founded_at': '1'}] + FOUNDING_PARSED
+
+    def test_foundings_since(self, monkeypatch):
+        urls = []
+        def send(self, url):
+            urls.append(url)
+            return FOUNDING_XML.replace("<EVENT>", '<EVENT id="12">')
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nationstates = ns.NS(ns.Limiter())
+        foundings = nationstates.get_foundings(since_id=10)
+        assert foundings == [dict(FOUNDING_PARSED[0], event_id=12)]
+        assert urls[0].endswith('happenings;filter=founding;sinceid=10')
+
     def test_foundings(self, monkeypatch):
         monkeypatch.setattr('ellis.ns.NS._send_request',
                             lambda x, y: FOUNDING_XML)
@@ -235,39 +611,104 @@ class TestNS:
         foundings = nationstates.get_foundings()
         assert foundings == FOUNDING_PARSED
 
+    @pytest.fixture()
+    def mock_recruitable(self, monkeypatch):
+        sent = {'urls': [], 'can_recruit': '1'}
+        def patch(self, url, *args, **kwargs):
+            sent['urls'].append(url)
+            return ("<NATION><TGCANRECRUIT>{}</TGCANRECRUIT></NATION>"
+                    ).format(sent['can_recruit']).encode('utf-8')
+        monkeypatch.setattr('ellis.ns.ConnectionPool.request', patch)
+        return sent
+
     @pytest.mark.parametrize("test_input, expected",
-                             [({'nation':{'tgcanrecruit':'0'}}, False),
-                              ({'nation':{'tgcanrecruit':'1'}}, True)])
-    def test_get_nation_recruitable(self, mock_request, monkeypatch, test_input, expected):
-        monkeypatch.setattr('xml.etree.ElementTree.fromstring',
-                            lambda x: test_input)
-        monkeypatch.setattr('ellis.ns.NS._parse_element',
-                            lambda x, y: y)
+                             [('0', False),
+                              ('1', True)])
+    def test_get_nation_recruitable(self, mock_recruitable, monkeypatch, test_input, expected):
+        mock_recruitable['can_recruit'] = test_input
         nationstates = ns.NS(ns.Limiter())
         recruitable = nationstates.get_nation_recruitable("test")
         assert recruitable is expected
+        assert mock_recruitable['urls'][0].endswith('nation=test&q=tgcanrecruit')
 
     @pytest.mark.parametrize("test_input, expected",
-                             [({'nation':{'tgcanrecruit':'0'}}, False),
-                              ({'nation':{'tgcanrecruit':'1'}}, True)])
-    def test_get_nation_recruitable_region(self, mock_request, monkeypatch, test_input, expected):
-        monkeypatch.setattr('xml.etree.ElementTree.fromstring',
-                            lambda x: test_input)
-        monkeypatch.setattr('ellis.ns.NS._parse_element',
-                            lambda x, y: y)
+                             [('0', False),
+                              ('1', True)])
+    def test_get_nation_recruitable_region(self, mock_recruitable, monkeypatch, test_input, expected):
+        mock_recruitable['can_recruit'] = test_input
         nationstates = ns.NS(ns.Limiter())
         recruitable = nationstates.get_nation_recruitable("test", region="test")
         assert recruitable is expected
+        assert mock_recruitable['urls'][0].endswith('&q=tgcanrecruit;region=test')
 
-    def test_get_nation_recruitable_bad(self, mock_request, monkeypatch):
-        monkeypatch.setattr('xml.etree.ElementTree.fromstring',
-                            lambda x: {'nation':{'tgcanrecruit':'3'}})
-        monkeypatch.setattr('ellis.ns.NS._parse_element',
-                            lambda x, y: y)
+    def test_get_nation_recruitable_bad(self, mock_recruitable, monkeypatch):
+        mock_recruitable['can_recruit'] = '3'
         nationstates = ns.NS(ns.Limiter())
         with pytest.raises(SyntaxError):
             recruitable = nationstates.get_nation_recruitable("test")
 
+    def test_get_nation_shards(self, monkeypatch):
+        urls = []
+        def send(self, url):
+            urls.append(url)
+            return "<NATION><NAME>a</NAME><REGION>b</REGION></NATION>"
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nation = ns.NS(ns.Limiter()).get_nation("a b",
+                                                shards=['name', 'region'])
+        assert nation == {'name': 'a', 'region': 'b'}
+        assert urls[0].endswith('nation=a_b&q=name+region')
+
+    @pytest.mark.parametrize("region, expected",
+                             [(None, 'a_b&q=name+tgcanrecruit'),
+                              ('c', 'a_b&q=name+tgcanrecruit;region=c')])
+    def test_get_nation_and_recruitable(self, monkeypatch, region, expected):
+        urls = []
+        def send(self, url):
+            urls.append(url)
+            return ("<NATION><NAME>a</NAME>"
+                    "<TGCANRECRUIT>1</TGCANRECRUIT></NATION>")
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nationstates = ns.NS(ns.Limiter())
+        nation, recruitable = nationstates.get_nation_and_recruitable(
+            "a b", ['name', 'tgcanrecruit'], region)
+        assert nation == {'name': 'a'}
+        assert recruitable is True
+        assert urls == [nationstates.ns_nation_url + expected]
+
+    def test_get_nation_cached(self, monkeypatch):
+        urls = []
+        def send(self, url):
+            urls.append(url)
+            return ("<NATION><NAME>a</NAME>"
+                    "<TGCANRECRUIT>1</TGCANRECRUIT></NATION>")
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nationstates = ns.NS(ns.Limiter(), cache=ns.Cache())
+        nationstates.get_nation_and_recruitable("A", ['name'])
+        assert nationstates.get_nation("a", shards=['name']) == \
+            {'name': 'a'}
+        assert nationstates.get_nation_recruitable("a") is True
+        nationstates.get_nation("a", shards=['name'])['name'] = 'b'
+        assert nationstates.get_nation_and_recruitable("a", ['name']) == \
+            ({'name': 'a'}, True)
+        assert len(urls) == 1
+        nationstates.cache.invalidate("a")
+        nationstates.get_nation_recruitable("a")
+        assert len(urls) == 2
+
+    def test_get_nation_missing(self, monkeypatch):
+        urls = []
+        def send(self, url):
+            urls.append(url)
+            raise urllib.error.HTTPError(url, 404, 'Not Found', None, None)
+        monkeypatch.setattr('ellis.ns.NS._send_request', send)
+        nationstates = ns.NS(ns.Limiter(), cache=ns.Cache())
+        for _ in range(2):
+            with pytest.raises(urllib.error.HTTPError):
+                nationstates.get_nation("a")
+            with pytest.raises(urllib.error.HTTPError):
+                nationstates.get_nation_and_recruitable("a", ['name'])
+        assert len(urls) == 1
+
     def test_get_nation_XML(self, mock_request):
         assert ns.NS(ns.Limiter()).get_nation_xml("test") == REQUEST_XML
 
@@ -286,8 +727,8 @@ class TestNsTg:
     def mock_request(self, monkeypatch,):
         i = REQUEST_XML.encode('utf-8')
         def patch(*args, **kwargs):
-            return MockRequest(i)
-        monkeypatch.setattr('urllib.request.urlopen',
+            return i
+        monkeypatch.setattr('ellis.ns.ConnectionPool.request',
                             patch)
 
     @pytest.fixture(autouse=True)
@@ -0,0 +1,148 @@
+""" This tests the pool of nations Ellis tracks. """
+
+import pytest
+
+from ellis import pool, recruited
+
+
+@pytest.fixture()
+def nations():
+    return pool.NationPool([{'name': 'Old'}, {'name': 'New'}],
+                           [{'name': 'Rented'}],
+                           [{'name': 'Recruited'}])
+
+
+def test_creation(nations):
+    assert len(nations) == 4
+    assert nations.stats() == {'available': 2, 'rented': 1, 'recruited': 1,
+                               'expired': 0}
+    assert nations.state('old') == pool.AVAILABLE
+    assert nations.state('Rented') == pool.RENTED
+    assert nations.state({'name': 'recruited'}) == pool.RECRUITED
+
+
+def test_creation_duplicates():
+    nations = pool.NationPool([{'name': 'a'}, {'name': 'A'}, {'name': 'b'}],
+                              [{'name': 'b'}], [{'name': 'A'}])
+    assert nations.stats() == {'available': 0, 'rented': 1, 'recruited': 1,
+                               'expired': 0}
+
+
+def test_contains(nations):
+    assert 'OLD' in nations
+    assert {'name': 'rented'} in nations
+    assert 'Unknown' not in nations
+
+
+def test_add(nations):
+    assert nations.add({'name': 'A Nation'})
+    assert not nations.add({'name': 'a_nation'})
+    assert not nations.add({'name': 'Recruited'})
+    assert nations.state('a nation') == pool.AVAILABLE
+    assert nations.extend([{'name': 'x'}, {'name': 'X'}, {'name': 'old'}]) \
+        == [{'name': 'x'}]
+
+
+def test_checkout(nations):
+    assert nations.checkout() == {'name': 'New'}
+    assert nations.checkout() == {'name': 'Old'}
+    assert nations.count(pool.RENTED) == 3
+    with pytest.raises(KeyError):
+        nations.checkout()
+
+
+def test_release(nations):
+    nations.release({'name': 'rented'})
+    assert nations.nations() == [{'name': 'Old'}, {'name': 'New'},
+                                 {'name': 'Rented'}]
+    assert nations.checkout() == {'name': 'Rented'}
+    with pytest.raises(KeyError):
+        nations.release('Old')
+    with pytest.raises(KeyError):
+        nations.release('Unknown')
+
+
+def test_recruit(nations):
+    assert nations.recruit('old') == {'name': 'Old'}
+    assert nations.state('old') == pool.RECRUITED
+    assert nations.stats() == {'available': 1, 'rented': 1, 'recruited': 2,
+                               'expired': 0}
+    # Only the names of recruited nations are kept.
+    with pytest.raises(KeyError):
+        nations.get('old')
+    assert nations.nations(pool.RECRUITED) == []
+    assert nations.recruit('old') == {'name': 'old'}
+    with pytest.raises(KeyError):
+        nations.release('old')
+    with pytest.raises(KeyError):
+        nations.move('old', pool.AVAILABLE)
+
+
+def test_recruit_archived(nations, tmp_path):
+    nations.archive = recruited.RecruitedArchive(
+        (tmp_path / "archive.gz").as_posix())
+    nations.recruit('old')
+    nations.drop([{'name': 'new'}, {'name': 'rented'}])
+    nations.close()
+    assert list(nations.archive.read()) == [{'name': 'Old'}, {'name': 'New'}]
+
+
+def test_known(nations):
+    assert nations.known(['OLD', 'recruited', 'unknown', 'Rented']) == {
+        'old', 'recruited', 'rented'}
+
+
+def test_many():
+    nations = pool.NationPool({'name': str(i)} for i in range(200000))
+    for i in range(0, 200000, 2):
+        nations.recruit(str(i))
+    assert nations.stats()['available'] == 100000
+    assert nations.checkout() == {'name': '199999'}
+
+
+def test_checkout_newest_founded():
+    nations = pool.NationPool([{'name': 'a', 'founded_at': '30'},
+                               {'name': 'b', 'founded_at': '10'},
+                               {'name': 'c', 'founded_at': '20'}])
+    assert [nations.checkout()['name'] for _ in range(3)] == ['a', 'c', 'b']
+
+
+def test_release_keeps_order():
+    nations = pool.NationPool([{'name': 'a', 'founded_at': 30},
+                               {'name': 'b', 'founded_at': 10}])
+    nations.checkout()
+    nations.release('a')
+    assert nations.checkout()['name'] == 'a'
+
+
+def test_expire():
+    nations = pool.NationPool([{'name': str(i), 'founded_at': i}
+                               for i in range(10)], max_age=5)
+    nations.checkout()
+    assert nations.expire(now=10) == [{'name': str(i), 'founded_at': i}
+                                      for i in range(5)]
+    assert nations.state('0') == pool.RECRUITED
+    assert nations.state('9') == pool.RENTED
+    assert nations.stats() == {'available': 4, 'rented': 1, 'recruited': 5,
+                               'expired': 5}
+    assert nations.expire(now=10) == []
+    assert pool.NationPool([{'name': 'a', 'founded_at': 0}]).expire() == []
+
+
+def test_compaction():
+    nations = pool.NationPool([{'name': str(i), 'founded_at': i}
+                               for i in range(1000)], max_age=500)
+    for i in range(0, 1000, 3):
+        nations.recruit(str(i))
+    for _ in range(100):
+        nations.release(nations.checkout())
+    assert len(nations._newest) <= 2 * nations.count() + 64
+    assert nations.checkout()['name'] == '998'
+    assert len(nations.expire(now=1000)) == 333
+
+
+def test_drop(nations):
+    assert nations.drop([{'name': 'old'}, {'name': 'Rented'},
+                         {'name': 'Unknown'}]) == [{'name': 'Old'}]
+    assert nations.state('Old') == pool.RECRUITED
+    assert nations.state('Rented') == pool.RENTED
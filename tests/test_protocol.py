@@ -0,0 +1,208 @@
+""" This tests the framing of the Ellis Protocol. """
+
+import json
+import socket
+import struct
+
+import pytest
+
+from ellis import protocol
+
+
+def test_encode():
+    assert protocol.encode('GET', protocol.LINE) == b'GET\n'
+    assert protocol.encode(b'GET', protocol.LENGTH) == b'\0\0\0\3GET'
+    assert protocol.encode('GET', protocol.LEGACY) == b'GET'
+    with pytest.raises(protocol.ProtocolError):
+        protocol.encode('GET\nGET', protocol.LINE)
+
+
+@pytest.mark.parametrize('message, framing, encoding', [
+    ('PROTOCOL 2 LINE', protocol.LINE, protocol.JSON),
+    ('protocol 2 length', protocol.LENGTH, protocol.JSON),
+    ('PROTOCOL 2 LENGTH json', protocol.LENGTH, protocol.JSON),
+    ('PROTOCOL 2 LENGTH MSGPACK', protocol.LENGTH, protocol.MSGPACK)])
+def test_parse_negotiation(message, framing, encoding):
+    assert protocol.is_negotiation(message)
+    assert protocol.parse_negotiation(message) == (framing, encoding)
+
+
+@pytest.mark.parametrize('message', [
+    'PROTOCOL 3 LINE', 'PROTOCOL 2 SMOKE', 'PROTOCOL two LINE', 'PROTOCOL',
+    'PROTOCOL 2 LINE MSGPACK', 'PROTOCOL 2 LENGTH XML',
+    'PROTOCOL 2 LENGTH MSGPACK EXTRA'])
+def test_parse_negotiation_bad(message):
+    with pytest.raises(protocol.ProtocolError):
+        protocol.parse_negotiation(message)
+
+
+def test_decode_lines():
+    decoder = protocol.Decoder(protocol.LINE)
+    decoder.feed(b'GET\r\nCHECK pot')
+    assert list(decoder.messages()) == [b'GET']
+    decoder.feed(b'ato\nEND\n')
+    assert list(decoder.messages()) == [b'CHECK potato', b'END']
+    assert not decoder
+
+
+def test_decode_lengths():
+    decoder = protocol.Decoder(protocol.LENGTH)
+    big = json.dumps({'name': 'x' * 10000}).encode('utf-8')
+    framed = protocol.encode(big, protocol.LENGTH) + b'\0\0\0\3GET'
+    for i in range(0, len(framed), 1000):
+        decoder.feed(framed[i:i + 1000])
+        if i + 1000 < len(big):
+            assert not list(decoder.messages())
+    assert list(decoder.messages()) == [big, b'GET']
+
+
+def test_decode_too_long():
+    decoder = protocol.Decoder(protocol.LENGTH, max_message=10)
+    decoder.feed(struct.pack('>I', 11))
+    with pytest.raises(protocol.ProtocolError):
+        list(decoder.messages())
+    decoder = protocol.Decoder(protocol.LINE, max_message=10)
+    decoder.feed(b'x' * 11)
+    with pytest.raises(protocol.ProtocolError):
+        list(decoder.messages())
+
+
+def test_decode_negotiation():
+    decoder = protocol.Decoder()
+    decoder.feed(b'PROTOCOL 2 LENGTH')
+    assert not list(decoder.messages())
+    decoder.feed(b'\n\0\0\0\3GET\0\0\0\3END')
+    messages = decoder.messages()
+    assert next(messages) == b'PROTOCOL 2 LENGTH'
+    decoder.framing = protocol.LENGTH
+    assert list(messages) == [b'GET', b'END']
+
+
+def test_decode_legacy():
+    decoder = protocol.Decoder()
+    decoder.feed(b'RETURN {"name": "a"}GET')
+    assert list(decoder.messages()) == [b'RETURN {"name": "a"}GET']
+
+
+def test_recv_into_grows():
+    first, second = socket.socketpair()
+    with first, second:
+        decoder = protocol.Decoder(protocol.LINE, size=16)
+        message = b'y' * 5000
+        first.sendall(message + b'\n')
+        received = []
+        while not received:
+            assert decoder.recv_into(second)
+            received = list(decoder.messages())
+        assert received == [message]
+
+
+def test_connection():
+    first, second = socket.socketpair()
+    with first, second:
+        server = protocol.Decoder()
+        connection = protocol.Connection(first, protocol.LENGTH)
+        second.sendall(protocol.encode('{"protocol": 2}', protocol.LENGTH))
+        connection.negotiate()
+        connection.send('GET', 'END')
+        messages = []
+        while len(messages) < 3:
+            server.recv_into(second)
+            for message in server.messages():
+                messages.append(message)
+                server.framing = protocol.LENGTH
+        assert messages == [b'PROTOCOL 2 LENGTH', b'GET', b'END']
+        second.sendall(protocol.encode('{}', protocol.LENGTH)
+                       + protocol.encode('END', protocol.LENGTH))
+        assert connection.receive() == '{}'
+        assert connection.receive() == 'END'
+        second.close()
+        with pytest.raises(ConnectionResetError):
+            connection.receive()
+
+
+@pytest.mark.parametrize('framing', protocol.FRAMINGS)
+def test_connection_refused(framing):
+    first, second = socket.socketpair()
+    with first, second:
+        first.settimeout(5)
+        connection = protocol.Connection(first, framing)
+        # As a server that only speaks protocol 1 answers, unframed.
+        second.sendall(b'{"protocol": 1}')
+        with pytest.raises(protocol.ProtocolError):
+            connection.negotiate()
+
+
+def test_connection_line():
+    first, second = socket.socketpair()
+    with first, second:
+        first.settimeout(5)
+        connection = protocol.Connection(first, protocol.LINE)
+        second.sendall(b'{"protocol": 2, "framing": "LINE"}\n{}\nEND\n')
+        connection.negotiate()
+        assert connection.receive_value() == {}
+        assert connection.receive_value() == 'END'
+
+
+def test_encode_cache():
+    cache = protocol.EncodeCache(size=2)
+    nation = {'name': 'Potato', 'region': 'potato'}
+    assert cache.encode('potato', nation) == json.dumps(nation)
+    assert cache.encode('potato', nation) == json.dumps(nation)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    packed = cache.encode('potato', nation, protocol.MSGPACK)
+    assert protocol.loads(packed, protocol.MSGPACK) == nation
+    # A nation that changed since is encoded afresh.
+    nation['region'] = 'lands'
+    assert json.loads(cache.encode('potato', nation)) == nation
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'size': 2}
+    assert cache.encode_all(['a', 'b'], [{'name': 'a'}, {'name': 'b'}]) == \
+        json.dumps([{'name': 'a'}, {'name': 'b'}])
+    assert cache.stats()['size'] == 2
+
+
+def test_connection_msgpack():
+    first, second = socket.socketpair()
+    with first, second:
+        connection = protocol.Connection(first, protocol.LENGTH,
+                                         protocol.MSGPACK)
+        second.sendall(protocol.encode(protocol.dumps(
+            {'protocol': 2}, protocol.MSGPACK), protocol.LENGTH))
+        connection.negotiate()
+        assert second.recv(2048) == b'PROTOCOL 2 LENGTH MSGPACK\n'
+        second.sendall(protocol.encode(protocol.dumps(
+            [{'name': 'a'}], protocol.MSGPACK), protocol.LENGTH) +
+                       protocol.encode(protocol.end(protocol.MSGPACK),
+                                       protocol.LENGTH))
+        assert connection.receive_value() == [{'name': 'a'}]
+        assert connection.receive_value() == 'END'
+
+
+@pytest.mark.parametrize('argument, fields', [
+    ('', None), (' null', None), ('[]', ('name',)),
+    (' ["founded_at", "name"]', ('name', 'founded_at'))])
+def test_parse_fields(argument, fields):
+    assert protocol.parse_fields(argument) == fields
+
+
+@pytest.mark.parametrize('argument', ['name', '"name"', '[1]', '{}'])
+def test_parse_fields_bad(argument):
+    with pytest.raises(ValueError):
+        protocol.parse_fields(argument)
+
+
+def test_encode_cache_fields():
+    cache = protocol.EncodeCache()
+    nation = {'name': 'Potato', 'founded_at': 1, 'flag': 'x' * 4096}
+    fields = ('name', 'founded_at')
+    assert json.loads(cache.encode('potato', nation, fields=fields)) == {
+        'name': 'Potato', 'founded_at': 1}
+    # A change to a field that isn't sent doesn't spoil the cache.
+    nation['flag'] = 'y'
+    cache.encode('potato', nation, fields=fields)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    nation['founded_at'] = 2
+    assert json.loads(cache.encode('potato', nation, fields=fields)) == {
+        'name': 'Potato', 'founded_at': 2}
+    assert json.loads(cache.encode('potato', nation)) == nation
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'size': 2}
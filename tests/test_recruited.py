@@ -0,0 +1,90 @@
+""" This tests the recruited nations' index and archive. """
+
+import os
+
+import pytest
+
+from ellis import recruited
+
+
+@pytest.fixture()
+def path(tmp_path):
+    return (tmp_path / "recruited").as_posix()
+
+
+def test_index():
+    index = recruited.RecruitedIndex(['a', 'b', 'a'])
+    assert len(index) == 2
+    assert 'a' in index
+    assert 'c' not in index
+    index.add('c')
+    index.add('c')
+    index.add('a')
+    assert len(index) == 3
+    assert 'c' in index
+
+
+def test_index_merges():
+    index = recruited.RecruitedIndex()
+    names = [str(i) for i in range(5000)]
+    for name in names:
+        index.add(name)
+    assert len(index) == 5000
+    assert all(name in index for name in names)
+    assert not any(str(i) in index for i in range(5000, 6000))
+    # Most of them have been merged into the sorted array.
+    assert len(index._sorted) > 4000  # pylint: disable=protected-access
+    assert list(index._sorted) == sorted(index._sorted)  # pylint: disable=W0212
+
+
+def test_index_save_load(path):
+    index = recruited.RecruitedIndex(['a', 'b'])
+    index.add('c')
+    index.save(path)
+    assert os.path.getsize(path) == 3 * 8
+    loaded = recruited.RecruitedIndex.load(path)
+    assert len(loaded) == 3
+    assert 'c' in loaded
+    assert 'd' not in loaded
+
+
+def test_index_copy():
+    index = recruited.RecruitedIndex(['a'])
+    copy = index.copy()
+    index.add('b')
+    assert 'b' not in copy
+    assert 'a' in copy
+
+
+def test_archive(path):
+    archive = recruited.RecruitedArchive(path)
+    archive.write({'name': 'a'})
+    archive.close()
+    archive.write({'name': 'b'})
+    assert list(archive.read()) == [{'name': 'a'}, {'name': 'b'}]
+    archive.close()
+
+
+def test_archive_rotates(path):
+    archive = recruited.RecruitedArchive(path, max_bytes=40, keep=2)
+    for i in range(10):
+        archive.write({'name': str(i), 'region': 'somewhere'})
+    archive.close()
+    assert os.path.exists(path + '.1')
+    assert os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3')
+    # The oldest rotated archives are dropped.
+    assert [nation['name'] for nation in archive.read()] == [
+        '6', '7', '8', '9']
+
+
+def test_archive_rotates_after_restart(path):
+    archive = recruited.RecruitedArchive(path, max_bytes=60, keep=2)
+    archive.write({'name': '0', 'region': 'somewhere'})
+    archive.close()
+    archive = recruited.RecruitedArchive(path, max_bytes=60, keep=2)
+    archive.open()
+    archive.write({'name': '1', 'region': 'somewhere'})
+    archive.close()
+    assert os.path.exists(path + '.1')
+    assert [nation['name'] for nation in archive.read()] == ['0', '1']
@@ -0,0 +1,115 @@
+""" This tests the nation pool kept in SQLite. """
+
+import pytest
+
+from ellis import pool, sqlite_pool
+
+
+@pytest.fixture()
+def nations(tmp_path):
+    database = sqlite_pool.SQLitePool((tmp_path / "state.db").as_posix())
+    database.extend([{'name': 'Recruited'}], pool.RECRUITED)
+    database.extend([{'name': 'Rented'}], pool.RENTED)
+    database.extend([{'name': 'Old', 'founded_at': 1, 'region': 'The East'},
+                     {'name': 'New', 'founded_at': 2, 'region': 'the_east'}])
+    yield database
+    database.close()
+
+
+def test_wal(nations):
+    assert nations._query("PRAGMA journal_mode")[0][0] == 'wal'
+
+
+def test_creation(nations):
+    assert len(nations) == 4
+    assert nations.stats() == {'available': 2, 'rented': 1, 'recruited': 1,
+                               'expired': 0}
+    assert nations.state('old') == pool.AVAILABLE
+    assert 'RENTED' in nations
+    assert 'Unknown' not in nations
+    with pytest.raises(KeyError):
+        nations.state('Unknown')
+
+
+def test_extend(nations):
+    assert nations.extend([{'name': 'a'}, {'name': 'A'}, {'name': 'old'},
+                           {'name': 'b'}]) == [{'name': 'a'}, {'name': 'b'}]
+    assert not nations.add({'name': 'Recruited'})
+    assert nations.add({'name': 'c'}, pool.RECRUITED)
+    many = [{'name': str(i)} for i in range(1200)]
+    assert len(nations.extend(many + many)) == 1200
+
+
+def test_checkout(nations):
+    assert nations.checkout()['name'] == 'New'
+    assert nations.checkout()['name'] == 'Old'
+    with pytest.raises(KeyError):
+        nations.checkout()
+    assert nations.count(pool.RENTED) == 3
+
+
+def test_move(nations):
+    assert nations.release('rented') == {'name': 'Rented'}
+    with pytest.raises(KeyError):
+        nations.release('Old')
+    nations.recruit('old')
+    assert nations.get('old') == {'name': 'Old', 'founded_at': 1,
+                                  'region': 'The East'}
+    assert nations.drop([{'name': 'New'}, {'name': 'Recruited'}]) \
+        == [{'name': 'New'}]
+
+
+def test_count_region(nations):
+    nations.recruit('Old')
+    assert nations.count(pool.RECRUITED, region='the east') == 1
+    assert nations.count(pool.AVAILABLE, region='The East') == 1
+    assert nations.count(pool.RECRUITED, since=0) == 2
+    assert nations.count(pool.RECRUITED, since=2 ** 40) == 0
+
+
+def test_expire(nations):
+    nations.max_age = 10
+    assert [nation['name'] for nation in nations.expire(now=11.5)] == ['Old']
+    assert nations.stats()['expired'] == 1
+    assert nations.state('New') == pool.AVAILABLE
+
+
+def test_save(nations):
+    nation = nations.checkout()
+    nation['population'] = '5'
+    nations.save(nation)
+    assert nations.get('new')['population'] == '5'
+    nation['region'] = 'The Pacific'
+    nations.save(nation)
+    assert nations.count(pool.RENTED, region='the_pacific') == 1
+    nations.save({'name': 'New'})
+    assert nations.count(pool.RENTED, region='the_pacific') == 1
+    nations.release('new')
+    nations.save({'name': 'New', 'founded_at': '12'})
+    nations.max_age = 10
+    assert [nation['name'] for nation in nations.expire(now=21.5)] == [
+        'Old']
+
+
+def test_batch(nations):
+    with pytest.raises(RuntimeError):
+        with nations.batch():
+            nations.add({'name': 'a'})
+            with nations.batch():
+                nations.add({'name': 'b'})
+            raise RuntimeError()
+    assert 'a' not in nations and 'b' not in nations
+    with nations.batch():
+        nations.add({'name': 'a'})
+    assert 'a' in nations
+
+
+def test_reopen(tmp_path):
+    path = (tmp_path / "state.db").as_posix()
+    database = sqlite_pool.SQLitePool(path)
+    database.add({'name': 'a'})
+    database.checkout()
+    database.close()
+    database = sqlite_pool.SQLitePool(path)
+    assert database.state('a') == pool.RENTED
+    database.close()